@@ -0,0 +1,187 @@
+import argparse
+import itertools
+import json
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import requests
+from run_benchmarks import ROOT, FHIR_GENERATOR_DIR, extract_descriptions
+
+OLLAMA_URL = "http://localhost:11434"
+PERCENTILES = (50, 90, 99)
+PROMPT_TEMPLATE = (
+    "You are a clinical assistant. Summarize the following FHIR bundle in a few sentences "
+    "for a physician, mentioning the patient, the reason of the encounter and any result:\n{record}"
+)
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-p * len(ordered) // 100))
+    return ordered[int(min(rank, len(ordered))) - 1]
+
+def fhir_prompts(count: int, seed: int) -> list:
+    """Prompts built from generated bundles, flattened the way ExtractFHIRData describes resources."""
+    from my_fhir.corpus import load_generator
+    generator = load_generator(
+        os.path.join(FHIR_GENERATOR_DIR, "config", "corpus.json"),
+        os.path.join(FHIR_GENERATOR_DIR, "config", "config.json"),
+        seed
+    )
+    prompts = []
+    for index in range(count):
+        _, fhir_json = generator.bundle(index)
+        record = "\n".join(description for _, _, description in extract_descriptions(fhir_json))
+        prompts.append(PROMPT_TEMPLATE.format(record=record))
+    return prompts
+
+def load_prompts(path: str) -> list:
+    """Prompts from a .txt file (one per line) or a .jsonl file (one {"prompt": ...} per line)."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if path.endswith(".jsonl"):
+        return [json.loads(line)["prompt"] for line in lines]
+    return lines
+
+def generate(url: str, model: str, prompt: str, options: dict) -> dict:
+    """
+    Run one streamed /api/generate call.
+
+    :return: Client-side timings (TTFT and latency, seconds) with the statistics of the final chunk
+    """
+    payload = {"model": model, "prompt": prompt, "stream": True, "options": options}
+    start = time.perf_counter()
+    first_token = None
+    final = {}
+    try:
+        with requests.post(f"{url}/api/generate", json=payload, stream=True, timeout=600) as response:
+            if response.status_code != 200:
+                return {"error": f"{response.status_code} - {response.text[:200]}"}
+            # chunk_size=None hands over each chunk as it arrives, the first token is not held back in a buffer
+            for line in response.iter_lines(chunk_size=None):
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if "error" in chunk:
+                    return {"error": chunk["error"]}
+                if first_token is None and chunk.get("response"):
+                    first_token = time.perf_counter()
+                if chunk.get("done"):
+                    final = chunk
+    except (requests.RequestException, ValueError) as e:
+        # A reset connection, a timeout or a malformed chunk fails this request only, not the sweep
+        return {"error": f"{type(e).__name__}: {e}"}
+    end = time.perf_counter()
+    return {
+        "ttft_s": (first_token or end) - start,
+        "latency_s": end - start,
+        "prompt_eval_count": final.get("prompt_eval_count", 0),
+        "prompt_eval_duration": final.get("prompt_eval_duration", 0),
+        "eval_count": final.get("eval_count", 0),
+        "eval_duration": final.get("eval_duration", 0),
+        "load_duration": final.get("load_duration", 0)
+    }
+
+def run_config(url: str, model: str, options: dict, concurrency: int, prompts: list) -> dict:
+    """Send every prompt with the given options, `concurrency` at a time, and summarize."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        runs = list(pool.map(lambda prompt: generate(url, model, prompt, options), prompts))
+    wall = time.perf_counter() - start
+
+    ok = [run for run in runs if "error" not in run]
+    errors = [run["error"] for run in runs if "error" in run]
+    summary = {
+        "model": model,
+        "options": options,
+        "concurrency": concurrency,
+        "requests": len(runs),
+        "errors": len(errors),
+        "wall_s": wall
+    }
+    if errors:
+        summary["first_error"] = errors[0]
+    if not ok:
+        return summary
+
+    prompt_ns = sum(run["prompt_eval_duration"] for run in ok)
+    eval_ns = sum(run["eval_duration"] for run in ok)
+    eval_tokens = sum(run["eval_count"] for run in ok)
+    summary.update({
+        # Server-side speeds, from Ollama's own counters
+        "prompt_tokens_per_sec": sum(run["prompt_eval_count"] for run in ok) / prompt_ns * 1e9 if prompt_ns else 0.0,
+        "generation_tokens_per_sec": eval_tokens / eval_ns * 1e9 if eval_ns else 0.0,
+        # What the box delivers with `concurrency` requests in flight
+        "aggregate_tokens_per_sec": eval_tokens / wall if wall else 0.0,
+        "mean_eval_tokens": statistics.mean(run["eval_count"] for run in ok)
+    })
+    for p in PERCENTILES:
+        summary[f"ttft_p{p}_ms"] = percentile([run["ttft_s"] for run in ok], p) * 1000
+        summary[f"latency_p{p}_ms"] = percentile([run["latency_s"] for run in ok], p) * 1000
+    return summary
+
+def parse_sweep(values: list, cast=int) -> list:
+    """Sweep values from the command line, "default" leaving the option to Ollama."""
+    return [None if value == "default" else cast(value) for value in values]
+
+def print_table(results: list):
+    columns = (
+        ("model", 18, "{}"), ("thr", 4, "{}"), ("ctx", 6, "{}"), ("pred", 5, "{}"), ("conc", 4, "{}"),
+        ("prompt t/s", 10, "{:.1f}"), ("gen t/s", 8, "{:.1f}"), ("agg t/s", 8, "{:.1f}"),
+        ("ttft p50", 9, "{:.0f}"), ("ttft p99", 9, "{:.0f}"), ("lat p50", 8, "{:.0f}"), ("lat p99", 8, "{:.0f}"), ("err", 3, "{}")
+    )
+    print(" ".join(f"{name:>{width}}" for name, width, _ in columns))
+    for result in results:
+        options = result["options"]
+        values = (
+            result["model"], options.get("num_thread", "-"), options.get("num_ctx", "-"), options.get("num_predict", "-"), result["concurrency"],
+            result.get("prompt_tokens_per_sec", 0.0), result.get("generation_tokens_per_sec", 0.0), result.get("aggregate_tokens_per_sec", 0.0),
+            result.get("ttft_p50_ms", 0.0), result.get("ttft_p99_ms", 0.0), result.get("latency_p50_ms", 0.0), result.get("latency_p99_ms", 0.0),
+            result["errors"]
+        )
+        print(" ".join(f"{fmt.format(value):>{width}}" for (_, width, fmt), value in zip(columns, values)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Ollama models and options on FHIR-derived prompts.")
+    parser.add_argument("--url", default=os.getenv("OLLAMA_URL", OLLAMA_URL), help="Ollama base URL")
+    parser.add_argument("--models", nargs="+", default=["tinyllama:1.1b"])
+    parser.add_argument("--num-thread", nargs="+", default=["default"], help="num_thread values to sweep, 'default' for Ollama's choice")
+    parser.add_argument("--num-ctx", nargs="+", default=["default"], help="num_ctx values to sweep")
+    parser.add_argument("--num-predict", nargs="+", default=["128"], help="num_predict values to sweep")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1], help="Requests in flight values to sweep")
+    parser.add_argument("--prompts", default=None, help="Prompt file (.txt or .jsonl), FHIR-derived prompts are generated otherwise")
+    parser.add_argument("--count", type=int, default=8, help="Prompts per configuration")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the generated FHIR bundles")
+    parser.add_argument("--no-warmup", action="store_true", help="Skip the untimed request loading each model/options first")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "ollama_results.json"), help="JSON results file")
+    args = parser.parse_args()
+
+    prompts = load_prompts(args.prompts) if args.prompts else fhir_prompts(args.count, args.seed)
+    if not prompts:
+        parser.error(f"No prompts in {args.prompts}" if args.prompts else "--count must be at least 1")
+    prompts = (prompts * (args.count // len(prompts) + 1))[:args.count]
+
+    results = []
+    sweep = itertools.product(
+        args.models, parse_sweep(args.num_thread), parse_sweep(args.num_ctx), parse_sweep(args.num_predict), args.concurrency
+    )
+    for model, num_thread, num_ctx, num_predict, concurrency in sweep:
+        options = {key: value for key, value in (("num_thread", num_thread), ("num_ctx", num_ctx), ("num_predict", num_predict)) if value is not None}
+        print(f"{model} {options} concurrency={concurrency} ...", flush=True)
+        if not args.no_warmup:
+            # A changed num_ctx/num_thread reloads the model, keep that out of the measurement
+            generate(args.url, model, prompts[0], dict(options, num_predict=1))
+        results.append(run_config(args.url, model, options, concurrency, prompts))
+
+    print()
+    print_table(results)
+    with open(args.output, "w") as f:
+        json.dump({"created": datetime.now(timezone.utc).isoformat(), "url": args.url, "prompts": len(prompts), "results": results}, f, indent=4)
+    print(f"\nResults written to {args.output}")
+
+if __name__ == "__main__":
+    main()
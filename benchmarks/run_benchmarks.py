@@ -0,0 +1,349 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FHIR_GENERATOR_DIR = os.path.join(ROOT, "fhir_generator")
+TRANSFORMER_SERVER_DIR = os.path.join(ROOT, "transformer_server")
+sys.path[:0] = [FHIR_GENERATOR_DIR, TRANSFORMER_SERVER_DIR, os.path.dirname(os.path.abspath(__file__))]
+
+# A benchmark regresses when its throughput drops by more than this fraction of the baseline
+DEFAULT_TOLERANCE = 0.20
+DEFAULT_SEED = 42
+# Rows loaded into the vector store before the search benchmarks
+SEARCH_ROWS = 5000
+# Texts per Transformer.encode call in transform.batched
+ENCODE_BATCH = 32
+
+# name -> (function, default iterations), in registration order
+BENCHMARKS = {}
+
+def benchmark(name: str, iterations: int):
+    def register(function):
+        BENCHMARKS[name] = (function, iterations)
+        return function
+    return register
+
+def measure(call, iterations: int, items_per_call: int = 1, warmup: int = 5) -> dict:
+    """
+    Time `iterations` calls of call(i), after a few warm-up calls.
+
+    :param items_per_call: Work items (bundles, texts...) handled by one call, for the throughput
+    :return: Throughput and latency statistics of the calls
+    """
+    for i in range(warmup):
+        call(-1 - i)
+    durations = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        call(i)
+        durations.append(time.perf_counter() - start)
+    durations.sort()
+    total = sum(durations)
+    return {
+        "iterations": iterations,
+        "items_per_call": items_per_call,
+        "items_per_sec": iterations * items_per_call / total if total > 0 else 0.0,
+        "mean_ms": total / iterations * 1000,
+        "p50_ms": statistics.median(durations) * 1000,
+        "p99_ms": durations[min(len(durations) - 1, int(len(durations) * 0.99))] * 1000
+    }
+
+class Context:
+    """Inputs shared by the benchmarks, built on first use so --only runs stay fast."""
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self._generator = None
+        self._server = None
+        self._search_service = None
+
+    @property
+    def generator(self):
+        if self._generator is None:
+            from my_fhir.corpus import load_generator
+            self._generator = load_generator(
+                os.path.join(FHIR_GENERATOR_DIR, "config", "corpus.json"),
+                os.path.join(FHIR_GENERATOR_DIR, "config", "config.json"),
+                self.seed
+            )
+        return self._generator
+
+    @property
+    def server(self):
+        # transformer_server/main.py, loaded under its own name: fhir_generator has a main.py too
+        if self._server is None:
+            spec = importlib.util.spec_from_file_location("transformer_server_main", os.path.join(TRANSFORMER_SERVER_DIR, "main.py"))
+            self._server = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self._server)
+        return self._server
+
+    @property
+    def client(self):
+        return self.server.app.test_client()
+
+    @property
+    def search_service(self):
+        if self._search_service is None:
+            from utils.search_service import SearchService
+            transformer = self.server.transformer
+            self._search_service = SearchService(transformer, dimension=transformer.model.get_sentence_embedding_dimension())
+            for i in range(SEARCH_ROWS):
+                self._search_service.insert({"description": description_of(i), "PatientID": f"patient-{i % 100}"})
+        return self._search_service
+
+    def bundles(self, count: int) -> list:
+        return [self.generator.bundle(index)[1] for index in range(count)]
+
+def description_of(i: int) -> str:
+    vitals = ("heart rate", "blood pressure", "glucose", "hemoglobin A1c", "body temperature", "respiratory rate")
+    return f"Observation Information: {vitals[i % len(vitals)]} measured {60 + i % 70} at visit {i} code {1000 + i % 977}-{i % 10}"
+
+def extract_descriptions(fhir_json: dict) -> list:
+    """Rough Python counterpart of ExtractFHIRData: one description per resource of the bundle."""
+    descriptions = []
+    for entry in fhir_json.get("entry", []):
+        resource = entry.get("resource", {})
+        fields = [f"{key}: {value}" for key, value in resource.items() if key not in ("resourceType", "id") and isinstance(value, (str, int, float))]
+        descriptions.append((resource.get("resourceType", ""), resource.get("id", ""), f"{resource.get('resourceType')} Information: " + ", ".join(fields)))
+    return descriptions
+
+@benchmark("generator.build", 2000)
+def bench_generator_build(context: Context, iterations: int) -> dict:
+    from my_fhir.corpus import GENERATORS
+    cases = [context.generator.case(index) for index in range(500)]
+    return measure(lambda i: GENERATORS[cases[i % len(cases)][0]](cases[i % len(cases)][1], i), iterations)
+
+@benchmark("generator.to_fhir_json", 2000)
+def bench_generator_to_fhir_json(context: Context, iterations: int) -> dict:
+    from my_fhir.corpus import GENERATORS
+    cases = [context.generator.case(index) for index in range(500)]
+    bundles = [GENERATORS[bundle_type](case, index) for index, (bundle_type, case, _) in enumerate(cases)]
+    return measure(lambda i: bundles[i % len(bundles)].to_fhir_json(), iterations)
+
+@benchmark("mockfhir.create_response", 2000)
+def bench_mockfhir(context: Context, iterations: int) -> dict:
+    from my_fhir import writer
+    payloads = [writer.dumps(fhir_json, compact=True) for fhir_json in context.bundles(200)]
+    client = context.client
+
+    def call(i):
+        response = client.post("/fhirmock", data=payloads[i % len(payloads)], content_type="application/json")
+        assert response.status_code == 200, response.status_code
+    return measure(call, iterations)
+
+@benchmark("route.fhirmock", 3000)
+def bench_route_fhirmock(context: Context, iterations: int) -> dict:
+    """Responses/sec of /fhirmock acknowledgements, small requests so the response side dominates."""
+    client = context.client
+    payloads = [json.dumps({"resourceType": "Bundle", "id": f"bundle-{i}", "type": "message", "entry": []}) for i in range(100)]
+
+    def call(i):
+        response = client.post("/fhirmock", data=payloads[i % len(payloads)], content_type="application/json")
+        assert response.status_code == 200, response.status_code
+    return measure(call, iterations)
+
+@benchmark("route.transform", 3000)
+def bench_route_transform(context: Context, iterations: int) -> dict:
+    """Responses/sec of /transform on cached texts: routing and vector serialization, no model call."""
+    client = context.client
+    texts = [description_of(i) for i in range(100)]
+    for text in texts:
+        context.server.transformer.create_vector({"description": text})
+
+    def call(i):
+        response = client.post("/transform", json={"description": texts[i % len(texts)]})
+        assert response.status_code == 200, response.status_code
+    return measure(call, iterations)
+
+@benchmark("route.transform_chunks", 300)
+def bench_route_transform_chunks(context: Context, iterations: int) -> dict:
+    """Responses/sec of /transform in chunks mode, one vector per chunk in the response."""
+    client = context.client
+    text = " ".join(description_of(i) for i in range(40))
+
+    def call(i):
+        response = client.post("/transform", json={"description": f"{text} #{i}", "chunking": "chunks"})
+        assert response.status_code == 200, response.status_code
+    return measure(call, iterations)
+
+@benchmark("route.search", 500)
+def bench_route_search(context: Context, iterations: int) -> dict:
+    """Responses/sec of /search, vector mode, through the server's own search service."""
+    client = context.client
+    service = context.server.search_service
+    if len(service.store) < SEARCH_ROWS // 5:
+        for i in range(SEARCH_ROWS // 5):
+            service.insert({"description": description_of(i), "PatientID": f"patient-{i % 100}"})
+
+    def call(i):
+        response = client.post("/search", json={"query_desc": f"{description_of(i * 7)} q{i}", "mode": "vector", "rows": 10})
+        assert response.status_code == 200, response.status_code
+    return measure(call, iterations)
+
+@benchmark("transform.single", 1000)
+def bench_transform_single(context: Context, iterations: int) -> dict:
+    transformer = context.server.transformer
+    # Unique texts, every call misses the embedding cache and runs the model
+    return measure(lambda i: transformer.create_vector({"description": f"{description_of(i)} #{i}"}), iterations)
+
+@benchmark("transform.batched", 100)
+def bench_transform_batched(context: Context, iterations: int) -> dict:
+    transformer = context.server.transformer
+    return measure(
+        lambda i: transformer.encode([f"{description_of(i * ENCODE_BATCH + j)} #{i}" for j in range(ENCODE_BATCH)]),
+        iterations,
+        items_per_call=ENCODE_BATCH
+    )
+
+@benchmark("transform.cached", 5000)
+def bench_transform_cached(context: Context, iterations: int) -> dict:
+    transformer = context.server.transformer
+    texts = [description_of(i) for i in range(100)]
+    for text in texts:
+        transformer.create_vector({"description": text})
+    return measure(lambda i: transformer.create_vector({"description": texts[i % len(texts)]}), iterations)
+
+@benchmark("search.vector", 500)
+def bench_search_vector(context: Context, iterations: int) -> dict:
+    service = context.search_service
+    return measure(lambda i: service.search({"query_desc": f"{description_of(i * 7)} q{i}", "mode": "vector", "rows": 10}), iterations)
+
+@benchmark("search.hybrid", 500)
+def bench_search_hybrid(context: Context, iterations: int) -> dict:
+    service = context.search_service
+    return measure(lambda i: service.search({"query_desc": f"{description_of(i * 7)} q{i}", "mode": "hybrid", "rows": 10}), iterations)
+
+@benchmark("search.patient", 500)
+def bench_search_patient(context: Context, iterations: int) -> dict:
+    service = context.search_service
+    return measure(
+        lambda i: service.search({"query_desc": f"{description_of(i * 7)} q{i}", "mode": "hybrid", "rows": 10, "PatientID": f"patient-{i % 100}"}),
+        iterations
+    )
+
+@benchmark("roundtrip.bundle", 100)
+def bench_roundtrip(context: Context, iterations: int) -> dict:
+    """Generate a bundle, post it to /fhirmock, embed and store every resource, then search it back."""
+    from my_fhir import writer
+    client = context.client
+    offset = 10_000
+
+    def call(i):
+        bundle_index = offset + i if i >= 0 else offset - i
+        fhir_json = context.generator.bundle(bundle_index)[1]
+        response = client.post("/fhirmock", data=writer.dumps(fhir_json, compact=True), content_type="application/json")
+        assert response.status_code == 200, response.status_code
+        patient_id = ""
+        for resource_type, resource_id, description in extract_descriptions(fhir_json):
+            vector = client.post("/transform", json={"description": description}).get_json()["vector"]
+            if resource_type == "Patient":
+                patient_id = resource_id
+            client.post("/vectors", json={
+                "description": description,
+                "vector": vector,
+                "BundleID": fhir_json["id"],
+                "ResourceID": resource_id,
+                "ResourceType": resource_type,
+                "PatientID": patient_id
+            })
+        response = client.post("/search", json={"query_desc": "Observation heart rate", "rows": 5})
+        assert response.status_code == 200, response.status_code
+    return measure(call, iterations)
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Compare throughputs with a baseline run.
+
+    :return: The names of the benchmarks slower than the baseline by more than tolerance
+    """
+    regressions = []
+    print(f"\n{'benchmark':<28} {'baseline/s':>14} {'current/s':>14} {'change':>9}")
+    for name, result in results["benchmarks"].items():
+        reference = baseline.get("benchmarks", {}).get(name)
+        if reference is None:
+            print(f"{name:<28} {'-':>14} {result['items_per_sec']:>14.1f} {'new':>9}")
+            continue
+        change = result["items_per_sec"] / reference["items_per_sec"] - 1 if reference["items_per_sec"] else 0.0
+        regressed = change < -tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<28} {reference['items_per_sec']:>14.1f} {result['items_per_sec']:>14.1f} {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    if baseline.get("stub_model") != results["stub_model"]:
+        print("Warning: the baseline was recorded with a different model setting (--stub-model), the comparison is not meaningful")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and compare it with a baseline.")
+    parser.add_argument("--only", nargs="+", default=None, help="Benchmark names or prefixes to run (e.g. search transform.single)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier of every benchmark's iteration count")
+    parser.add_argument("--stub-model", action="store_true", help="Replace the sentence-transformers models by a deterministic stub (for CI)")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results.json"), help="Where to write the results")
+    parser.add_argument("--baseline", default=os.path.join(ROOT, "benchmarks", "baseline.json"), help="Baseline results to compare with")
+    parser.add_argument("--compare", action="store_true", help="Fail when the baseline is missing instead of skipping the comparison (for CI)")
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed throughput drop before failing (0.2 = 20%%)")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (_, iterations) in BENCHMARKS.items():
+            print(f"{name:<28} {iterations} iterations")
+        return 0
+
+    if args.compare and args.save_baseline:
+        parser.error("--compare and --save-baseline are exclusive, a saved baseline is not compared")
+    # Checked before running anything, a gate without a baseline would pass every run
+    if args.compare and not os.path.exists(args.baseline):
+        parser.error(f"No baseline at {args.baseline}, record one with --save-baseline (and --stub-model for CI)")
+
+    if args.stub_model:
+        import stub_model
+        stub_model.install()
+
+    selected = [name for name in BENCHMARKS if args.only is None or any(name == only or name.startswith(only.rstrip(".") + ".") for only in args.only)]
+    if not selected:
+        raise ValueError(f"No benchmark matches {args.only}, see --list")
+
+    context = Context(args.seed)
+    results = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "stub_model": args.stub_model,
+        "seed": args.seed,
+        "benchmarks": {}
+    }
+    for name in selected:
+        function, iterations = BENCHMARKS[name]
+        result = function(context, max(1, int(iterations * args.scale)))
+        results["benchmarks"][name] = result
+        print(f"{name:<28} {result['items_per_sec']:>12.1f} items/s  mean {result['mean_ms']:>8.3f} ms  p50 {result['p50_ms']:>8.3f} ms  p99 {result['p99_ms']:>8.3f} ms")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    print(f"Results written to {args.output}")
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Baseline written to {args.baseline}")
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import re
+import sys
+import types
+import zlib
+import numpy as np
+
+# Same shape as all-MiniLM-L6-v2, so the vector store and search paths do the same amount of work
+STUB_DIMENSION = 384
+STUB_MAX_SEQ_LENGTH = 256
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+class StubTokenizer:
+    """Word-level tokenizer returning offsets like the Hugging Face fast tokenizers."""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=True):
+        return {"offset_mapping": [(match.start(), match.end()) for match in TOKEN_PATTERN.finditer(text)]}
+
+class StubSentenceTransformer:
+    """
+    Deterministic stand-in for SentenceTransformer: each text maps to a fixed pseudo-random vector.
+
+    It measures everything around the model (tokenization, caching, pooling,
+    JSON, search) without downloading weights or needing torch.
+    """
+
+    def __init__(self, model_name=None, **kwargs):
+        self.model_name = model_name
+        self.tokenizer = StubTokenizer()
+        self.max_seq_length = STUB_MAX_SEQ_LENGTH
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return STUB_DIMENSION
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=False, **kwargs):
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        vectors = np.empty((len(texts), STUB_DIMENSION), dtype=np.float32)
+        for row, text in enumerate(texts):
+            vectors[row] = np.random.default_rng(zlib.crc32(text.encode("utf-8"))).standard_normal(STUB_DIMENSION)
+        if normalize_embeddings and len(texts):
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors[0] if single else vectors
+
+class StubCrossEncoder:
+    """Stand-in for CrossEncoder scoring a pair by the words it shares."""
+
+    def __init__(self, model_name=None, **kwargs):
+        self.model_name = model_name
+
+    def predict(self, pairs, batch_size=32, **kwargs):
+        return np.array([len(set(query.lower().split()) & set(text.lower().split())) for query, text in pairs], dtype=np.float32)
+
+def install():
+    """Make `import sentence_transformers` return the stub models."""
+    module = types.ModuleType("sentence_transformers")
+    module.SentenceTransformer = StubSentenceTransformer
+    module.CrossEncoder = StubCrossEncoder
+    sys.modules["sentence_transformers"] = module
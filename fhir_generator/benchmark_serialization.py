@@ -0,0 +1,35 @@
+import argparse
+import os
+import time
+from my_fhir import writer
+from my_fhir.corpus import load_generator, GENERATORS
+
+def measure(label, cases, serialize):
+    start = time.perf_counter()
+    size = 0
+    for index, (bundle_type, case, _) in enumerate(cases):
+        fhir_json = GENERATORS[bundle_type](case, index).to_fhir_json()
+        size += len(serialize(fhir_json))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {len(cases) / elapsed:>12.0f} bundles/sec {size / len(cases) / 1024:>8.1f} KiB/bundle")
+    return len(cases) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bundle generation and serialization throughput.")
+    parser.add_argument("--count", type=int, default=5000, help="Number of bundles per measurement")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--params", default=os.path.join("config", "corpus.json"))
+    parser.add_argument("--profiles", default=os.path.join("config", "config.json"))
+    args = parser.parse_args()
+
+    generator = load_generator(args.params, args.profiles, args.seed)
+    cases = [generator.case(index) for index in range(args.count)]
+
+    print(f"orjson: {'available' if writer.orjson is not None else 'not installed, using stdlib compact encoder'}")
+    build = measure("build", cases, lambda fhir_json: b"")
+    pretty = measure("pretty", cases, lambda fhir_json: writer.dumps(fhir_json))
+    compact = measure("compact", cases, lambda fhir_json: writer.dumps(fhir_json, compact=True))
+    print(f"compact vs pretty: {compact / pretty:.1f}x, serialization overhead pretty {1 - pretty / build:.0%}, compact {1 - compact / build:.0%}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import os
+import time
+from multiprocessing import Pool
+from my_fhir.corpus import load_generator, generate_shard
+
+# Built once per worker process by init_worker
+generator = None
+
+def init_worker(params_path, profiles_path, seed):
+    global generator
+    generator = load_generator(params_path, profiles_path, seed)
+
+def run_shard(task):
+    start, end, output_dir, options = task
+    return generate_shard(generator, start, end, output_dir, **options)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a large, reproducible synthetic FHIR corpus.")
+    parser.add_argument("--count", type=int, default=1000, help="Number of bundles to generate")
+    parser.add_argument("--seed", type=int, default=42, help="Seed, the same seed always gives byte-identical output")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--shard-size", type=int, default=1000, help="Bundles generated per task, and per NDJSON shard")
+    parser.add_argument("--params", default=os.path.join("config", "corpus.json"), help="Distribution parameters")
+    parser.add_argument("--profiles", default=os.path.join("config", "config.json"), help="Clinical profiles")
+    parser.add_argument("--output", default=os.path.join("output", "corpus"), help="Output folder")
+    parser.add_argument("--compact", action="store_true", help="Write compact JSON (orjson when installed)")
+    parser.add_argument("--format", choices=["files", "ndjson"], default="files", help="One JSON file per bundle, or NDJSON shards")
+    parser.add_argument("--compression", choices=["gzip", "zstd", "none"], default="gzip", help="Compression of NDJSON shards")
+    args = parser.parse_args()
+
+    options = {
+        "compact": args.compact,
+        "output_format": args.format,
+        "compression": None if args.compression == "none" else args.compression
+    }
+    tasks = [
+        (start, min(start + args.shard_size, args.count), args.output, options)
+        for start in range(0, args.count, args.shard_size)
+    ]
+
+    print(f"Generating {args.count} bundles with seed {args.seed} on {args.workers} workers...")
+    start_time = time.time()
+    totals = {}
+    with Pool(args.workers, initializer=init_worker, initargs=(args.params, args.profiles, args.seed)) as pool:
+        for counts in pool.imap_unordered(run_shard, tasks):
+            for bundle_type, count in counts.items():
+                totals[bundle_type] = totals.get(bundle_type, 0) + count
+    elapsed = time.time() - start_time
+
+    for bundle_type, count in sorted(totals.items()):
+        print(f"{bundle_type}: {count}")
+    print(f"Generated {sum(totals.values())} bundles in {elapsed:.1f} seconds ({sum(totals.values()) / elapsed:.0f} bundles/sec)")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,24 @@
-from my_fhir import create_appointment, create_exam_request, create_exam_result, create_medical_prescription
+import argparse
+import os
+import time
+from my_fhir.engine import generate, GENERATORS
 
-print("Generating Appointment Bundles...")
-create_appointment.main()
-print("Generating Exam Request Bundles...")
-create_exam_request.main()
-print("Generating Exam Result Bundles...")
-create_exam_result.main()
-print("Generating Medical Prescription Bundles...")
-create_medical_prescription.main()
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description="Generate the FHIR bundles of every case of config.json.")
+    parser.add_argument("--types", nargs="+", choices=list(GENERATORS), default=list(GENERATORS), help="Bundle types to generate")
+    parser.add_argument("--config", default=os.path.join("config", "config.json"))
+    parser.add_argument("--output", default="output")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("--seed", default=None, help="Seed making the output reproducible")
+    args = parser.parse_args()
+
+    print(f"Generating {', '.join(args.types)} bundles...")
+    start_time = time.time()
+    counts = generate(args.config, args.output, args.types, args.workers, args.seed)
+    for bundle_type, count in counts.items():
+        print(f"{bundle_type}: {count}")
+    print(f"All cases generated in {time.time() - start_time:.2f} seconds.")
+
+# Worker processes re-import this script under the spawn start method, only the parent may run it
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import argparse
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from main import FHIRClient, iter_payloads, CONTENT_ENCODINGS
+from my_fhir import batch
+
+PERCENTILES = (50, 90, 99, 99.9)
+# Each power-of-two range of latencies is split into 2^(SUB_BUCKET_BITS-1) buckets (< 1.6% error)
+SUB_BUCKET_BITS = 7
+# Sender threads of the open loop. The FHIRClient gets as many pooled connections, so a request
+# past the first ones is not held back client-side waiting for a connection
+MAX_IN_FLIGHT = 512
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in the style of HdrHistogram, with microsecond resolution.
+
+    Values below 2^SUB_BUCKET_BITS us are counted exactly; above that every
+    power-of-two range is split into the same number of linear buckets, so the
+    relative error is bounded whatever the latency.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+
+    def record(self, seconds: float):
+        value = max(0, int(seconds * 1_000_000))
+        shift = max(0, value.bit_length() - SUB_BUCKET_BITS)
+        # Lowest value sharing the bucket of `value`
+        key = (value >> shift) << shift
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.total += 1
+
+    def export(self, path: str):
+        """
+        Write the percentile distribution in the HdrHistogram .hgrm text format (values in ms).
+
+        :param path: Output file, readable by the HdrHistogram plotter
+        """
+        with open(path, "w") as f:
+            f.write(f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}\n\n")
+            seen = 0
+            for value in sorted(self.counts):
+                seen += self.counts[value]
+                fraction = seen / self.total
+                inverse = f"{1 / (1 - fraction):14.2f}" if fraction < 1 else f"{'inf':>14}"
+                f.write(f"{value / 1000:12.3f} {fraction:14.12f} {seen:10d} {inverse}\n")
+            # No request may have completed (target down), the report is still written
+            highest = max(self.counts) if self.counts else 0
+            f.write(f"#[Max     = {highest / 1000:12.3f}, Total count    = {self.total:12d}]\n")
+
+class LatencyRecorder:
+    """Collects per-request latencies and outcomes from many threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = []
+        self.errors = {}
+        self.histogram = LatencyHistogram()
+        self.start = None
+        self.end = None
+
+    def record(self, sent_at: float, latency: float, status):
+        with self.lock:
+            self.samples.append((sent_at, latency, status))
+            self.histogram.record(latency)
+            if status != 200 and status != 201:
+                self.errors[status] = self.errors.get(status, 0) + 1
+
+    def summary(self) -> dict:
+        with self.lock:
+            latencies = sorted(latency for _, latency, _ in self.samples)
+            count = len(self.samples)
+            errors = dict(self.errors)
+        elapsed = (self.end or time.perf_counter()) - self.start
+        summary = {
+            "requests": count,
+            "errors": sum(errors.values()),
+            "errors_by_status": errors,
+            "elapsed_s": elapsed,
+            "throughput_rps": count / elapsed if elapsed > 0 else 0.0
+        }
+        for p in PERCENTILES:
+            summary[f"p{p:g}_ms"] = percentile(latencies, p) * 1000
+        summary["max_ms"] = latencies[-1] * 1000 if latencies else 0.0
+        return summary
+
+    def export(self, path: str):
+        """
+        Write every raw sample as CSV.
+
+        :param path: Output file, one line per request: send time (s since start), latency (ms), status
+        """
+        with self.lock:
+            samples = list(self.samples)
+        with open(path, "w") as f:
+            f.write("sent_at_s,latency_ms,status\n")
+            for sent_at, latency, status in samples:
+                f.write(f"{sent_at - self.start:.6f},{latency * 1000:.3f},{status}\n")
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(-(-p * len(sorted_values) // 100)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+def timed_send(client: FHIRClient, payload: dict, recorder: LatencyRecorder, intended_at: float = None):
+    """
+    Send one payload and record its latency.
+
+    :param intended_at: When the request was scheduled to be sent. Latency is measured
+        from this time when given, so time spent waiting for a free sender counts too
+        (correcting for coordinated omission).
+    """
+    sent_at = time.perf_counter()
+    start = intended_at if intended_at is not None else sent_at
+    try:
+        status = client.send(payload).status_code
+    except Exception as e:
+        status = type(e).__name__
+    recorder.record(start, time.perf_counter() - start, status)
+
+def run_closed_loop(client: FHIRClient, payloads, concurrency: int, rate: float = None, limit: int = None) -> LatencyRecorder:
+    """
+    Send payloads from a pool of worker threads, each starting a new request when its previous one completes.
+
+    :param client: The FHIRClient to send with (its pool should allow `concurrency` connections)
+    :param payloads: Iterable of FHIR requests
+    :param concurrency: Maximum number of requests in flight
+    :param rate: Optional target rate in requests/second, None to send as fast as possible
+    :param limit: Optional maximum number of requests
+    :return: The LatencyRecorder holding the results
+    """
+    recorder = LatencyRecorder()
+    slots = threading.Semaphore(concurrency)
+    recorder.start = time.perf_counter()
+
+    def send_and_release(payload):
+        try:
+            timed_send(client, payload, recorder)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i, payload in enumerate(itertools.islice(payloads, limit)):
+            if rate:
+                delay = recorder.start + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            slots.acquire()
+            pool.submit(send_and_release, payload)
+    recorder.end = time.perf_counter()
+    return recorder
+
+def run_open_loop(client: FHIRClient, payloads, rate: float, duration: float, arrivals="poisson", max_in_flight=MAX_IN_FLIGHT, seed=None) -> LatencyRecorder:
+    """
+    Send payloads on a fixed schedule, whether or not earlier requests have completed.
+
+    :param client: The FHIRClient to send with
+    :param payloads: Iterable of FHIR requests, it should not run out before `duration`
+    :param rate: Arrival rate in requests/second
+    :param duration: How long to keep sending, in seconds
+    :param arrivals: "poisson" for exponential inter-arrival times, "fixed" for a constant interval
+    :param max_in_flight: Sender threads; once all are busy, requests wait and their wait is measured.
+        The client should have as many pooled connections, fewer makes requests queue for one client-side
+    :param seed: Seed of the Poisson arrival process
+    :return: The LatencyRecorder holding the results
+    """
+    recorder = LatencyRecorder()
+    rng = random.Random(seed)
+    recorder.start = time.perf_counter()
+    intended_at = recorder.start
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        for payload in payloads:
+            intended_at += rng.expovariate(rate) if arrivals == "poisson" else 1 / rate
+            if intended_at > recorder.start + duration:
+                break
+            delay = intended_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(timed_send, client, payload, recorder, intended_at)
+    recorder.end = time.perf_counter()
+    return recorder
+
+def find_knee(client: FHIRClient, payloads, rates: list, duration: float, arrivals="poisson", slo_ms=None, seed=None, max_in_flight=MAX_IN_FLIGHT) -> list:
+    """
+    Step the open-loop arrival rate up until the server saturates.
+
+    A step is saturated when achieved throughput falls below 90% of the offered
+    rate, or when its p99 exceeds slo_ms (default: 10x the p99 of the first step).
+
+    :return: One summary per step, the first saturated step flagged with "knee"
+    """
+    steps = []
+    for rate in rates:
+        summary = run_open_loop(client, payloads, rate, duration, arrivals, max_in_flight, seed).summary()
+        summary["offered_rps"] = rate
+        limit = slo_ms if slo_ms is not None else (steps[0]["p99_ms"] * 10 if steps else None)
+        saturated = summary["throughput_rps"] < 0.9 * rate or (limit is not None and summary["p99_ms"] > limit)
+        summary["knee"] = saturated
+        steps.append(summary)
+        print(f"offered {rate:8.1f} req/s -> achieved {summary['throughput_rps']:8.1f} req/s, p50 {summary['p50_ms']:8.1f}ms, p99 {summary['p99_ms']:8.1f}ms{'  <- saturation knee' if saturated else ''}")
+        if saturated:
+            break
+    return steps
+
+def load_payloads(folder: str, repeat: bool, batch_size: int = 0, max_bytes: int = batch.MAX_BATCH_BYTES, batch_type="batch"):
+    """
+    Yield the payloads of every subfolder of folder, cycling through them when repeat is set.
+
+    With a batch_size, the bundles are packed into batch or transaction bundles first.
+    """
+    folders = [root for root, _, _ in os.walk(folder)]
+    while True:
+        items = (item for path in folders for item in iter_payloads(path))
+        if batch_size > 0:
+            items = batch.pack(items, batch_size, max_bytes, batch_type)
+        sent = False
+        for _, payload in items:
+            sent = True
+            yield payload
+        if not repeat or not sent:
+            return
+
+def print_summary(summary: dict):
+    print(f"Requests:   {summary['requests']} ({summary['errors']} errors {summary['errors_by_status']})")
+    print(f"Elapsed:    {summary['elapsed_s']:.2f} s")
+    print(f"Throughput: {summary['throughput_rps']:.1f} req/s")
+    print("Latency:    " + ", ".join(f"p{p:g}={summary[f'p{p:g}_ms']:.1f}ms" for p in PERCENTILES) + f", max={summary['max_ms']:.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent FHIR load against API_URL and report latencies.")
+    parser.add_argument("--folder", default="output", help="Folder with JSON files and/or NDJSON shards")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed", help="Closed loop (bounded concurrency) or open loop (scheduled arrivals)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight (closed loop)")
+    parser.add_argument("--rate", type=float, default=None, help="Target request rate (req/s), unlimited if omitted in closed loop")
+    parser.add_argument("--arrivals", choices=["poisson", "fixed"], default="poisson", help="Open-loop arrival process")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per open-loop run or step")
+    parser.add_argument("--steps", default=None, help="Comma-separated open-loop rates to step through to find the saturation knee")
+    parser.add_argument("--slo-ms", type=float, default=None, help="p99 above which a step counts as saturated")
+    parser.add_argument("--seed", type=int, default=None, help="Seed of the Poisson arrivals")
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT, help="Open-loop sender threads and pooled connections")
+    parser.add_argument("--hgrm", default=None, help="File to export the latency histogram to (HdrHistogram .hgrm format)")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many requests")
+    parser.add_argument("--repeat", action="store_true", help="Cycle through the payloads until --limit is reached")
+    parser.add_argument("--batch-size", type=int, default=0, help="Pack this many bundles per batch bundle, 0 to send them one by one")
+    parser.add_argument("--max-bytes", type=int, default=batch.MAX_BATCH_BYTES, help="Maximum serialized size of a batch bundle")
+    parser.add_argument("--batch-type", choices=batch.BATCH_TYPES, default="batch")
+    parser.add_argument("--compression", choices=CONTENT_ENCODINGS, default=None, help="Compress request bodies")
+    parser.add_argument("--latencies", default=None, help="CSV file to export raw latencies to")
+    args = parser.parse_args()
+
+    load_dotenv()
+    api_url = os.getenv("API_URL")
+    if not api_url:
+        raise ValueError("API_URL is not defined in .env")
+
+    batching = (args.batch_size, args.max_bytes, args.batch_type)
+    if args.mode == "closed":
+        client = FHIRClient(api_url, pool_size=args.concurrency, compression=args.compression)
+        recorder = run_closed_loop(client, load_payloads(args.folder, args.repeat, *batching), args.concurrency, args.rate, args.limit)
+    elif args.steps:
+        client = FHIRClient(api_url, pool_size=args.max_in_flight, compression=args.compression)
+        rates = [float(rate) for rate in args.steps.split(",")]
+        find_knee(client, load_payloads(args.folder, True, *batching), rates, args.duration, args.arrivals, args.slo_ms, args.seed, args.max_in_flight)
+        return
+    else:
+        if not args.rate:
+            raise ValueError("--rate is required in open-loop mode")
+        client = FHIRClient(api_url, pool_size=args.max_in_flight, compression=args.compression)
+        recorder = run_open_loop(client, load_payloads(args.folder, True, *batching), args.rate, args.duration, args.arrivals, args.max_in_flight, args.seed)
+
+    print_summary(recorder.summary())
+    if args.latencies:
+        recorder.export(args.latencies)
+        print(f"Raw latencies written to {args.latencies}")
+    if args.hgrm:
+        recorder.histogram.export(args.hgrm)
+        print(f"Latency histogram written to {args.hgrm}")
+
+if __name__ == "__main__":
+    main()
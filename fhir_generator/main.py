@@ -1,11 +1,41 @@
+import argparse
 import requests
+import requests.adapters
 import json
 import os
 from dotenv import load_dotenv
+from my_fhir import shards, batch
+
+# Content-Encoding values the client can send request bodies with
+CONTENT_ENCODINGS = ("gzip", "zstd")
 
 class FHIRClient:
-    def __init__(self, api_url):
+    def __init__(self, api_url, pool_size=10, compression=None):
+        if compression is not None and compression not in CONTENT_ENCODINGS:
+            raise ValueError(f"Unsupported compression '{compression}', expected one of {list(CONTENT_ENCODINGS)}")
+        if compression == "zstd" and shards.zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
         self.api_url = api_url
+        # Request bodies are compressed with this Content-Encoding, None to send them as is
+        self.compression = compression
+        # Keep-alive connections are reused across posts, up to pool_size at once
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def send(self, payload):
+        """
+        Post a FHIR request and return the raw HTTP response.
+
+        :param payload: The FHIR request as a JSON object
+        :return: The requests.Response object
+        """
+        if self.compression is None:
+            return self.session.post(self.api_url, json=payload, headers={"Content-Type": "application/fhir+json"})
+        body = shards.compress(json.dumps(payload).encode("utf-8"), self.compression)
+        headers = {"Content-Type": "application/fhir+json", "Content-Encoding": self.compression}
+        return self.session.post(self.api_url, data=body, headers=headers)
 
     def post(self, payload):
         """
@@ -15,7 +45,7 @@ class FHIRClient:
         :return: The response from the server as a JSON object, or an error dictionary with keys "error" and "raw"
         """
         try:
-            response = requests.post(self.api_url, json=payload, headers={"Content-Type": "application/fhir+json"})
+            response = self.send(payload)
             
             if response.status_code in (200, 201):  # 201 Created is common for FHIR
                 try:
@@ -49,21 +79,69 @@ def send_requests_in_folder(folder_path, client: FHIRClient):
     :param folder_path: The path to the folder containing the FHIR requests.
     :param client: The FHIRClient to use for sending the requests.
     """
-    for file_name in os.listdir(folder_path):
-        if file_name.endswith(".json"):
-            file_path = os.path.join(folder_path, file_name)
-            print(f"Sending {file_name} ...")
+    for name, payload in iter_payloads(folder_path):
+        print(f"Sending {name} ...")
+        response = client.post(payload)
+        print(f"Response for {name}: {response}\n")
+
+def send_batches_in_folder(folder_path, client: FHIRClient, batch_size, max_bytes=batch.MAX_BATCH_BYTES, batch_type="batch", unit="bundles"):
+    """
+    Sends the FHIR requests of the given folder and its subfolders packed into batch or transaction bundles.
+
+    :param folder_path: The path to the folder containing the FHIR requests.
+    :param client: The FHIRClient to use for sending the requests.
+    :param batch_size: Maximum number of entries per batch.
+    :param max_bytes: Maximum serialized size of a batch.
+    :param batch_type: "batch" or "transaction".
+    :param unit: "bundles" to pack whole bundles, "entries" to pack their resources.
+    """
+    payloads = (item for root, _, _ in os.walk(folder_path) for item in iter_payloads(root))
+    for names, bundle in batch.pack(payloads, batch_size, max_bytes, batch_type, unit):
+        print(f"Sending {batch_type} of {len(names)} entries ...")
+        response = client.post(bundle)
+        if "error" in response:
+            print(f"Response for {batch_type} of {names[0]} ... {names[-1]}: {response}\n")
+            continue
+        try:
+            for name, status, _ in batch.unpack(names, response):
+                print(f"Response for {name}: {status}")
+        except ValueError as e:
+            print(f"Invalid {batch_type}-response: {e}")
+        print()
+
+def iter_payloads(folder_path):
+    """
+    Yields the FHIR requests stored in the given folder, one at a time.
+
+    JSON files are loaded whole; NDJSON shards (.ndjson, .ndjson.gz, .ndjson.zst)
+    are streamed bundle by bundle.
+
+    :param folder_path: The path to the folder containing the FHIR requests.
+    :return: A generator of (name, payload) tuples.
+    """
+    for file_name in sorted(os.listdir(folder_path)):
+        file_path = os.path.join(folder_path, file_name)
+        if shards.is_shard(file_name):
+            for position, payload in enumerate(shards.read_shard(file_path)):
+                yield f"{file_name}#{position}", payload
+        elif file_name.endswith(".json"):
             with open(file_path, "r", encoding="utf-8") as f:
                 try:
                     payload = json.load(f)
                 except json.JSONDecodeError as e:
                     print(f"Skipping {file_name}, invalid JSON: {e}")
                     continue
-
-            response = client.post(payload)
-            print(f"Response for {file_name}: {response}\n")
+            yield file_name, payload
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send the generated FHIR requests to API_URL.")
+    parser.add_argument("--batch-size", type=int, default=0, help="Pack this many entries per batch bundle, 0 to send every bundle on its own")
+    parser.add_argument("--max-bytes", type=int, default=batch.MAX_BATCH_BYTES, help="Maximum serialized size of a batch bundle")
+    parser.add_argument("--batch-type", choices=batch.BATCH_TYPES, default="batch")
+    parser.add_argument("--compression", choices=CONTENT_ENCODINGS, default=None, help="Compress request bodies")
+    parser.add_argument("--unit", choices=batch.PACK_UNITS, default="bundles", help="Pack whole bundles, or the resources of the bundles")
+    args = parser.parse_args()
+
     # Load environment variables
     load_dotenv()
 
@@ -73,10 +151,13 @@ if __name__ == "__main__":
         raise ValueError("API_URL is not defined in .env")
 
     # Define API Client
-    client = FHIRClient(API_URL)
+    client = FHIRClient(API_URL, compression=args.compression)
 
     # Folder containing JSON files
     folder = "output"
 
     # Send all JSON requests in the folder
-    send_all_requests_in_folder(folder, client)
+    if args.batch_size > 0:
+        send_batches_in_folder(folder, client, args.batch_size, args.max_bytes, args.batch_type, args.unit)
+    else:
+        send_all_requests_in_folder(folder, client)
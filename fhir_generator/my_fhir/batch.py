@@ -0,0 +1,81 @@
+import uuid
+from . import writer
+
+BATCH_TYPES = ("batch", "transaction")
+# What each batch entry carries: a whole generated message bundle, or one resource of it
+PACK_UNITS = ("bundles", "entries")
+# Serialized size of a batch before another entry is started in a new one
+MAX_BATCH_BYTES = 1024 * 1024
+
+def batch_entry(resource: dict, unit: str) -> dict:
+    if unit == "bundles":
+        # Message bundles are processed by the server as messages, one per entry
+        request = {"method": "POST", "url": "$process-message"}
+    else:
+        # PUT keeps the generated ids, so Type/id references between entries still resolve
+        request = {"method": "PUT", "url": f"{resource['resourceType']}/{resource['id']}"}
+    return {
+        "fullUrl": f"{resource['resourceType']}/{resource['id']}",
+        "resource": resource,
+        "request": request
+    }
+
+def new_batch(batch_type: str, entries: list) -> dict:
+    return {
+        "resourceType": "Bundle",
+        "id": str(uuid.uuid4()),
+        "type": batch_type,
+        "entry": entries
+    }
+
+def pack(payloads, batch_size: int, max_bytes: int = MAX_BATCH_BYTES, batch_type="batch", unit="bundles"):
+    """
+    Group generated bundles into FHIR batch or transaction bundles.
+
+    A batch is closed when it holds batch_size entries or when adding the next
+    entry would take it past max_bytes of compact JSON. An entry larger than
+    max_bytes on its own is sent alone.
+
+    :param payloads: Iterable of (name, message bundle) tuples, as yielded by iter_payloads
+    :param batch_size: Maximum number of entries per batch
+    :param max_bytes: Maximum serialized size of a batch
+    :param batch_type: "batch" (entries processed independently) or "transaction" (all or nothing)
+    :param unit: "bundles" to pack whole message bundles, "entries" to pack their resources
+    :return: A generator of (entry names, batch bundle) tuples
+    """
+    if batch_type not in BATCH_TYPES:
+        raise ValueError(f"Unsupported batch type '{batch_type}', expected one of {list(BATCH_TYPES)}")
+    if unit not in PACK_UNITS:
+        raise ValueError(f"Unsupported unit '{unit}', expected one of {list(PACK_UNITS)}")
+
+    names, entries, size = [], [], 0
+    for name, payload in payloads:
+        if unit == "bundles":
+            items = [(name, payload)]
+        else:
+            items = [(f"{name}:{entry['fullUrl']}", entry["resource"]) for entry in payload.get("entry", [])]
+        for item_name, resource in items:
+            entry = batch_entry(resource, unit)
+            # +1 for the separating comma
+            entry_size = len(writer.dumps(entry, compact=True)) + 1
+            if entries and (len(entries) >= batch_size or size + entry_size > max_bytes):
+                yield names, new_batch(batch_type, entries)
+                names, entries, size = [], [], 0
+            names.append(item_name)
+            entries.append(entry)
+            size += entry_size
+    if entries:
+        yield names, new_batch(batch_type, entries)
+
+def unpack(names: list, response: dict) -> list:
+    """
+    Match the entries of a batch-response or transaction-response to the packed entries.
+
+    :param names: Entry names, as yielded by pack
+    :param response: The response bundle of the server
+    :return: A list of (name, HTTP status string, entry response dict) tuples
+    """
+    entries = response.get("entry", []) if isinstance(response, dict) else []
+    if len(entries) != len(names):
+        raise ValueError(f"Expected {len(names)} response entries, got {len(entries)}")
+    return [(name, entry.get("response", {}).get("status", ""), entry) for name, entry in zip(names, entries)]
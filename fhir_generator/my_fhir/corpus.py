@@ -0,0 +1,149 @@
+import json
+import os
+from random import Random
+from datetime import datetime, timedelta
+from . import resources, writer, shards
+from .engine import GENERATORS
+
+class CorpusGenerator:
+    """
+    Draws synthetic cases from parameterized distributions.
+
+    Clinical content (specialty, exams, observations, medications, organization)
+    comes from the profiles in config.json; patients and doctors come from
+    fixed-size populations so the same people recur across bundles. Every
+    random draw is derived from (seed, index), so bundle N is byte-identical
+    whatever the number of workers or the shard it is generated in.
+    """
+
+    def __init__(self, params: dict, profiles: list, seed: int):
+        self.params = params
+        self.profiles = profiles
+        self.seed = seed
+        self.reference_time = datetime.fromisoformat(params["reference_time"])
+        self.bundle_types = list(params["bundle_types"])
+        self.bundle_weights = [params["bundle_types"][t] for t in self.bundle_types]
+        self.allergies = [
+            {key: profile[key] for key in ("substance_description", "substance_code", "allergen_reaction")}
+            for profile in profiles
+        ]
+
+    def person(self, role: str, number: int) -> dict:
+        """Return the attributes of the given patient or doctor, identical on every call."""
+        rng = Random(f"{self.seed}:{role}:{number}")
+        gender = rng.choice(list(self.params["given_names"]))
+        place = rng.choice(self.params["cities"])
+        person = {
+            # Keys the resource id, so the same person has the same id in every bundle
+            f"{role}_number": number,
+            f"{role}_name": rng.choice(self.params["given_names"][gender]),
+            f"{role}_family_name": rng.choice(self.params["family_names"]),
+            f"{role}_gender": gender,
+            f"{role}_state": place["state"],
+            f"{role}_city": place["city"],
+            f"{role}_postalcode": place["postalcode"],
+            f"{role}_address": f"{rng.randint(1, 9999)} {rng.choice(self.params['streets'])}",
+            f"{role}_phone": f"555-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}"
+        }
+        if role == "patient":
+            first, last = self.params["birth_year_range"]
+            birth = datetime(rng.randint(first, last), 1, 1) + timedelta(days=rng.randrange(365))
+            person["patient_birthdate"] = birth.strftime("%Y-%m-%d")
+        return person
+
+    def case(self, index: int):
+        """
+        Build the case of the given bundle index.
+
+        :return: A (bundle type, case dict, slot start datetime) tuple
+        """
+        rng = Random(f"{self.seed}:case:{index}")
+        bundle_type = rng.choices(self.bundle_types, self.bundle_weights)[0]
+        profile = rng.choice(self.profiles)
+
+        slot_minutes = self.params["slot_minutes"]
+        slots = self.params["time_span_days"] * 24 * 60 // slot_minutes
+        start = self.reference_time + timedelta(minutes=rng.randrange(slots) * slot_minutes)
+        end = start + timedelta(minutes=slot_minutes)
+
+        case = dict(profile)
+        case.update(self.person("patient", rng.randrange(self.params["patient_population"])))
+        case.update(self.person("doctor", rng.randrange(self.params["doctor_population"])))
+        case.update(rng.choice(self.allergies))
+        case.update({
+            "output_dir": f"corpus_{index:09d}",
+            "slot_start_time": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "slot_end_time": end.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "composition_date": (start + timedelta(minutes=slot_minutes // 2)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "specimen_identifier": f"spec-{index}",
+            "condition_identifier": f"cond-{index}",
+            "service_request_identifier": f"sr-{index}",
+            "diagnostic_report_identifier": f"dr-{index}"
+        })
+
+        # Repeated measurements of the profile panel, values spread around the profile value
+        low, high = self.params["observations_per_bundle"]
+        sd = self.params["observation_value_sd"]
+        observations = []
+        for j in range(rng.randint(low, high)):
+            observation = dict(rng.choice(profile["observations"]))
+            taken = start + timedelta(minutes=5 * (j + 1))
+            observation["effectiveDateTime"] = taken.strftime("%Y-%m-%dT%H:%M:%SZ")
+            observation["value"] = round(max(0.0, rng.gauss(observation["value"], abs(observation["value"]) * sd)), 1)
+            observations.append(observation)
+        case["observations"] = observations
+
+        low, high = self.params["medications_per_bundle"]
+        count = min(rng.randint(low, high), len(profile["medications"]))
+        case["medications"] = rng.sample(profile["medications"], count)
+        return bundle_type, case, start
+
+    def bundle(self, index: int):
+        """
+        Generate and serialize the bundle of the given index.
+
+        :return: A (bundle type, FHIR JSON dict) tuple
+        """
+        bundle_type, case, start = self.case(index)
+        # Ids, random fields and timestamps of the resources are tied to the index too
+        resources.seed(f"{self.seed}:bundle:{index}", now=start)
+        bundle = GENERATORS[bundle_type](case, index)
+        return bundle_type, bundle.to_fhir_json()
+
+def load_generator(params_path: str, profiles_path: str, seed: int) -> CorpusGenerator:
+    with open(params_path, "r") as f:
+        params = json.load(f)
+    with open(profiles_path, "r") as f:
+        profiles = json.load(f)
+    if not isinstance(profiles, list) or not profiles:
+        raise ValueError(f"{profiles_path} must contain a non-empty JSON array")
+    return CorpusGenerator(params, profiles, seed)
+
+def generate_shard(generator: CorpusGenerator, start: int, end: int, output_dir: str, compact: bool = False, output_format="files", compression="gzip") -> dict:
+    """
+    Write bundles [start, end) under output_dir.
+
+    :param compact: Write compact JSON instead of the indented format of generate_fhir.py
+    :param output_format: "files" for one JSON file per bundle under output_dir/<type>/,
+        "ndjson" for a single NDJSON shard output_dir/bundles-<start>.ndjson[.gz|.zst]
+    :param compression: Compression of NDJSON shards: "gzip", "zstd" or None
+    :return: The number of bundles written per bundle type
+    """
+    counts = {}
+    if output_format == "ndjson":
+        os.makedirs(output_dir, exist_ok=True)
+        with shards.ShardWriter(os.path.join(output_dir, f"bundles-{start:09d}"), compression) as shard:
+            for index in range(start, end):
+                bundle_type, fhir_json = generator.bundle(index)
+                shard.write(fhir_json)
+                counts[bundle_type] = counts.get(bundle_type, 0) + 1
+        return counts
+
+    for index in range(start, end):
+        bundle_type, fhir_json = generator.bundle(index)
+        type_dir = os.path.join(output_dir, bundle_type)
+        os.makedirs(type_dir, exist_ok=True)
+        with open(os.path.join(type_dir, f"{bundle_type}_{index:09d}.json"), "wb") as f:
+            f.write(writer.dumps(fhir_json, compact))
+        counts[bundle_type] = counts.get(bundle_type, 0) + 1
+    return counts
@@ -1,41 +1,13 @@
-import json
-import os
-from .resources import Composition, Medication, MedicationRequest, Observation, DiagnosticReport, Organization, Patient, Practitioner, Encounter, ServiceRequest, Specimen, AllergyIntolerance, Bundle, Condition, MessageHeader, Endpoint
+from .resources import Composition, Medication, MedicationRequest, Observation, DiagnosticReport, Encounter, ServiceRequest, Specimen, AllergyIntolerance, Bundle, Condition, MessageHeader
+from .shared import build_shared
 
-def generate_case(case: dict, case_index: int):
-    endpoint_url = "https://acme.example.org/fhir"
-
-    # Create Patient
-    patient = Patient(
-        id=f"patient-{case_index}",
-        identifier=f"pat-{1000+case_index}",
-        family_name=case["patient_family_name"],
-        given_name=case["patient_name"],
-        gender=case["patient_gender"],
-        state=case["patient_state"],
-        city=case["patient_city"],
-        postalCode=case["patient_postalcode"],
-        address=case["patient_address"],
-        telecom=case["patient_phone"],
-        birthDate=case["patient_birthdate"]
-    )
-
-    # Create Practitioner
-    doctor = Practitioner(
-        id=f"doctor-{case_index}",
-        identifier=f"doc-{2000+case_index}",
-        family_name=case["doctor_family_name"],
-        given_name=case["doctor_name"],
-        gender=case["doctor_gender"],
-        state=case["doctor_state"],
-        city=case["doctor_city"],
-        postalCode=case["doctor_postalcode"],
-        address=case["doctor_address"],
-        telecom=case["doctor_phone"]
-    )
-
-    # Endpoint
-    endpoint = Endpoint(id=f"endpoint-{case_index}", endpoint=endpoint_url)
+def generate_case(case: dict, case_index: int, shared: dict = None):
+    # Patient, Practitioner, Endpoint and Organization are shared by the bundles of a case
+    if shared is None:
+        shared = build_shared(case, case_index)
+    patient = shared["patient"]
+    doctor = shared["doctor"]
+    endpoint = shared["endpoint"]
 
     # MedicationRequest
     medication_request = MedicationRequest(
@@ -91,35 +63,3 @@ def generate_case(case: dict, case_index: int):
     bundle.add_entry(entry_list)
 
     return bundle
-
-def main():
-    with open(os.path.join("config", "config.json"), "r") as f:
-        config = json.load(f)
-
-    if not isinstance(config, list):
-        print("Error: config.json must contain a JSON array.")
-        return
-
-    if not config:
-        print("Error: config.json array is empty.")
-        return
-
-    for i, case in enumerate(config, start=1):
-        print(f"Processing Case {i}: {case.get('patient_name', 'Unnamed')} {case.get('patient_family_name','')}")
-        bundle = generate_case(case, i)
-
-        # Serialize
-        fhir_json = bundle.to_fhir_json()
-        fhir_json = json.dumps(fhir_json, indent=4)
-
-        # Write to per-case output_dir
-        output_dir = os.path.join("output", "medical_prescription")
-        output_file = os.path.join(output_dir, f"medical_prescription_{case["output_dir"]}.json")
-        os.makedirs(output_dir, exist_ok=True)
-        with open(output_file, "w") as f:
-            f.write(fhir_json)
-
-    print("All cases generated.")
-
-if __name__ == '__main__':
-    main()
@@ -0,0 +1,81 @@
+import json
+import os
+from datetime import datetime
+from multiprocessing import Pool
+from . import resources, writer, create_appointment, create_exam_request, create_exam_result, create_medical_prescription
+from .shared import build_shared
+
+# Builders of each bundle type, all taking a config.json-shaped case
+GENERATORS = {
+    "appointment": create_appointment.generate_case,
+    "exam_request": create_exam_request.generate_case,
+    "exam_result": create_exam_result.generate_case,
+    "medical_prescription": create_medical_prescription.generate_case
+}
+# Timestamp of seeded bundles whose case has no slot_start_time
+SEEDED_NOW = datetime(2025, 1, 1)
+
+def case_now(case: dict) -> datetime:
+    """Fixed timestamp of a seeded case: its slot start, like the corpus generator uses."""
+    start = case.get("slot_start_time")
+    return datetime.strptime(start, "%Y-%m-%dT%H:%M:%SZ") if start else SEEDED_NOW
+
+def load_cases(config_path: str) -> list:
+    with open(config_path, "r") as f:
+        config = json.load(f)
+    if not isinstance(config, list) or not config:
+        raise ValueError(f"{config_path} must contain a non-empty JSON array")
+    return config
+
+def build_bundles(case: dict, case_index: int, bundle_types: list, seed=None) -> dict:
+    """
+    Build every requested bundle type of a case from a single set of shared resources.
+
+    :param seed: Optional seed, each (type, case) bundle is then reproducible on its own
+    :return: The FHIR JSON of each bundle, by bundle type
+    """
+    shared = build_shared(case, case_index)
+    bundles = {}
+    for bundle_type in bundle_types:
+        if seed is not None:
+            resources.seed(f"{seed}:{bundle_type}:{case_index}", now=case_now(case))
+        bundles[bundle_type] = GENERATORS[bundle_type](case, case_index, shared).to_fhir_json()
+    return bundles
+
+def write_case(task) -> list:
+    case_index, case, bundle_types, output_dir, seed = task
+    for bundle_type, fhir_json in build_bundles(case, case_index, bundle_types, seed).items():
+        type_dir = os.path.join(output_dir, bundle_type)
+        os.makedirs(type_dir, exist_ok=True)
+        with open(os.path.join(type_dir, f"{bundle_type}_{case['output_dir']}.json"), "wb") as f:
+            f.write(writer.dumps(fhir_json))
+    return bundle_types
+
+def generate(config_path=os.path.join("config", "config.json"), output_dir="output", bundle_types=None, workers=1, seed=None) -> dict:
+    """
+    Generate the bundles of every case of config.json in a single pass.
+
+    The config is read once and each case builds its shared resources once for
+    all the bundle types. With several workers, cases are spread across processes.
+
+    :param bundle_types: Bundle types to generate, all of GENERATORS by default
+    :param workers: Number of worker processes
+    :param seed: Optional seed making the output reproducible
+    :return: The number of bundles written per bundle type
+    """
+    bundle_types = list(bundle_types or GENERATORS)
+    for bundle_type in bundle_types:
+        if bundle_type not in GENERATORS:
+            raise ValueError(f"Unknown bundle type '{bundle_type}', expected one of {list(GENERATORS)}")
+
+    tasks = [(i, case, bundle_types, output_dir, seed) for i, case in enumerate(load_cases(config_path), start=1)]
+    counts = dict.fromkeys(bundle_types, 0)
+    if workers > 1:
+        with Pool(workers) as pool:
+            written = list(pool.imap_unordered(write_case, tasks))
+    else:
+        written = [write_case(task) for task in tasks]
+    for types in written:
+        for bundle_type in types:
+            counts[bundle_type] += 1
+    return counts
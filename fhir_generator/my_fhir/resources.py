@@ -1,13 +1,149 @@
-from random import randint
+from random import Random
 import uuid
 from datetime import datetime
 
+# Random source shared by every resource (identifiers, priorities, durations, default ids)
+rng = Random()
+# Timestamp returned by now() while seeded, None to use the wall clock
+fixed_now = None
+
+def seed(value, now=None):
+    """
+    Make generated resources reproducible.
+
+    :param value: Seed for the shared random source (int or str)
+    :param now: Optional datetime used for every generated timestamp
+    """
+    global fixed_now
+    rng.seed(value)
+    fixed_now = now
+
+def now():
+    return fixed_now if fixed_now is not None else datetime.now()
+
+def randint(a, b):
+    return rng.randint(a, b)
+
+# Constant sub-structures shared by every serialized resource, built once at import.
+# They are referenced (not copied) by to_fhir_json, so callers must not mutate them.
+APPOINTMENT_SERVICE_CATEGORY = [
+    {
+        "coding": [
+            {
+                "system": "http://example.org/service-category",
+                "code": "gp",
+                "display": "General Practice"
+            }
+        ]
+    }
+]
+APPOINTMENT_SPECIALTY = [
+    {
+        "coding": [
+            {
+                "system": "http://snomed.info/sct",
+                "code": "394814009",
+                "display": "General Practice"
+            }
+        ]
+    }
+]
+APPOINTMENT_REASON_CODE = [
+    {
+        "coding": [
+            {
+                "system": "http://snomed.info/sct",
+                "code": "413095006"
+            }
+        ],
+        "text": "Clinical Review"
+    }
+]
+PATIENT_IDENTIFIER_TYPE = {
+    "coding": [
+        {
+            "system": "http://terminology.hl7.org/CodeSystem/v2-0203",
+            "code": "MR"
+        }
+    ]
+}
+PATIENT_IDENTIFIER_PERIOD = {"start": "2001-05-06"}
+PATIENT_IDENTIFIER_ASSIGNER = {"display": "Acme Healthcare"}
+LOCATION_POSITION = [
+    {
+        "longitude": -83.6945691,
+        "latitude": 42.25475478,
+        "altitude": 0
+    }
+]
+LOCATION_CHARACTERISTIC = [
+    {
+        "coding": [
+            {
+                "system": "http://hl7.org/fhir/location-characteristic",
+                "code": "wheelchair",
+                "display": "Wheelchair accessible"
+            }
+        ]
+    }
+]
+ENDPOINT_CONNECTION_TYPE = {
+    "system": "http://terminology.hl7.org/CodeSystem/endpoint-connection-type",
+    "code": "hl7-fhir-rest"
+}
+CONDITION_SEVERITY = {
+    "coding": [
+        {
+            "system": "http://snomed.info/sct",
+            "code": "44054006",
+            "display": "Severe"
+        }
+    ],
+    "text": "Type 2 Diabetes"
+}
+CONDITION_CATEGORY = {
+    "coding": [
+        {
+            "system": "http://snomed.info/pathologytype",
+            "code": "394577000",
+            "display": "Main condition"
+        }
+    ],
+    "text": "Type 2 Diabetes"
+}
+SERVICE_REQUEST_QUANTITY = {"value": 1}
+COMPOSITION_CODE = {
+    "coding": [
+        {
+        "system" : "http://loinc.org",
+        "code" : "57833-6",
+        "display" : "Prescription for medication"
+        },
+        {
+        "system" : "http://snomed.info/sct",
+        "code" : "761938008",
+        "display" : "Medicinal prescription record (record artifact)"
+        }
+    ],
+}
+COMPOSITION_SECTION_CODE = {
+    "coding" : [
+        {
+        "system" : "http://loinc.org",
+        "code" : "57828-6",
+        "display" : "Prescription list"
+        }
+    ]
+}
+
 class Resource:
     """Base class for all FHIR resources."""
 
+    __slots__ = ("resourceType", "id", "full_url")
+
     def __init__(self, id=""):
         if id == "":
-            id = uuid.uuid4()
+            id = uuid.UUID(int=rng.getrandbits(128), version=4)
         self.id = id
         self.full_url = f"{self.resourceType}/{self.id}"
 
@@ -23,6 +159,8 @@ class Resource:
         return self.to_dict()
 
 class MessageHeader(Resource):
+    __slots__ = ("source", "source_endpoint", "eventCoding", "focus")
+
     def __init__(self, id="", source="", source_endpoint="", eventCoding=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -48,6 +186,8 @@ class MessageHeader(Resource):
         return fhir_data
 
 class Appointment(Resource):
+    __slots__ = ("identifier", "type", "type_desc", "description", "participant", "slot_reference")
+
     def __init__(self, id="", type="", type_desc="", description="", slot_reference=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -73,28 +213,8 @@ class Appointment(Resource):
     def to_fhir_json(self):
         fhir_data = super().to_fhir_json()
         fhir_data["status"] = "proposed"
-        fhir_data["serviceCategory"] = [
-            {
-                "coding": [
-                    {
-                        "system": "http://example.org/service-category",
-                        "code": "gp",
-                        "display": "General Practice"
-                    }
-                ]
-            }
-        ]
-        fhir_data["specialty"] = [
-            {
-                "coding": [
-                    {
-                        "system": "http://snomed.info/sct",
-                        "code": "394814009",
-                        "display": "General Practice"
-                    }
-                ]
-            }
-        ]
+        fhir_data["serviceCategory"] = APPOINTMENT_SERVICE_CATEGORY
+        fhir_data["specialty"] = APPOINTMENT_SPECIALTY
         fhir_data["appointmentType"] = [
             {
                 "coding": [
@@ -106,17 +226,7 @@ class Appointment(Resource):
                 ]
             }
         ]
-        fhir_data["reasonCode"] = [
-            {
-                "coding": [
-                    {
-                        "system": "http://snomed.info/sct",
-                        "code": "413095006"
-                    }
-                ],
-                "text": "Clinical Review"
-            }
-        ]
+        fhir_data["reasonCode"] = APPOINTMENT_REASON_CODE
         fhir_data["priority"] = randint(1, 10)
         fhir_data["description"] = self.description
         fhir_data["minutesDuration"] = randint(10, 60)
@@ -130,6 +240,8 @@ class Appointment(Resource):
         return fhir_data
 
 class Practitioner(Resource):
+    __slots__ = ("gender", "family_name", "given_name", "identifier", "address", "telecom", "state", "city", "postalCode")
+
     def __init__(self, id="", identifier="", family_name="", given_name="", gender="", state = "", city="", postalCode = "", address="", telecom=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -181,6 +293,8 @@ class Practitioner(Resource):
         return fhir_data
 
 class Patient(Resource):
+    __slots__ = ("family_name", "given_name", "birthDate", "gender", "address", "telecom", "identifier", "state", "city", "postalCode")
+
     def __init__(self, id="", identifier="", family_name="", given_name="", gender="", state = "", city="", postalCode = "", address="", telecom="", birthDate=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -232,27 +346,18 @@ class Patient(Resource):
         fhir_data["identifier"] = [
             {
                 "use": "usual",
-                "type": {
-                    "coding": [
-                        {
-                            "system": "http://terminology.hl7.org/CodeSystem/v2-0203",
-                            "code": "MR"
-                        }
-                    ]
-                },
+                "type": PATIENT_IDENTIFIER_TYPE,
                 "system": "urn:oid:1.2.36.146.595.217.0.1",
                 "value": self.identifier,
-                "period": {
-                    "start": "2001-05-06"
-                },
-                "assigner": {
-                    "display": "Acme Healthcare"
-                }
+                "period": PATIENT_IDENTIFIER_PERIOD,
+                "assigner": PATIENT_IDENTIFIER_ASSIGNER
             }
         ]
         return fhir_data
 
 class Location(Resource):
+    __slots__ = ("address", "name", "telecom", "email", "state", "city", "postalCode", "organization_reference")
+
     def __init__(self, id="", name="", telecom="", email="", address="", state = "", city="", postalCode = ""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -270,7 +375,8 @@ class Location(Resource):
         
     def to_fhir_json(self):
         fhir_data = super().to_fhir_json()
-        fhir_data["address"] = self.address
+        # Keys are set in the order of the original output
+        fhir_data["address"] = None
         fhir_data['active']="true"
         fhir_data["telecom"] = [
             {
@@ -298,33 +404,18 @@ class Location(Resource):
             }
         ]
         fhir_data["name"] = self.name
-        fhir_data['position'] ={
-            "longitude": -83.6945691,
-            "latitude": 42.25475478,
-            "altitude": 0
-        },
-        fhir_data['managingOrganization'] = {
-            "reference": "Organization/example"
-        },
-        fhir_data['characteristic'] = [
-            {
-                "coding": [
-                    {
-                        "system": "http://hl7.org/fhir/location-characteristic",
-                        "code": "wheelchair",
-                        "display": "Wheelchair accessible"
-                    }
-                ]
-            }
-        ]
+        fhir_data['position'] = LOCATION_POSITION
         fhir_data["managingOrganization"] = [
             {
                 "reference": self.organization_reference
             }
         ]
+        fhir_data['characteristic'] = LOCATION_CHARACTERISTIC
         return fhir_data
 
 class Slot(Resource):
+    __slots__ = ("start", "end", "specialty", "schedule_reference")
+
     def __init__(self, id="", start="", end="", specialty="", schedule=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -355,6 +446,8 @@ class Slot(Resource):
         return fhir_data
 
 class Organization(Resource):
+    __slots__ = ("name", "endpoint_reference")
+
     def __init__(self, id="", name="", endpoint=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -371,6 +464,8 @@ class Organization(Resource):
         return fhir_data
 
 class Endpoint(Resource):
+    __slots__ = ("endpoint",)
+
     def __init__(self, id="", endpoint=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -379,15 +474,14 @@ class Endpoint(Resource):
     def to_fhir_json(self):
         fhir_data = super().to_fhir_json()
         fhir_data["status"] = "active"
-        fhir_data['connectionType'] = {
-            "system": "http://terminology.hl7.org/CodeSystem/endpoint-connection-type",
-            "code": "hl7-fhir-rest"
-        }
+        fhir_data['connectionType'] = ENDPOINT_CONNECTION_TYPE
         fhir_data["address"] = "https://acme.example.org/fhir"
 
         return fhir_data
 
 class Schedule(Resource):
+    __slots__ = ("description", "start", "end", "actors")
+
     def __init__(self, id="", description="", start="", end=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -423,6 +517,8 @@ class Schedule(Resource):
         return fhir_data
 
 class Bundle(Resource):
+    __slots__ = ("type", "entry")
+
     def __init__(self, id="", type="message"):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -432,18 +528,23 @@ class Bundle(Resource):
     def to_fhir_json(self):
         fhir_data = super().to_fhir_json()
         fhir_data["type"] = self.type
-        fhir_data["timestamp"] = datetime.now().isoformat()
-        fhir_data["entry"] = self.entry
+        fhir_data["timestamp"] = now().isoformat()
+        fhir_data["entry"] = [
+            {
+                "fullUrl": entry.full_url,
+                "resource": entry.to_fhir_json()
+            }
+            for entry in self.entry
+        ]
         return fhir_data
     
     def add_entry(self, entry_list:list[Resource]):
-        for entry in entry_list:
-            self.entry.append({
-                "fullUrl": entry.full_url,
-                "resource": entry.to_fhir_json()
-            })
+        # Entries are serialized when the bundle is, not when they are added
+        self.entry.extend(entry_list)
                  
 class Encounter(Resource):
+    __slots__ = ("status", "subject_reference", "condition_reference", "basedOn")
+
     def __init__(self, id="", status="planned", subject_reference="", condition_reference="",):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -473,6 +574,8 @@ class Encounter(Resource):
         return fhir_data
 
 class Condition(Resource):
+    __slots__ = ("identifier", "clinicalStatus", "subject_reference", "pathology")
+
     def __init__(self, id="", identifier="", clinicalStatus="active", subject_reference="", pathology="Type 2 Diabetes"):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -493,26 +596,8 @@ class Condition(Resource):
         fhir_data["subject"] = {
             "reference": self.subject_reference
         }
-        fhir_data["severity"] = {
-                "coding": [
-                    {
-                        "system": "http://snomed.info/sct",
-                        "code": "44054006",
-                        "display": "Severe"
-                    }
-                ],
-                "text": "Type 2 Diabetes"
-        }
-        fhir_data["category"] = {
-                "coding": [
-                    {
-                        "system": "http://snomed.info/pathologytype",
-                        "code": "394577000",
-                        "display": "Main condition"
-                    }
-                ],
-                "text": "Type 2 Diabetes"
-        }
+        fhir_data["severity"] = CONDITION_SEVERITY
+        fhir_data["category"] = CONDITION_CATEGORY
         fhir_data["code"] = {
                 "coding": [
                     {
@@ -526,6 +611,8 @@ class Condition(Resource):
         return fhir_data
 
 class ServiceRequest(Resource):
+    __slots__ = ("identifier", "status", "intent", "subject_reference", "encounter_reference", "specimen_reference", "doctor_reference", "organization_reference", "exam_code", "exam_description")
+
     def __init__(self, id="", identifier="", status="active", intent="order", subject_reference="", encounter_reference="", organization_reference="", doctor_reference="", specimen_reference="", exam_code="", exam_description=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -574,13 +661,13 @@ class ServiceRequest(Resource):
                     }
                 ]
         }
-        fhir_data["quantityQuantity"] = {
-            "value": 1
-        }
+        fhir_data["quantityQuantity"] = SERVICE_REQUEST_QUANTITY
 
         return fhir_data
 
 class Specimen(Resource):
+    __slots__ = ("identifier", "subject_reference", "specimen_code", "specimen_description")
+
     def __init__(self, id="", identifier="", subject_reference="", specimen_code="", specimen_description=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -610,12 +697,14 @@ class Specimen(Resource):
                 ]
         }
         fhir_data["collection"] = {
-                "collectedDateTime": datetime.now().isoformat()
+                "collectedDateTime": now().isoformat()
         }
 
         return fhir_data
 
 class AllergyIntolerance(Resource):
+    __slots__ = ("substance_code", "substance_description", "allergen_reaction", "subject_reference")
+
     def __init__(self, id="", substance_code="", substance_description="", allergen_reaction="", subject_reference=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -649,6 +738,8 @@ class AllergyIntolerance(Resource):
         return fhir_data
     
 class DiagnosticReport(Resource):
+    __slots__ = ("identifier", "status", "subject_reference", "encounter_reference", "performer_reference", "result")
+
     def __init__(self, id="", identifier="", status="final", subject_reference="", encounter_reference="", organization_reference=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -681,6 +772,8 @@ class DiagnosticReport(Resource):
         return fhir_data
     
 class Observation(Resource):
+    __slots__ = ("status", "subject_reference", "performer_reference", "effectiveDateTime", "value", "value_unit", "value_code", "value_display", "result_code", "result_display")
+
     def __init__(self,id="",status="final",subject_reference="",performer_reference="",effectiveDateTime="",value=0.0,value_unit="",value_code="",value_display="",result_code="",result_display=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -725,6 +818,8 @@ class Observation(Resource):
         return fhir_data
 
 class Composition(Resource):
+    __slots__ = ("identifier", "subject_reference", "doctor_reference", "date", "status", "medication_request_reference")
+
     def __init__(self,id="", identifier="", status="final",subject_reference="",doctor_reference="",date="",medication_request_reference=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -744,20 +839,7 @@ class Composition(Resource):
                 "value": self.identifier
             }
         ]
-        fhir_data["code"] = {
-            "coding": [
-                {
-                "system" : "http://loinc.org",
-                "code" : "57833-6",
-                "display" : "Prescription for medication"
-                },
-                {
-                "system" : "http://snomed.info/sct",
-                "code" : "761938008",
-                "display" : "Medicinal prescription record (record artifact)"
-                }
-            ],
-        }
+        fhir_data["code"] = COMPOSITION_CODE
         fhir_data["subject"] = {
             "reference": self.subject_reference,
         }
@@ -767,15 +849,7 @@ class Composition(Resource):
         fhir_data["date"] = self.date
         fhir_data["section"] = [
             {
-                "code" : {
-                    "coding" : [
-                        {
-                        "system" : "http://loinc.org",
-                        "code" : "57828-6",
-                        "display" : "Prescription list"
-                        }
-                    ]
-                },
+                "code" : COMPOSITION_SECTION_CODE,
                 "entry" : [
                     {
                         "reference" : self.medication_request_reference
@@ -787,6 +861,8 @@ class Composition(Resource):
         return fhir_data
 
 class MedicationRequest(Resource):
+    __slots__ = ("status", "intent", "subject_reference", "performer_reference", "medication", "dosage_frequency", "dosage_period", "dosage_unit", "dosage_method", "dosage_description")
+
     def __init__(self,id="",status="active", intent="order",subject_reference="",performer_reference="",dosage_frequency=1,dosage_period=1,dosage_unit="d",dosage_method="Oral",dosage_description=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
@@ -802,13 +878,13 @@ class MedicationRequest(Resource):
         self.dosage_description = dosage_description
         
     def add_medication(self, resource:Resource):
-        self.medication.append(resource.to_fhir_json())
+        self.medication.append(resource)
 
     def to_fhir_json(self):
         fhir_data = super().to_fhir_json()
         fhir_data["status"] = self.status
         fhir_data["intent"] = self.intent
-        fhir_data["medication"] = self.medication
+        fhir_data["medication"] = [medication.to_fhir_json() for medication in self.medication]
         fhir_data["subject"] = {
             "reference": self.subject_reference,
         }
@@ -840,6 +916,8 @@ class MedicationRequest(Resource):
         return fhir_data
     
 class Medication(Resource):
+    __slots__ = ("medication_code", "medication_description", "amount_value", "amount_unit", "denominator_value", "denominator_unit")
+
     def __init__(self,id="",medication_code="",medication_description="",amount_value=0.0,amount_unit="",denominator_value=1,denominator_unit=""):
         self.resourceType = __class__.__name__
         super().__init__(id)
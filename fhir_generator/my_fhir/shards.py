@@ -0,0 +1,142 @@
+import gzip
+import io
+import json
+import os
+import struct
+from . import writer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# A shard is a sequence of independently compressed blocks of NDJSON lines.
+# The .idx file next to it holds one entry per bundle, in order:
+#   (offset of the compressed block, offset of the line inside the block, line length)
+# so any bundle can be read by decompressing a single block.
+INDEX_ENTRY = struct.Struct("<QQQ")
+EXTENSIONS = {None: ".ndjson", "gzip": ".ndjson.gz", "zstd": ".ndjson.zst"}
+BLOCK_RECORDS = 64
+
+def compression_of(path: str):
+    for compression, extension in EXTENSIONS.items():
+        if compression is not None and path.endswith(extension):
+            return compression
+    return None
+
+def is_shard(path: str) -> bool:
+    return any(path.endswith(extension) for extension in EXTENSIONS.values())
+
+def compress(data: bytes, compression) -> bytes:
+    if compression == "gzip":
+        # mtime=0 keeps the output byte-identical between runs
+        return gzip.compress(data, mtime=0)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+def decompress(data: bytes, compression) -> bytes:
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+class ShardWriter:
+    """Writes bundles as one compressed NDJSON shard plus its offset index."""
+
+    def __init__(self, path: str, compression="gzip", block_records=BLOCK_RECORDS):
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unsupported compression '{compression}', expected one of {list(EXTENSIONS)}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the 'zstandard' package")
+        self.path = path + EXTENSIONS[compression]
+        self.compression = compression
+        self.block_records = block_records
+        self.data = open(self.path, "wb")
+        self.index = open(self.path + ".idx", "wb")
+        self.block = []
+        self.count = 0
+
+    def write(self, fhir_json: dict):
+        self.block.append(writer.dumps(fhir_json, compact=True) + b"\n")
+        self.count += 1
+        if len(self.block) >= self.block_records:
+            self.flush()
+
+    def flush(self):
+        if not self.block:
+            return
+        offset = self.data.tell()
+        inner = 0
+        for line in self.block:
+            self.index.write(INDEX_ENTRY.pack(offset, inner, len(line)))
+            inner += len(line)
+        self.data.write(compress(b"".join(self.block), self.compression))
+        self.block = []
+
+    def close(self) -> int:
+        self.flush()
+        self.data.close()
+        self.index.close()
+        return self.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_shard(path: str):
+    """
+    Stream the bundles of a shard one at a time, without loading the whole file.
+
+    :param path: Path of the .ndjson, .ndjson.gz or .ndjson.zst shard
+    :return: A generator of bundle dicts
+    """
+    compression = compression_of(path)
+    with open(path, "rb") as raw:
+        if compression == "gzip":
+            stream = gzip.GzipFile(fileobj=raw)
+        elif compression == "zstd":
+            if zstandard is None:
+                raise ValueError("Reading zstd shards requires the 'zstandard' package")
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        else:
+            stream = raw
+        for line in io.BufferedReader(stream):
+            if line.strip():
+                yield json.loads(line)
+
+def read_bundle(path: str, position: int) -> dict:
+    """
+    Read a single bundle through the shard index.
+
+    :param path: Path of the shard
+    :param position: Position of the bundle inside the shard, starting at 0
+    :return: The bundle dict
+    """
+    compression = compression_of(path)
+    with open(path + ".idx", "rb") as index:
+        index.seek(position * INDEX_ENTRY.size)
+        entry = index.read(INDEX_ENTRY.size)
+        if len(entry) < INDEX_ENTRY.size:
+            raise IndexError(f"{path} has no bundle at position {position}")
+        offset, inner, length = INDEX_ENTRY.unpack(entry)
+        # The block ends where the next block starts, or at the end of the shard
+        end = None
+        while True:
+            entry = index.read(INDEX_ENTRY.size)
+            if len(entry) < INDEX_ENTRY.size:
+                break
+            next_offset = INDEX_ENTRY.unpack(entry)[0]
+            if next_offset != offset:
+                end = next_offset
+                break
+    with open(path, "rb") as f:
+        f.seek(offset)
+        block = f.read(end - offset if end is not None else -1)
+    return json.loads(decompress(block, compression)[inner:inner + length])
+
+def shard_count(path: str) -> int:
+    return os.path.getsize(path + ".idx") // INDEX_ENTRY.size
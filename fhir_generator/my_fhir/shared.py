@@ -0,0 +1,55 @@
+from .resources import Patient, Practitioner, Endpoint, Organization
+
+ENDPOINT_URL = "https://acme.example.org/fhir"
+
+def build_shared(case: dict, case_index: int) -> dict:
+    """
+    Build the resources every bundle type of a case refers to.
+
+    They are only read when the bundles are serialized, so one set can be
+    shared by all the bundles generated from the same case.
+
+    Patients and doctors drawn from a corpus population keep the id of their
+    population number in every bundle they appear in, the people of config.json
+    cases are numbered by case. The other resources belong to the case.
+
+    :return: A dict with the "patient", "doctor", "endpoint" and "organization" resources
+    """
+    patient_number = case.get("patient_number", case_index)
+    doctor_number = case.get("doctor_number", case_index)
+    patient = Patient(
+        id=f"patient-{patient_number}",
+        identifier=f"pat-{1000+patient_number}",
+        family_name=case["patient_family_name"],
+        given_name=case["patient_name"],
+        gender=case["patient_gender"],
+        state=case["patient_state"],
+        city=case["patient_city"],
+        postalCode=case["patient_postalcode"],
+        address=case["patient_address"],
+        telecom=case["patient_phone"],
+        birthDate=case["patient_birthdate"]
+    )
+
+    doctor = Practitioner(
+        id=f"doctor-{doctor_number}",
+        identifier=f"doc-{2000+doctor_number}",
+        family_name=case["doctor_family_name"],
+        given_name=case["doctor_name"],
+        gender=case["doctor_gender"],
+        state=case["doctor_state"],
+        city=case["doctor_city"],
+        postalCode=case["doctor_postalcode"],
+        address=case["doctor_address"],
+        telecom=case["doctor_phone"]
+    )
+
+    endpoint = Endpoint(id=f"endpoint-{case_index}", endpoint=ENDPOINT_URL)
+
+    organization = Organization(
+        id=f"hospital-{case_index}",
+        name=case["organization_name"],
+        endpoint=endpoint.full_url
+    )
+
+    return {"patient": patient, "doctor": doctor, "endpoint": endpoint, "organization": organization}
@@ -0,0 +1,20 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(fhir_json: dict, compact: bool = False) -> bytes:
+    """
+    Serialize a FHIR resource to UTF-8 JSON.
+
+    :param fhir_json: The resource as returned by to_fhir_json
+    :param compact: Write without whitespace, using orjson when it is installed
+    :return: The encoded JSON document
+    """
+    if not compact:
+        return json.dumps(fhir_json, indent=4).encode("utf-8")
+    if orjson is not None:
+        return orjson.dumps(fhir_json)
+    return json.dumps(fhir_json, separators=(",", ":")).encode("utf-8")
@@ -0,0 +1,16 @@
+import os
+import sys
+import pytest
+
+# The scripts import the generator as my_fhir from the fhir_generator directory
+FHIR_GENERATOR_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, FHIR_GENERATOR_DIR)
+
+from my_fhir.corpus import load_generator
+
+CONFIG_DIR = os.path.join(FHIR_GENERATOR_DIR, "config")
+
+@pytest.fixture
+def generator():
+    """Corpus generator on the shipped distributions and profiles, seed 7."""
+    return load_generator(os.path.join(CONFIG_DIR, "corpus.json"), os.path.join(CONFIG_DIR, "config.json"), 7)
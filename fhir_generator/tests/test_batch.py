@@ -0,0 +1,46 @@
+import pytest
+from my_fhir import batch, writer
+
+@pytest.fixture
+def payloads(generator):
+    return [(f"bundle-{index}", generator.bundle(index)[1]) for index in range(7)]
+
+def test_bundles_are_packed_by_count(payloads):
+    packed = list(batch.pack(payloads, 3, batch_type="transaction"))
+    assert [len(names) for names, _ in packed] == [3, 3, 1]
+    assert [name for names, _ in packed for name in names] == [name for name, _ in payloads]
+    for names, bundle in packed:
+        assert bundle["resourceType"] == "Bundle" and bundle["type"] == "transaction"
+        assert all(entry["request"] == {"method": "POST", "url": "$process-message"} for entry in bundle["entry"])
+
+def test_batches_stay_under_the_byte_limit(payloads):
+    max_bytes = 2 * max(len(writer.dumps(batch.batch_entry(payload, "bundles"), compact=True)) for _, payload in payloads)
+    packed = list(batch.pack(payloads, 100, max_bytes))
+    assert len(packed) > 1
+    assert sum(len(names) for names, _ in packed) == len(payloads)
+    for _, bundle in packed:
+        entries = sum(len(writer.dumps(entry, compact=True)) + 1 for entry in bundle["entry"])
+        assert entries <= max_bytes
+
+def test_an_entry_over_the_limit_goes_alone(payloads):
+    packed = list(batch.pack(payloads[:3], 10, max_bytes=10))
+    assert [len(names) for names, _ in packed] == [1, 1, 1]
+
+def test_entries_unit_keeps_resource_ids(payloads):
+    names, bundle = next(batch.pack(payloads[:1], 1000, unit="entries"))
+    resources = [entry["resource"] for entry in payloads[0][1]["entry"]]
+    assert names == [f"bundle-0:{entry['fullUrl']}" for entry in payloads[0][1]["entry"]]
+    assert [entry["request"] for entry in bundle["entry"]] == [
+        {"method": "PUT", "url": f"{resource['resourceType']}/{resource['id']}"} for resource in resources
+    ]
+
+def test_responses_are_matched_to_the_packed_entries():
+    response = {"entry": [{"response": {"status": "201 Created"}}, {"response": {"status": "400 Bad Request"}}]}
+    assert [status for _, status, _ in batch.unpack(["a", "b"], response)] == ["201 Created", "400 Bad Request"]
+    with pytest.raises(ValueError):
+        batch.unpack(["a"], response)
+
+@pytest.mark.parametrize("options", [{"batch_type": "history"}, {"unit": "files"}])
+def test_unknown_options_are_refused(payloads, options):
+    with pytest.raises(ValueError):
+        list(batch.pack(payloads, 3, **options))
@@ -0,0 +1,49 @@
+import os
+from my_fhir import writer
+from my_fhir.corpus import load_generator, generate_shard
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config")
+
+def make_generator(seed=7, **params):
+    generator = load_generator(os.path.join(CONFIG_DIR, "corpus.json"), os.path.join(CONFIG_DIR, "config.json"), seed)
+    generator.params.update(params)
+    return generator
+
+def resources_of(fhir_json, resource_type):
+    return [entry["resource"] for entry in fhir_json["entry"] if entry["resource"]["resourceType"] == resource_type]
+
+def test_bundles_depend_only_on_the_seed_and_index():
+    first, second = make_generator(), make_generator()
+    # Drawing other bundles in between changes nothing
+    second.bundle(5)
+    assert writer.dumps(first.bundle(3)[1], True) == writer.dumps(second.bundle(3)[1], True)
+    assert writer.dumps(make_generator(seed=8).bundle(3)[1], True) != writer.dumps(first.bundle(3)[1], True)
+
+def test_shards_do_not_depend_on_how_the_range_is_split(tmp_path):
+    generator = make_generator()
+    whole = generate_shard(generator, 0, 6, str(tmp_path / "whole"))
+    generate_shard(generator, 0, 2, str(tmp_path / "split"))
+    generate_shard(generator, 2, 6, str(tmp_path / "split"))
+    assert sum(whole.values()) == 6
+    for bundle_type in whole:
+        for name in os.listdir(tmp_path / "whole" / bundle_type):
+            assert (tmp_path / "whole" / bundle_type / name).read_bytes() == (tmp_path / "split" / bundle_type / name).read_bytes()
+
+def test_people_keep_their_ids_across_bundles():
+    generator = make_generator(patient_population=1, doctor_population=1)
+    bundles = [generator.bundle(index)[1] for index in range(4)]
+    patients = [resources_of(bundle, "Patient")[0] for bundle in bundles]
+    doctors = [resources_of(bundle, "Practitioner")[0] for bundle in bundles]
+    assert {patient["id"] for patient in patients} == {"patient-0"}
+    assert {patient["identifier"][0]["value"] for patient in patients} == {"pat-1000"}
+    assert {doctor["id"] for doctor in doctors} == {"doctor-0"}
+    # Per-encounter resources still belong to their bundle
+    assert len({bundle["id"] for bundle in bundles}) == 4
+
+def test_distinct_people_get_distinct_ids():
+    generator = make_generator(patient_population=3)
+    for index in range(20):
+        _, case, _ = generator.case(index)
+        patient = resources_of(generator.bundle(index)[1], "Patient")[0]
+        assert patient["id"] == f"patient-{case['patient_number']}"
+        assert patient["name"][0]["family"] == case["patient_family_name"]
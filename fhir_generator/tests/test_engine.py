@@ -0,0 +1,34 @@
+import os
+import pytest
+from my_fhir.engine import GENERATORS, build_bundles, generate, load_cases
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config", "config.json")
+
+def resource(bundle, resource_type):
+    return next(entry["resource"] for entry in bundle["entry"] if entry["resource"]["resourceType"] == resource_type)
+
+def test_every_bundle_type_shares_the_case_resources():
+    case = load_cases(CONFIG)[0]
+    bundles = build_bundles(case, 1, list(GENERATORS), seed="s")
+    assert set(bundles) == set(GENERATORS)
+    patients = [resource(bundle, "Patient") for bundle in bundles.values()]
+    assert all(patient == patients[0] for patient in patients)
+    assert patients[0]["id"] == "patient-1"
+
+def test_seeded_bundles_are_reproducible_and_dated_from_the_slot():
+    case = load_cases(CONFIG)[0]
+    first = build_bundles(case, 1, ["appointment", "exam_result"], seed="s")
+    assert build_bundles(case, 1, ["exam_result"], seed="s")["exam_result"] == first["exam_result"]
+    assert first["appointment"]["timestamp"].startswith(case["slot_start_time"][:10])
+
+def test_parallel_generation_writes_the_same_files(tmp_path):
+    serial = generate(CONFIG, str(tmp_path / "serial"), seed="s")
+    parallel = generate(CONFIG, str(tmp_path / "parallel"), workers=2, seed="s")
+    assert serial == parallel == dict.fromkeys(GENERATORS, len(load_cases(CONFIG)))
+    for bundle_type in GENERATORS:
+        for name in os.listdir(tmp_path / "serial" / bundle_type):
+            assert (tmp_path / "serial" / bundle_type / name).read_bytes() == (tmp_path / "parallel" / bundle_type / name).read_bytes()
+
+def test_unknown_bundle_types_are_refused(tmp_path):
+    with pytest.raises(ValueError):
+        generate(CONFIG, str(tmp_path), ["discharge"])
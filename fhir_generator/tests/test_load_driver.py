@@ -0,0 +1,103 @@
+import threading
+import time
+from load_driver import LatencyHistogram, LatencyRecorder, SUB_BUCKET_BITS, percentile, run_closed_loop, run_open_loop, find_knee, print_summary
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+class FakeClient:
+    """Answers after `delay` seconds, tracking how many requests were in flight at once."""
+
+    def __init__(self, delay=0.005, statuses=None):
+        self.delay = delay
+        self.statuses = statuses or {}
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+        self.sent = 0
+
+    def send(self, payload):
+        with self.lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            self.sent += 1
+        try:
+            time.sleep(self.delay)
+            status = self.statuses.get(payload, 200)
+            if isinstance(status, Exception):
+                raise status
+            return FakeResponse(status)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 99.9) == 100
+    assert percentile([], 99) == 0.0
+
+def test_closed_loop_keeps_concurrency_bounded(capsys):
+    client = FakeClient(statuses={3: 500, 4: ConnectionError("refused")})
+    recorder = run_closed_loop(client, iter(range(40)), concurrency=4)
+    assert client.sent == 40 and client.peak <= 4
+    summary = recorder.summary()
+    assert summary["requests"] == 40
+    assert summary["errors"] == 2 and summary["errors_by_status"] == {500: 1, "ConnectionError": 1}
+    assert summary["p50_ms"] >= client.delay * 1000 and summary["max_ms"] >= summary["p99_ms"]
+    print_summary(summary)
+    assert "Throughput" in capsys.readouterr().out
+
+def test_closed_loop_limit_and_rate():
+    client = FakeClient(delay=0)
+    recorder = run_closed_loop(client, iter(range(1000)), concurrency=2, rate=200, limit=10)
+    summary = recorder.summary()
+    assert summary["requests"] == 10
+    # 10 requests scheduled 5 ms apart
+    assert summary["elapsed_s"] >= 9 / 200
+
+def test_raw_samples_are_exported(tmp_path):
+    recorder = LatencyRecorder()
+    recorder.start = 100.0
+    recorder.record(100.5, 0.0125, 200)
+    recorder.export(str(tmp_path / "latencies.csv"))
+    assert (tmp_path / "latencies.csv").read_text().splitlines() == ["sent_at_s,latency_ms,status", "0.500000,12.500,200"]
+
+def test_histogram_buckets_bound_the_relative_error(tmp_path):
+    histogram = LatencyHistogram()
+    values = [0.000001 * v for v in (0, 1, 50, 127, 128, 1000, 12345, 999999)] + [2.5]
+    for value in values:
+        histogram.record(value)
+    assert histogram.total == len(values)
+    for value in values:
+        micros = int(value * 1_000_000)
+        bucket = max(key for key in histogram.counts if key <= micros)
+        assert micros - bucket <= max(1, micros * 2 / 2 ** SUB_BUCKET_BITS)
+
+    histogram.export(str(tmp_path / "latency.hgrm"))
+    lines = (tmp_path / "latency.hgrm").read_text().splitlines()
+    assert lines[-1].startswith("#[Max     =") and f"Total count    = {len(values):12d}" in lines[-1]
+    assert float(lines[-2].split()[1]) == 1.0
+
+def test_empty_histogram_is_exported(tmp_path):
+    LatencyHistogram().export(str(tmp_path / "latency.hgrm"))
+    assert "Total count    =            0" in (tmp_path / "latency.hgrm").read_text()
+
+def test_open_loop_counts_time_waiting_for_a_sender():
+    # 20 ms per request, arrivals every 10 ms and one sender: the backlog grows with every arrival
+    client = FakeClient(delay=0.02)
+    recorder = run_open_loop(client, iter(range(1000)), rate=100, duration=0.3, arrivals="fixed", max_in_flight=1)
+    summary = recorder.summary()
+    assert 25 <= summary["requests"] <= 30
+    assert client.peak == 1
+    # A closed-loop measurement would report about 20 ms for every request
+    assert summary["max_ms"] > 150
+
+def test_knee_is_the_first_saturated_step(capsys):
+    client = FakeClient(delay=0.02)
+    steps = find_knee(client, iter(range(10000)), [50, 200, 800], duration=0.5, arrivals="fixed", max_in_flight=2)
+    # Two senders of 20 ms requests top out at 100 req/s
+    assert [step["offered_rps"] for step in steps] == [50, 200]
+    assert [step["knee"] for step in steps] == [False, True]
@@ -0,0 +1,34 @@
+import pytest
+from my_fhir import shards
+from my_fhir.corpus import generate_shard
+
+COMPRESSIONS = [None, "gzip"] + (["zstd"] if shards.zstandard is not None else [])
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_any_bundle_is_read_through_the_index(tmp_path, generator, compression):
+    bundles = [generator.bundle(index)[1] for index in range(10)]
+    # Blocks of 3 bundles, the last one partial
+    with shards.ShardWriter(str(tmp_path / "bundles"), compression, block_records=3) as shard:
+        for bundle in bundles:
+            shard.write(bundle)
+    path = shard.path
+    assert path.endswith(shards.EXTENSIONS[compression])
+    assert shards.is_shard(path) and shards.compression_of(path) == compression
+    assert shards.shard_count(path) == 10
+    assert list(shards.read_shard(path)) == bundles
+    for position in (0, 2, 3, 7, 9):
+        assert shards.read_bundle(path, position) == bundles[position]
+    with pytest.raises(IndexError):
+        shards.read_bundle(path, 10)
+
+def test_ndjson_shards_are_reproducible(tmp_path, generator):
+    first = generate_shard(generator, 0, 5, str(tmp_path / "a"), output_format="ndjson")
+    second = generate_shard(generator, 0, 5, str(tmp_path / "b"), output_format="ndjson")
+    assert first == second and sum(first.values()) == 5
+    name = "bundles-000000000.ndjson.gz"
+    assert (tmp_path / "a" / name).read_bytes() == (tmp_path / "b" / name).read_bytes()
+    assert (tmp_path / "a" / (name + ".idx")).read_bytes() == (tmp_path / "b" / (name + ".idx")).read_bytes()
+
+def test_unknown_compression_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        shards.ShardWriter(str(tmp_path / "bundles"), "lz4")
@@ -0,0 +1,27 @@
+import json
+import pytest
+from my_fhir import writer
+
+@pytest.fixture
+def bundles(generator):
+    return [generator.bundle(index)[1] for index in range(8)]
+
+def test_compact_and_pretty_output_hold_the_same_bundle(bundles):
+    for bundle in bundles:
+        compact = writer.dumps(bundle, compact=True)
+        pretty = writer.dumps(bundle)
+        assert json.loads(compact) == json.loads(pretty) == bundle
+        assert b"\n" not in compact and b'": ' not in compact
+        assert pretty == json.dumps(bundle, indent=4).encode("utf-8")
+
+def test_stdlib_fallback_holds_the_same_bundle(bundles, monkeypatch):
+    encoded = [writer.dumps(bundle, compact=True) for bundle in bundles]
+    monkeypatch.setattr(writer, "orjson", None)
+    assert [json.loads(writer.dumps(bundle, compact=True)) for bundle in bundles] == [json.loads(data) for data in encoded]
+
+def test_serializing_does_not_alter_shared_structures(generator):
+    # to_fhir_json hands out module-level constants by reference, encoding must leave them as they were
+    first = writer.dumps(generator.bundle(0)[1], compact=True)
+    for index in range(1, 20):
+        writer.dumps(generator.bundle(index)[1], compact=True)
+    assert writer.dumps(generator.bundle(0)[1], compact=True) == first
@@ -0,0 +1,80 @@
+import argparse
+import json
+
+def load_traces(path: str) -> dict:
+    """Group the spans of a TRACE_FILE by trace id."""
+    traces = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                span = json.loads(line)
+                traces.setdefault(span["trace_id"], []).append(span)
+    return traces
+
+def duration_ms(span: dict) -> float:
+    return (span["end_ns"] - span["start_ns"]) / 1e6
+
+def critical_path(span: dict, children: dict) -> list:
+    """
+    Spans the end of `span` waited on, in order.
+
+    Walking back from the end of the span, the child that finished last is on
+    the critical path; before it started, the child that finished last before
+    that, and so on. Time not covered by any critical child is the span's own.
+
+    :return: A list of (span, depth) tuples
+    """
+    path = []
+    cursor = span["end_ns"]
+    for child in sorted(children.get(span["span_id"], []), key=lambda child: child["end_ns"], reverse=True):
+        if child["end_ns"] <= cursor:
+            path = critical_path(child, children) + path
+            cursor = child["start_ns"]
+    return [(span, 0)] + [(child, depth + 1) for child, depth in path]
+
+def roots_of(spans: list) -> list:
+    ids = {span["span_id"] for span in spans}
+    return [span for span in spans if span["parent_id"] not in ids]
+
+def print_trace(trace_id: str, spans: list):
+    children = {}
+    for span in spans:
+        children.setdefault(span["parent_id"], []).append(span)
+    roots = sorted(roots_of(spans), key=lambda span: span["start_ns"])
+    start = min(span["start_ns"] for span in spans)
+    end = max(span["end_ns"] for span in spans)
+    print(f"Trace {trace_id}: {len(spans)} spans, {(end - start) / 1e6:.1f} ms")
+    for root in roots:
+        path = critical_path(root, children)
+        for span, depth in path:
+            # Own time: the part of the span not spent in its critical children
+            critical_children = [child for child, child_depth in path if child_depth == depth + 1 and child["parent_id"] == span["span_id"]]
+            own = duration_ms(span) - sum(duration_ms(child) for child in critical_children)
+            attributes = " ".join(f"{key}={value}" for key, value in span["attributes"].items())
+            error = f" ERROR {span['error']}" if span.get("error") else ""
+            print(f"  {(span['start_ns'] - start) / 1e6:>9.1f} ms {'  ' * depth}{span['name']:<{40 - 2 * depth}} {duration_ms(span):>9.1f} ms  own {own:>8.1f} ms  {attributes}{error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the critical path of traces recorded in a TRACE_FILE.")
+    parser.add_argument("file", help="JSON lines span file written by transformer_server")
+    parser.add_argument("--trace", default=None, help="Trace id to print, the slowest traces by default")
+    parser.add_argument("--slowest", type=int, default=1, help="Number of slowest traces to print")
+    args = parser.parse_args()
+
+    traces = load_traces(args.file)
+    if args.trace:
+        if args.trace not in traces:
+            raise ValueError(f"Trace {args.trace} not found in {args.file}")
+        selected = [args.trace]
+    else:
+        def trace_duration(trace_id):
+            spans = traces[trace_id]
+            return max(span["end_ns"] for span in spans) - min(span["start_ns"] for span in spans)
+        selected = sorted(traces, key=trace_duration, reverse=True)[:args.slowest]
+
+    for trace_id in selected:
+        print_trace(trace_id, traces[trace_id])
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,81 @@
-from flask import Flask, request, jsonify
-from utils.transformer import Transformer
+import os
+from flask import Flask, Response, request, jsonify
+from utils.model_registry import ModelRegistry, DEFAULT_EMBEDDING_MODEL, EMBEDDING_MODELS, EMBEDDING_MEMORY_MB
 from utils.fhir_mock import MockFHIR
-from utils.ollama_request import ollama_request
+from utils.ollama_request import ollama_request, OLLAMA_HOSTS as DEFAULT_OLLAMA_HOSTS
+from utils.model_router import ModelRouter, MODEL_TIERS, LATENCY_SLO_MS, MODEL_PARALLELISM
+from utils.search_service import SearchService, IndexNotReady, positive_int
+from utils.vector_store import DEDUP_THRESHOLD
+from utils.reranker import Reranker, RERANK_BUDGET_MS
+from utils.compression import init_compression, COMPRESSION_THRESHOLD
+from utils.json_provider import init_json
+from utils.metrics import init_metrics, observe_cache, observe_store, REGISTRY, CONTENT_TYPE
+from utils.tracing import init_tracing
+from utils.jobs import JobManager, QueueFull, JOB_WORKERS, JOB_RESULT_TTL
+from utils.admission import init_admission, ADMISSION_BUDGETS
+from utils import admission
+from utils import profiling
 
 app = Flask(__name__)
+# jsonify and get_json through orjson when installed, NumPy vectors are serialized as is
+init_json(app)
+# Decompress gzip/zstd request bodies, compress responses above the threshold (bytes)
+init_compression(app, int(os.getenv("COMPRESSION_THRESHOLD", COMPRESSION_THRESHOLD)))
+# Per-route counts, latencies and in-flight requests, exposed on /metrics
+init_metrics(app)
+# Continue incoming W3C traceparent traces, spans go to TRACE_FILE (JSON lines) or an OTLP/HTTP collector
+init_tracing(app, trace_file=os.getenv("TRACE_FILE"), otlp_endpoint=os.getenv("OTLP_ENDPOINT"))
+# Comma separated Ollama base URLs, adding one scales out flattening
+OLLAMA_HOSTS = [host.strip() for host in os.getenv("OLLAMA_HOSTS", ",".join(DEFAULT_OLLAMA_HOSTS)).split(",") if host.strip()]
+# Generations each Ollama backend runs at once per model, its own OLLAMA_NUM_PARALLEL
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", MODEL_PARALLELISM))
+# Bounded per-route queues on /transform and /flatten, shedding load with 429 when queueing delay builds up,
+# after tracing so the time queued is part of the request's trace. /flatten gets one slot per Ollama slot.
+init_admission(app, {
+    "/transform": dict(ADMISSION_BUDGETS["/transform"], concurrency=int(os.getenv("TRANSFORM_CONCURRENCY", ADMISSION_BUDGETS["/transform"]["concurrency"]))),
+    "/flatten": dict(
+        ADMISSION_BUDGETS["/flatten"],
+        concurrency=int(os.getenv("FLATTEN_CONCURRENCY", len(OLLAMA_HOSTS) * OLLAMA_NUM_PARALLEL)),
+        service_ms=float(os.getenv("LATENCY_SLO_MS", ADMISSION_BUDGETS["/flatten"]["service_ms"]))
+    )
+})
+# /admin/ profiling endpoints and the X-Profile header, disabled unless ADMIN_TOKEN is set
+profiling.init_profiling(app, os.getenv("ADMIN_TOKEN"))
 
-# Initialize the Transformer model
-transformer = Transformer()
-ollama_requester = ollama_request()
+# Embedding models served by /transform?model=, loaded on first use and unloaded LRU above the memory cap (MB)
+registry = ModelRegistry(
+    models=[name.strip() for name in os.getenv("EMBEDDING_MODELS", ",".join(EMBEDDING_MODELS)).split(",") if name.strip()],
+    memory_mb=float(os.getenv("EMBEDDING_MEMORY_MB", EMBEDDING_MEMORY_MB))
+)
+# Initialize the Transformer model, the default one stays loaded for the search service
+transformer = registry.get(DEFAULT_EMBEDDING_MODEL)
+ollama_requester = ollama_request(hosts=OLLAMA_HOSTS)
+# Picks the model of each flatten request from the resource, the prompt size and the latency SLO
+router = ModelRouter(
+    ollama_requester,
+    models=[name.strip() for name in os.getenv("OLLAMA_MODELS", ",".join(MODEL_TIERS)).split(",") if name.strip()],
+    slo_ms=float(os.getenv("LATENCY_SLO_MS", LATENCY_SLO_MS)),
+    parallelism=OLLAMA_NUM_PARALLEL
+)
+# /flatten/jobs: generations run on background workers, callers poll or get a callback
+flatten_jobs = JobManager(
+    # An Ollama failure fails the job, the caller may resubmit it instead of getting the extractive summary
+    lambda data: router.flatten(data["request"], data.get("resource_type"), data.get("slo_ms"), fallback=False),
+    workers=int(os.getenv("FLATTEN_WORKERS", JOB_WORKERS)),
+    ttl=int(os.getenv("JOB_RESULT_TTL", JOB_RESULT_TTL)),
+    name="flatten"
+)
+reranker = Reranker()
+# Directory of the on-disk vector snapshot, the search index is memory-only when unset
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR")
+search_service = SearchService(
+    transformer,
+    dimension=transformer.model.get_sentence_embedding_dimension(),
+    reranker=reranker,
+    directory=VECTOR_STORE_DIR,
+    # Rows at least this similar to a stored vector share it (e.g. 0.98), unset shares exact duplicates only
+    dedup_threshold=float(os.environ["VECTOR_DEDUP_THRESHOLD"]) if os.getenv("VECTOR_DEDUP_THRESHOLD") else DEDUP_THRESHOLD
+)
 
 @app.route("/fhirmock", methods=["POST"])
 def fhir_mock_server():
@@ -16,7 +84,10 @@ def fhir_mock_server():
         return jsonify({"error": "'Invalid JSON FHIR request'"}), 400
 
     fhir_mock = MockFHIR()
-    return jsonify(fhir_mock.create_response(data))
+    try:
+        return Response(fhir_mock.render_response(data), content_type="application/json")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 @app.route("/transform", methods=["POST"])
 def embed_text():
@@ -24,15 +95,198 @@ def embed_text():
     if not data or "description" not in data:
         return jsonify({"error": "Missing 'description'"}), 400
 
-    return jsonify(transformer.create_vector(data))
+    name = request.args.get("model") or data.get("model")
+    try:
+        # The default model goes through the registry too, for its usage statistics
+        with registry.use(name or DEFAULT_EMBEDDING_MODEL) as model:
+            response = model.create_vector(data)
+            if name is None or name == DEFAULT_EMBEDDING_MODEL:
+                return jsonify(response)
+            return jsonify(dict(response, model=name, dimension=model.model.get_sentence_embedding_dimension()))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/transform/models", methods=["GET"])
+def transform_models():
+    return jsonify(registry.get_metrics())
+
+@app.route("/transform/stats", methods=["GET"])
+def transform_stats():
+    return jsonify(transformer.get_metrics())
+
+@app.route("/vectors", methods=["POST"])
+def insert_vector():
+    data = request.get_json()
+    if not data or "description" not in data:
+        return jsonify({"error": "Missing 'description'"}), 400
+
+    try:
+        return jsonify(search_service.insert(data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/vectors/snapshot", methods=["POST"])
+def snapshot_vectors():
+    try:
+        return jsonify(search_service.snapshot())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/search", methods=["POST"])
+def search_vectors():
+    data = request.get_json()
+    if not data or "query_desc" not in data:
+        return jsonify({"error": "Missing 'query_desc'"}), 400
+
+    try:
+        return jsonify(search_service.search(data))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except IndexNotReady as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": str(e.retry_after)}
+
+@app.route("/search/stats", methods=["GET"])
+def search_stats():
+    return jsonify(search_service.get_metrics())
+
+@app.route("/rerank", methods=["POST"])
+def rerank_results():
+    data = request.get_json()
+    if not data or "query_desc" not in data or "results" not in data:
+        return jsonify({"error": "Missing 'query_desc' or 'results'"}), 400
+
+    budget_ms = data.get("rerank_budget_ms", RERANK_BUDGET_MS)
+    try:
+        return jsonify(reranker.rerank(data["query_desc"], data["results"], budget_ms))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 @app.route("/flatten", methods=["POST"])
 def flatten_desc():
     data = request.get_json()
     if not data or "request" not in data:
         return jsonify({"error": "Missing 'request'"}), 400
-    response = ollama_requester.get_response(data["request"])
-    return jsonify({"response": response})
+    try:
+        return jsonify(router.flatten(data["request"], data.get("resource_type"), data.get("slo_ms")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/flatten/routing", methods=["GET"])
+def flatten_routing():
+    try:
+        return jsonify(router.get_metrics(positive_int(request.args, "last", 50)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/ollama/backends", methods=["GET"])
+def ollama_backends():
+    return jsonify(ollama_requester.pool.get_metrics())
+
+@app.route("/flatten/jobs", methods=["POST"])
+def submit_flatten_job():
+    data = request.get_json()
+    if not data or "request" not in data:
+        return jsonify({"error": "Missing 'request'"}), 400
+
+    try:
+        if data.get("slo_ms") is not None and float(data["slo_ms"]) <= 0:
+            raise ValueError("slo_ms must be positive")
+        job = flatten_jobs.submit(data, data.get("callback_url"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": "5"}
+    return jsonify(job), 202, {"Location": f"/flatten/jobs/{job['id']}"}
+
+@app.route("/flatten/jobs/<job_id>", methods=["GET"])
+def get_flatten_job(job_id):
+    job = flatten_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown or expired job '{job_id}'"}), 404
+    return jsonify(job)
+
+@app.route("/flatten/jobs", methods=["GET"])
+def flatten_jobs_stats():
+    return jsonify(flatten_jobs.get_metrics())
+
+@app.route("/admission/stats", methods=["GET"])
+def admission_stats():
+    return jsonify(admission.get_metrics())
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    observe_cache("embedding", transformer.cache.get_metrics())
+    observe_cache("search_result", search_service.results.get_metrics())
+    observe_store(search_service.store.get_metrics())
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@app.route("/admin/profiler/start", methods=["POST"])
+def start_profiler():
+    data = request.get_json(silent=True) or {}
+    try:
+        profiling.sampler.start(
+            float(data.get("interval_ms", profiling.SAMPLE_INTERVAL_MS)),
+            float(data.get("max_seconds", profiling.MAX_PROFILE_SECONDS))
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(profiling.sampler.get_status())
+
+@app.route("/admin/profiler/stop", methods=["POST"])
+def stop_profiler():
+    try:
+        return jsonify(profiling.sampler.stop())
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/admin/profiler", methods=["GET"])
+def profiler_status():
+    return jsonify(profiling.sampler.get_status())
+
+@app.route("/admin/profiler/flamegraph", methods=["GET"])
+def profiler_flamegraph():
+    # Folded stacks: flamegraph.pl, speedscope or inferno turn them into a flame graph
+    return Response(profiling.sampler.folded(), content_type="text/plain; charset=utf-8",
+                    headers={"Content-Disposition": "attachment; filename=profile.folded"})
+
+@app.route("/admin/profiles", methods=["GET"])
+def list_request_profiles():
+    return jsonify(profiling.request_profiles.list())
+
+@app.route("/admin/profiles/<profile_id>", methods=["GET"])
+def get_request_profile(profile_id):
+    profile = profiling.request_profiles.get(profile_id)
+    if profile is None:
+        return jsonify({"error": f"Unknown profile '{profile_id}'"}), 404
+    if request.args.get("format") == "pstats":
+        return Response(profiling.profile_dump(profile["stats"]), content_type="application/octet-stream",
+                        headers={"Content-Disposition": f"attachment; filename={profile_id}.pstats"})
+    return Response(profiling.profile_text(profile["stats"], request.args.get("sort", "cumulative")), content_type="text/plain; charset=utf-8")
+
+@app.route("/admin/tracemalloc/start", methods=["POST"])
+def start_tracemalloc():
+    data = request.get_json(silent=True) or {}
+    try:
+        profiling.allocations.start(int(data.get("frames", profiling.TRACEMALLOC_FRAMES)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"tracing": True})
+
+@app.route("/admin/tracemalloc/snapshot", methods=["POST"])
+def tracemalloc_snapshot():
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(profiling.allocations.snapshot(int(data.get("top", profiling.TRACEMALLOC_TOP)), data.get("group_by", "lineno")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route("/admin/tracemalloc/stop", methods=["POST"])
+def stop_tracemalloc():
+    try:
+        profiling.allocations.stop()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"tracing": False})
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server imports its modules as utils.x from the transformer_server directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,77 @@
+import threading
+import time
+import pytest
+from flask import Flask, jsonify
+from utils import admission, tracing
+from utils.admission import AdmissionController, Overloaded, init_admission
+from utils.tracing import init_tracing
+
+class CollectingExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+def test_delays_follow_the_measured_service_time():
+    controller = AdmissionController("/flatten", concurrency=4, max_queue=8, service_ms=20000)
+    assert controller.target() == pytest.approx(5.0)
+    assert controller.interval() == pytest.approx(40.0)
+    controller.acquire()
+    controller.release(40.0)
+    # EWMA of 20 s and 40 s
+    assert controller.target() == pytest.approx(24.0 / 4)
+    assert controller.interval() == pytest.approx(48.0)
+
+def test_fixed_delays_and_invalid_budgets():
+    controller = AdmissionController("/transform", concurrency=2, max_queue=8, target_ms=50, interval_ms=500)
+    controller.acquire()
+    controller.release(10.0)
+    assert controller.target() == pytest.approx(0.05) and controller.interval() == pytest.approx(0.5)
+    with pytest.raises(ValueError):
+        AdmissionController("/flatten", concurrency=0, max_queue=8, service_ms=1000)
+    with pytest.raises(ValueError):
+        AdmissionController("/flatten", concurrency=1, max_queue=8)
+    with pytest.raises(ValueError):
+        AdmissionController("/transform", concurrency=1, max_queue=8, target_ms=500, interval_ms=50)
+
+def test_full_queue_and_timed_out_waits_are_rejected():
+    controller = AdmissionController("/flatten", concurrency=1, max_queue=1, target_ms=20, interval_ms=50, service_ms=1000)
+    controller.acquire()
+    with pytest.raises(Overloaded) as timed_out:
+        controller.acquire()
+    assert timed_out.value.reason == "queue_timeout" and timed_out.value.retry_after >= 1
+
+    waiter = threading.Thread(target=lambda: pytest.raises(Overloaded, controller.acquire))
+    waiter.start()
+    while controller.get_metrics()["waiting"] == 0:
+        time.sleep(0.001)
+    with pytest.raises(Overloaded) as full:
+        controller.acquire()
+    assert full.value.reason == "queue_full"
+    waiter.join()
+
+def test_queue_wait_is_a_span_of_the_request(monkeypatch):
+    exporter = CollectingExporter()
+    monkeypatch.setattr(tracing, "exporter", exporter)
+    monkeypatch.setattr(admission, "controllers", {})
+    app = Flask(__name__)
+    init_tracing(app)
+    init_admission(app, {"/work": {"concurrency": 1, "max_queue": 0, "service_ms": 100}})
+
+    @app.route("/work")
+    def work():
+        return jsonify({})
+
+    client = app.test_client()
+    assert client.get("/work").status_code == 200
+    admission.controllers["/work"].acquire()
+    rejected = client.get("/work")
+    assert rejected.status_code == 429 and "Retry-After" in rejected.headers
+
+    requests = [span for span in exporter.spans if span.name == "GET /work"]
+    waits = [span for span in exporter.spans if span.name == "queue_wait"]
+    assert len(requests) == 2 and len(waits) == 2
+    for request, wait in zip(requests, waits):
+        assert wait.trace_id == request.trace_id and wait.parent_id == request.span_id
+    assert waits[0].error is None and waits[1].error.startswith("Overloaded")
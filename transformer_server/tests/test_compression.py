@@ -0,0 +1,54 @@
+import gzip
+import json
+import pytest
+from flask import Flask, request, jsonify
+from utils import compression
+from utils.compression import init_compression
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BODY = json.dumps({"description": "glucose " * 200}).encode()
+
+def encoders():
+    yield "gzip", gzip.compress
+    if zstandard is not None:
+        yield "zstd", zstandard.ZstdCompressor().compress
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    init_compression(app, threshold=100)
+
+    @app.route("/echo", methods=["POST"])
+    def echo():
+        return jsonify(request.get_json())
+
+    return app.test_client()
+
+def post(client, data, encoding, **headers):
+    return client.post("/echo", data=data, headers={"Content-Type": "application/json", "Content-Encoding": encoding, **headers})
+
+@pytest.mark.parametrize("encoding, encode", list(encoders()))
+def test_compressed_bodies_round_trip(client, encoding, encode):
+    response = post(client, encode(BODY), encoding, **{"Accept-Encoding": encoding})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == encoding
+    assert json.loads(compression.decompress(response.get_data(), encoding)) == json.loads(BODY)
+
+@pytest.mark.parametrize("encoding, encode", list(encoders()))
+def test_truncated_bodies_are_rejected(client, encoding, encode):
+    response = post(client, encode(BODY)[:-6], encoding)
+    assert response.status_code == 400
+    assert "Truncated or corrupt" in response.get_json()["error"]
+
+def test_unsupported_and_oversized_bodies(client, monkeypatch):
+    assert post(client, BODY, "br").status_code == 415
+    monkeypatch.setattr(compression, "MAX_DECOMPRESSED_BYTES", len(BODY) - 1)
+    response = post(client, gzip.compress(BODY), "gzip")
+    assert response.status_code == 400 and "larger than" in response.get_json()["error"]
+
+def test_concatenated_gzip_members_are_one_body():
+    assert compression.decompress(gzip.compress(b"ab") + gzip.compress(b"cd"), "gzip") == b"abcd"
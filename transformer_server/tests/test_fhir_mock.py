@@ -0,0 +1,33 @@
+import json
+import pytest
+from utils.fhir_mock import MockFHIR
+
+MESSAGE = {"resourceType": "Bundle", "id": "bundle-1", "type": "message", "entry": []}
+
+def batch_of(batch_type, *entries):
+    return {"resourceType": "Bundle", "type": batch_type, "entry": list(entries)}
+
+def test_acknowledgement_template_matches_the_response():
+    mock = MockFHIR()
+    for identifier in ("bundle-1", None, {"value": "x\"y"}):
+        message = dict(MESSAGE, id=identifier)
+        assert json.loads(mock.render_response(message)) == mock.create_response(message)
+
+def test_batch_entries_are_answered_in_order():
+    data = batch_of(
+        "batch",
+        {"resource": MESSAGE, "request": {"method": "POST", "url": "$process-message"}},
+        {"resource": {"resourceType": "Patient", "id": "p1"}, "request": {"method": "PUT", "url": "Patient/p1"}},
+        {"resource": "not a resource"}
+    )
+    response = json.loads(MockFHIR().render_response(data))
+    assert response["type"] == "batch-response"
+    statuses = [entry["response"]["status"] for entry in response["entry"]]
+    assert statuses == ["200 OK", "201 Created", "400 Bad Request"]
+    assert response["entry"][0]["resource"]["resourceType"] == "Bundle"
+    assert response["entry"][1]["response"]["location"] == "Patient/p1/_history/1"
+
+def test_an_invalid_transaction_entry_fails_the_transaction():
+    data = batch_of("transaction", {"resource": {"resourceType": "Patient"}, "request": {"method": "POST", "url": "Patient"}}, {})
+    with pytest.raises(ValueError):
+        MockFHIR().create_response(data)
@@ -0,0 +1,51 @@
+import threading
+import time
+import pytest
+from utils.jobs import JobManager, QueueFull
+
+def wait_finished(manager, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+def test_job_result_and_failure():
+    def work(payload):
+        if payload == "boom":
+            raise RuntimeError("backend down")
+        return payload.upper()
+
+    manager = JobManager(work, workers=1, name="test")
+    done = wait_finished(manager, manager.submit("hello")["id"])
+    assert done["status"] == "done" and done["result"] == "HELLO" and done["error"] is None
+    failed = wait_finished(manager, manager.submit("boom")["id"])
+    assert failed["status"] == "failed" and failed["result"] is None
+    assert failed["error"] == "RuntimeError: backend down"
+
+def test_submissions_beyond_the_queue_are_refused():
+    release = threading.Event()
+    manager = JobManager(lambda payload: release.wait(), workers=1, max_queued=1, name="test")
+    running = manager.submit(1)
+    while manager.get(running["id"])["status"] != "running":
+        time.sleep(0.01)
+    manager.submit(2)
+    with pytest.raises(QueueFull):
+        manager.submit(3)
+    release.set()
+
+def test_finished_jobs_expire_after_their_ttl():
+    manager = JobManager(lambda payload: payload, workers=1, ttl=0, name="test")
+    job = manager.submit(1)
+    deadline = time.monotonic() + 5
+    while manager.get(job["id"]) is not None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert manager.get_metrics()["jobs"] == {"queued": 0, "running": 0, "done": 0, "failed": 0}
+
+def test_invalid_callback_url_rejected():
+    manager = JobManager(lambda payload: payload, workers=1, name="test")
+    with pytest.raises(ValueError):
+        manager.submit(1, callback_url="file:///etc/passwd")
@@ -0,0 +1,51 @@
+import importlib
+import sys
+import numpy as np
+import pytest
+from flask import Flask, request
+from utils import json_provider
+
+class Point:
+    def to_dict(self):
+        return {"x": 1}
+
+PAYLOAD = {"vector": np.array([0.5, -1.25], dtype=np.float32), "score": np.float32(0.75), "tags": {"a"}, "point": Point(), 3: "three"}
+EXPECTED = {"vector": [0.5, -1.25], "score": 0.75, "tags": ["a"], "point": {"x": 1}, "3": "three"}
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def provider(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        # Reimported without orjson, then restored for the other tests
+        monkeypatch.setitem(sys.modules, "orjson", None)
+        importlib.reload(json_provider)
+        request.addfinalizer(lambda: importlib.reload(json_provider))
+    return json_provider
+
+def make_app(provider):
+    app = Flask(__name__)
+    provider.init_json(app)
+
+    @app.route("/echo", methods=["POST"])
+    def echo():
+        return dict(PAYLOAD, received=request.get_json())
+
+    return app
+
+def test_numpy_values_and_extension_types_are_encoded(provider):
+    assert provider.loads(provider.dumps(PAYLOAD)) == EXPECTED
+    assert (provider.orjson is None) == (sys.modules.get("orjson") is None)
+
+def test_routes_encode_and_decode_through_the_provider(provider):
+    response = make_app(provider).test_client().post("/echo", json={"query": "glucose"})
+    assert response.status_code == 200
+    assert response.get_json() == dict(EXPECTED, received={"query": "glucose"})
+
+def test_stdlib_options_are_honoured(provider):
+    app = make_app(provider)
+    assert app.json.dumps({"b": 1, "a": 2}, sort_keys=True) == '{"a": 2, "b": 1}'
+
+def test_unknown_types_are_rejected(provider):
+    with pytest.raises(TypeError):
+        provider.dumps({"value": object()})
@@ -0,0 +1,60 @@
+import pytest
+from flask import Flask
+from utils.metrics import Counter, Gauge, Histogram, Registry, init_metrics, HTTP_REQUESTS, HTTP_IN_FLIGHT, HTTP_LATENCY
+
+def test_exposition_format():
+    registry = Registry()
+    requests = Counter("requests_total", "Requests.", ["route"], registry=registry)
+    queued = Gauge("queued", "Queued.", registry=registry)
+    latency = Histogram("latency_seconds", "Latency.", ["route"], buckets=(0.1, 1.0), registry=registry)
+    requests.inc(route='/a"b')
+    requests.inc(2, route='/a"b')
+    queued.set(4)
+    queued.dec()
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, route="/a")
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/a\\"b"} 3',
+        "# HELP queued Queued.",
+        "# TYPE queued gauge",
+        "queued 3",
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a",le="1.0"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 3.65',
+        'latency_seconds_count{route="/a"} 4'
+    ]
+
+def test_labels_must_match_and_totals_never_go_down():
+    counter = Counter("hits_total", "Hits.", ["cache"], registry=Registry())
+    with pytest.raises(ValueError):
+        counter.inc(route="/a")
+    counter.set_total(10, cache="c")
+    counter.set_total(7, cache="c")
+    assert counter.values[("c",)] == 10
+
+def test_requests_are_counted_and_timed_whatever_the_outcome():
+    app = Flask(__name__)
+    init_metrics(app)
+
+    @app.route("/ok")
+    def ok():
+        return "ok"
+
+    @app.route("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    before = {key: value for key, value in HTTP_REQUESTS.values.items()}
+    client = app.test_client()
+    client.get("/ok")
+    client.get("/boom")
+    client.get("/missing")
+    for key in (("/ok", "GET", "200"), ("/boom", "GET", "500"), ("unmatched", "GET", "404")):
+        assert HTTP_REQUESTS.values[key] == before.get(key, 0) + 1
+    assert HTTP_LATENCY.values[("/ok", "GET")][2] >= 1
+    assert HTTP_IN_FLIGHT.values[("/ok",)] == 0 and HTTP_IN_FLIGHT.values[("/boom",)] == 0
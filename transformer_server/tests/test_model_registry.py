@@ -0,0 +1,79 @@
+import pytest
+
+pytest.importorskip("sentence_transformers")
+from utils import transformer as transformer_module
+from utils.metrics import EMBEDDING_MODEL_BYTES, EMBEDDING_MODEL_EVENTS
+from utils.model_registry import ModelRegistry
+
+MB = 1024 * 1024
+# Weights of the fake models, the registry below is capped at 1 MB
+SIZES = {"base": MB // 2, "a": MB * 2 // 5, "b": MB * 2 // 5}
+
+class FakeTensor:
+    def __init__(self, size):
+        self.size = size
+
+    def numel(self):
+        return self.size
+
+    def element_size(self):
+        return 1
+
+class FakeModel:
+    max_seq_length = 10
+
+    def __init__(self, name):
+        self.name = name
+        self.tokenizer = None
+
+    def parameters(self):
+        return [FakeTensor(SIZES[self.name])]
+
+    def buffers(self):
+        return []
+
+    def get_sentence_embedding_dimension(self):
+        return 8
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(transformer_module, "SentenceTransformer", FakeModel)
+    return ModelRegistry(models=("a", "b"), memory_mb=1, pinned=("base",))
+
+def loaded(registry) -> list:
+    return [name for name, model in registry.get_metrics()["models"].items() if model["loaded"]]
+
+def test_only_allowed_models_load(registry):
+    with pytest.raises(ValueError):
+        with registry.use("unknown"):
+            pass
+    with pytest.raises(ValueError):
+        registry.get("a")
+    assert registry.get("base") is registry.get("base")
+    assert registry.get_metrics()["loads"] == 1
+
+def test_least_recently_used_idle_model_unloaded_above_the_cap(registry):
+    registry.get("base")
+    with registry.use("a"):
+        pass
+    with registry.use("b") as transformer:
+        assert transformer.model.name == "b"
+    metrics = registry.get_metrics()
+    # The pinned model stays even though it was used first
+    assert loaded(registry) == ["base", "b"]
+    assert metrics["memory_bytes"] == SIZES["base"] + SIZES["b"] <= metrics["memory_cap_bytes"]
+    assert metrics["unloads"] == 1
+    # The dimension is still known once unloaded
+    assert metrics["models"]["a"]["dimension"] == 8
+    assert EMBEDDING_MODEL_BYTES.values[("a",)] == 0
+    assert EMBEDDING_MODEL_EVENTS.values[("a", "unload")] >= 1
+
+def test_models_in_use_are_unloaded_by_their_last_user(registry):
+    registry.get("base")
+    with registry.use("a"):
+        with registry.use("b"):
+            # Both in use: over the cap until one is released
+            assert loaded(registry) == ["base", "a", "b"]
+            assert registry.get_metrics()["memory_bytes"] > registry.cap
+        assert loaded(registry) == ["base", "a"]
+    assert registry.get_metrics()["unloads"] == 1
@@ -0,0 +1,84 @@
+import pytest
+import requests
+from utils.model_router import ModelRouter, EXTRACTIVE, SMALL_PROMPT_TOKENS, CHARS_PER_TOKEN
+from utils.ollama_request import OllamaError
+
+PATIENT_PROMPT = 'Flatten this resource: {"resourceType": "Patient", "id": "1", "gender": "female", "birthDate": "1980-02-03"}'
+
+class FakeRequester:
+    def __init__(self, answers=None):
+        # Model -> response text or exception
+        self.answers = answers or {}
+        self.calls = []
+
+    def get_response(self, prompt, model_name=None):
+        self.calls.append(model_name)
+        answer = self.answers.get(model_name, f"summary by {model_name}")
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+def make_router(requester, slo_ms=1000):
+    return ModelRouter(requester, models=("big", "small"), slo_ms=slo_ms)
+
+def test_short_simple_resource_goes_to_the_small_model():
+    router = make_router(FakeRequester())
+    assert router.flatten(PATIENT_PROMPT, "Patient")["model"] == "small"
+    assert router.flatten(PATIENT_PROMPT, "Observation")["model"] == "big"
+    long_prompt = "x" * (SMALL_PROMPT_TOKENS + 1) * CHARS_PER_TOKEN
+    assert router.flatten(long_prompt, "Patient")["model"] == "big"
+
+def test_slow_model_falls_back_to_a_smaller_one():
+    router = make_router(FakeRequester())
+    router.stats["big"].record(5.0)
+    out = router.flatten(PATIENT_PROMPT, "Observation")
+    assert out["model"] == "small"
+    assert out["routing"]["reason"] == "slo_fallback"
+
+def test_no_model_within_the_slo_gives_the_extractive_summary():
+    requester = FakeRequester()
+    router = make_router(requester)
+    router.stats["big"].record(5.0)
+    router.stats["small"].record(5.0)
+    out = router.flatten(PATIENT_PROMPT, "Observation")
+    assert out["model"] == EXTRACTIVE
+    assert out["routing"]["reason"] == "slo_exceeded"
+    assert out["response"].startswith("Patient Information:")
+    assert "gender: female" in out["response"]
+    assert requester.calls == []
+
+@pytest.mark.parametrize("error", [
+    OllamaError("Ollama returned 503: overloaded"),
+    requests.ConnectionError("refused"),
+    requests.Timeout("read timed out")
+])
+def test_backend_error_falls_back_without_feeding_the_latency_estimate(error):
+    router = make_router(FakeRequester({"big": error}))
+    out = router.flatten(PATIENT_PROMPT, "Observation")
+    assert out["model"] == EXTRACTIVE
+    assert out["routing"]["reason"] == "backend_error"
+    assert type(error).__name__ in out["routing"]["error"]
+    assert "gender: female" in out["response"]
+    assert len(router.stats["big"].latencies) == 0
+    assert router.stats["big"].outstanding == 0
+
+def test_backend_error_raised_without_fallback():
+    router = make_router(FakeRequester({"big": OllamaError("Ollama returned 500: boom")}))
+    with pytest.raises(OllamaError):
+        router.flatten(PATIENT_PROMPT, "Observation", fallback=False)
+    # The decision is still recorded
+    assert router.get_metrics()["decisions"][-1]["reason"] == "backend_error"
+
+def test_invalid_slo_rejected():
+    router = make_router(FakeRequester())
+    with pytest.raises(ValueError):
+        router.flatten(PATIENT_PROMPT, "Patient", slo_ms=0)
+
+def test_resource_type_is_read_from_the_prompt_when_not_given():
+    router = make_router(FakeRequester())
+    out = router.flatten(PATIENT_PROMPT)
+    assert out["model"] == "small"
+    assert out["routing"]["resource_type"] == "Patient"
+    assert router.choose("Flatten this note: patient is well")["resource_type"] is None
+    # An explicit type wins over the prompt's
+    assert router.choose(PATIENT_PROMPT, "Observation")["preferred"] == "big"
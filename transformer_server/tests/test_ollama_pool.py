@@ -0,0 +1,142 @@
+import pytest
+import requests
+from utils import ollama_pool, ollama_request
+from utils.ollama_pool import OllamaPool, NoBackendAvailable, CIRCUIT_FAILURES, CIRCUIT_OPEN_SECONDS
+from utils.ollama_request import OllamaError
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ollama_pool.time, "monotonic", lambda: now[0])
+    return now
+
+def make_pool(*urls):
+    # No health check thread, the tests drive the backends themselves
+    return OllamaPool(list(urls), health_check_interval=0)
+
+def fail(pool, backend, times):
+    for _ in range(times):
+        pool.release(*pool.acquire("m", exclude=[other for other in pool.backends if other is not backend]), ok=False)
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    pool = make_pool("http://a", "http://b")
+    a, b = pool.backends
+    fail(pool, a, CIRCUIT_FAILURES - 1)
+    assert a.available(clock[0])
+
+    fail(pool, a, 1)
+    assert not a.available(clock[0])
+    assert pool.get_metrics()["http://a"]["circuit_open"]
+    # Calls go to the other backend while the circuit is open
+    assert all(pool.acquire("m")[0] is b for _ in range(3))
+
+def test_success_resets_the_failure_count(clock):
+    pool = make_pool("http://a")
+    a = pool.backends[0]
+    fail(pool, a, CIRCUIT_FAILURES - 1)
+    pool.release(*pool.acquire("m"), ok=True)
+    fail(pool, a, CIRCUIT_FAILURES - 1)
+    assert a.available(clock[0])
+
+def test_open_circuit_lets_a_single_trial_call_through(clock):
+    pool = make_pool("http://a")
+    a = pool.backends[0]
+    fail(pool, a, CIRCUIT_FAILURES)
+    with pytest.raises(NoBackendAvailable):
+        pool.acquire("m")
+
+    clock[0] += CIRCUIT_OPEN_SECONDS
+    backend, trial = pool.acquire("m")
+    assert backend is a and trial
+    # Only one trial at a time
+    with pytest.raises(NoBackendAvailable):
+        pool.acquire("m")
+
+    # A failed trial opens the circuit for another period
+    pool.release(a, trial, ok=False)
+    assert not a.available(clock[0])
+    clock[0] += CIRCUIT_OPEN_SECONDS
+    pool.release(*pool.acquire("m"), ok=True)
+    assert not pool.get_metrics()["http://a"]["circuit_open"]
+    assert pool.acquire("m") == (a, False)
+
+def test_only_the_trial_call_ends_the_trial(clock):
+    pool = make_pool("http://a")
+    a = pool.backends[0]
+    # A call started while the circuit was still closed
+    straggler = pool.acquire("m")
+    fail(pool, a, CIRCUIT_FAILURES)
+    clock[0] += CIRCUIT_OPEN_SECONDS
+    backend, trial = pool.acquire("m")
+    assert trial
+
+    # The straggler finishing does not let a second trial through
+    pool.release(*straggler, ok=False)
+    with pytest.raises(NoBackendAvailable):
+        pool.acquire("m")
+    pool.release(backend, trial, ok=True)
+    assert pool.acquire("m") == (a, False)
+
+def test_down_backend_gets_no_calls(clock):
+    pool = make_pool("http://a", "http://b")
+    pool.backends[0].up = False
+    assert pool.acquire("m")[0] is pool.backends[1]
+
+def test_warm_backend_preferred_within_the_affinity_slack(clock):
+    pool = make_pool("http://a", "http://b")
+    a, b = pool.backends
+    a.models.add("big")
+    held = [pool.acquire("big")[0] for _ in range(ollama_pool.AFFINITY_SLACK + 1)]
+    assert all(backend is a for backend in held)
+    # One more would leave a further ahead of b than the slack allows
+    assert pool.acquire("big")[0] is b
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+        self.text = str(body)
+
+    def json(self):
+        if not isinstance(self.body, dict):
+            raise ValueError("not JSON")
+        return self.body
+
+def fake_backends(monkeypatch, answers):
+    """Make requests.post answer from `answers`: base URL -> FakeResponse or exception."""
+    calls = []
+
+    def post(url, **kwargs):
+        base = url.rsplit("/api/", 1)[0]
+        calls.append(base)
+        answer = answers[base]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(ollama_request.requests, "post", post)
+    return calls
+
+def test_failed_generation_retried_on_another_backend(monkeypatch, clock):
+    calls = fake_backends(monkeypatch, {"http://a": FakeResponse(503, "overloaded"), "http://b": FakeResponse(200, {"response": "ok"})})
+    requester = ollama_request.ollama_request(["http://a", "http://b"], health_check_interval=0)
+    assert requester.get_response("prompt", "m") == "ok"
+    assert calls == ["http://a", "http://b"]
+    assert [backend.failures for backend in requester.pool.backends] == [1, 0]
+
+def test_generation_errors_are_raised(monkeypatch, clock):
+    fake_backends(monkeypatch, {"http://a": FakeResponse(503, "overloaded"), "http://b": requests.Timeout("read timed out")})
+    requester = ollama_request.ollama_request(["http://a", "http://b"], health_check_interval=0)
+    with pytest.raises(requests.RequestException):
+        requester.get_response("prompt", "m")
+    assert all(backend.failures == 1 for backend in requester.pool.backends)
+
+    a, b = requester.pool.backends
+    for answers in ({"http://a": FakeResponse(200, "not json")}, {"http://b": FakeResponse(404, "model not found")}):
+        calls = fake_backends(monkeypatch, answers)
+        a.up, b.up = "http://a" in answers, "http://b" in answers
+        with pytest.raises(OllamaError):
+            requester.get_response("prompt", "m")
+        # Not a backend failure: no retry, and the backend's failure count is reset
+        assert len(calls) == 1
+        assert requester.pool.backends[0 if "http://a" in answers else 1].failures == 0
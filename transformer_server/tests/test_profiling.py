@@ -0,0 +1,63 @@
+import time
+import pytest
+from flask import Flask, jsonify
+from utils import profiling
+from utils.profiling import RequestProfiles, SamplingProfiler, init_profiling, profile_text
+
+TOKEN = "s3cret"
+
+def make_app(monkeypatch, token):
+    monkeypatch.setattr(profiling, "request_profiles", RequestProfiles(size=2))
+    app = Flask(__name__)
+    init_profiling(app, token)
+
+    @app.route("/admin/ping")
+    def admin_ping():
+        return jsonify({})
+
+    @app.route("/work")
+    def work():
+        return jsonify({"total": sum(range(1000))})
+
+    return app.test_client()
+
+@pytest.mark.parametrize("token, headers", [
+    (None, {}),
+    (None, {"X-Admin-Token": ""}),
+    (TOKEN, {}),
+    (TOKEN, {"X-Admin-Token": "wrong"})
+])
+def test_admin_endpoints_need_the_token(monkeypatch, token, headers):
+    client = make_app(monkeypatch, token)
+    assert client.get("/admin/ping", headers=headers).status_code == 403
+
+def test_profile_header_is_honoured_for_admins_only(monkeypatch):
+    client = make_app(monkeypatch, TOKEN)
+    assert client.get("/admin/ping", headers={"X-Admin-Token": TOKEN}).status_code == 200
+    assert "X-Profile-Id" not in client.get("/work", headers={"X-Profile": "1"}).headers
+
+    response = client.get("/work", headers={"X-Profile": "1", "X-Admin-Token": TOKEN})
+    assert response.status_code == 200
+    profile = profiling.request_profiles.get(response.headers["X-Profile-Id"])
+    assert profile["route"] == "/work"
+    assert "function calls" in profile_text(profile["stats"])
+
+def test_request_profiles_keep_the_latest(monkeypatch):
+    client = make_app(monkeypatch, TOKEN)
+    ids = [client.get("/work", headers={"X-Profile": "1", "X-Admin-Token": TOKEN}).headers["X-Profile-Id"] for _ in range(3)]
+    assert [entry["id"] for entry in profiling.request_profiles.list()] == ids[1:]
+
+def test_sampling_profiler_collects_folded_stacks():
+    sampler = SamplingProfiler()
+    sampler.start(interval_ms=1, max_seconds=5)
+    with pytest.raises(ValueError):
+        sampler.start()
+    time.sleep(0.05)
+    status = sampler.stop()
+    assert not status["running"] and status["samples"] > 0
+    # "frame;frame;frame count" lines, this test's frame among the sampled stacks
+    lines = sampler.folded().splitlines()
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("test_sampling_profiler_collects_folded_stacks" in line for line in lines)
+    with pytest.raises(ValueError):
+        sampler.stop()
@@ -0,0 +1,67 @@
+import numpy as np
+from utils.query_cache import ResultCache
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+def results(*similarities):
+    return {"results": [{"ID": i, "Similarity": similarity} for i, similarity in enumerate(similarities, start=1)]}
+
+def test_insert_drops_its_partition_and_the_unrestricted_searches():
+    cache = ResultCache(10)
+    cache.put("p1", results(0.9), "p1")
+    cache.put("p2", results(0.9), "p2")
+    cache.put("all", results(0.9), None)
+
+    cache.invalidate("p1")
+
+    assert cache.get("p1") is None
+    assert cache.get("all") is None
+    assert cache.get("p2") is not None
+    assert cache.get_metrics()["invalidations"] == 2
+
+def test_vector_result_kept_when_the_insert_cannot_enter_its_top_k():
+    cache = ResultCache(10)
+    query = unit(1, 0, 0)
+    cache.put("near", results(0.95, 0.9), None, query_vector=query, k=2)
+
+    # Similarity 0 with the query, below the lowest cached score
+    cache.invalidate("p1", unit(0, 1, 0))
+    assert cache.get("near") is not None
+
+    cache.invalidate("p1", unit(1, 0.1, 0))
+    assert cache.get("near") is None
+
+def test_vector_result_shorter_than_k_always_dropped():
+    cache = ResultCache(10)
+    cache.put("short", results(0.95), None, query_vector=unit(1, 0, 0), k=5)
+    cache.invalidate("p1", unit(0, 1, 0))
+    assert cache.get("short") is None
+
+def test_result_computed_across_an_insert_is_not_cached():
+    cache = ResultCache(10)
+    generation = cache.generation("p1")
+    unrestricted = cache.generation(None)
+    other = cache.generation("p2")
+
+    # An insert for p1 lands while the searches compute, before they put()
+    cache.invalidate("p1")
+    cache.put("p1", results(0.9), "p1", generation=generation)
+    cache.put("all", results(0.9), None, generation=unrestricted)
+    cache.put("p2", results(0.9), "p2", generation=other)
+
+    assert cache.get("p1") is None
+    assert cache.get("all") is None
+    assert cache.get("p2") is not None
+    assert cache.get_metrics()["stale_puts"] == 2
+
+def test_eviction_forgets_the_partition_of_the_entry():
+    cache = ResultCache(2)
+    for key in ("a", "b", "c"):
+        cache.put(key, results(0.9), "p1")
+
+    assert cache.get("a") is None
+    assert cache.partitions["p1"] == {"b", "c"}
+    cache.invalidate("p1")
+    assert len(cache) == 0
@@ -0,0 +1,54 @@
+import time
+import pytest
+
+pytest.importorskip("sentence_transformers")
+from utils import reranker as reranker_module
+from utils.reranker import Reranker, PROBE_PAIRS
+
+class FakeCrossEncoder:
+    """Scores a pair by the words it shares with the query, after an optional load time."""
+
+    load_seconds = 0.0
+
+    def __init__(self, name):
+        time.sleep(self.load_seconds)
+
+    def predict(self, pairs, batch_size=None):
+        return [len(set(query.split()) & set(text.split())) for query, text in pairs]
+
+@pytest.fixture
+def reranker(monkeypatch):
+    monkeypatch.setattr(reranker_module, "CrossEncoder", FakeCrossEncoder)
+    return Reranker()
+
+def candidates(count):
+    return [{"ID": i, "Description": "glucose high" if i == count - 1 else f"row {i}"} for i in range(count)]
+
+def test_best_candidate_moves_first(reranker):
+    out = reranker.rerank("glucose", candidates(5), budget_ms=None)
+    assert out["reranked"] == 5
+    assert out["results"][0]["ID"] == 4
+
+@pytest.mark.parametrize("query, results, budget_ms", [
+    (None, candidates(2), 100),
+    ("glucose", [{"ID": 1}], 100),
+    ("glucose", "rows", 100),
+    ("glucose", candidates(2), 0),
+    ("glucose", candidates(2), "fast")
+])
+def test_invalid_requests_are_value_errors(reranker, query, results, budget_ms):
+    with pytest.raises(ValueError):
+        reranker.rerank(query, results, budget_ms)
+
+def test_zero_pair_time_does_not_break_sizing(reranker):
+    reranker.observe(0.0)
+    assert reranker.pair_ms > 0
+    out = reranker.rerank("glucose", candidates(50), budget_ms=200)
+    assert out["reranked"] == 50
+
+def test_model_load_counts_against_the_first_budget(reranker, monkeypatch):
+    monkeypatch.setattr(FakeCrossEncoder, "load_seconds", 0.3)
+    out = reranker.rerank("glucose", candidates(50), budget_ms=200)
+    # The load used up the budget, only the probe was scored
+    assert out["reranked"] == PROBE_PAIRS
+    assert [row["ID"] for row in out["results"][PROBE_PAIRS:]] == list(range(PROBE_PAIRS, 50))
@@ -0,0 +1,52 @@
+import zlib
+import numpy as np
+import pytest
+
+# The service imports the reranker, which loads its model through sentence-transformers
+pytest.importorskip("sentence_transformers")
+from utils.search_service import SearchService
+
+DIMENSION = 16
+
+class FakeTransformer:
+    """Bag of words hashed into a small vector, rows sharing words are similar."""
+
+    def create_vector(self, data: dict) -> dict:
+        vector = np.zeros(DIMENSION, dtype=np.float32)
+        for word in data["description"].lower().split():
+            vector[zlib.crc32(word.encode()) % DIMENSION] += 1
+        return {"vector": vector / max(np.linalg.norm(vector), 1e-9)}
+
+@pytest.fixture
+def service():
+    service = SearchService(FakeTransformer(), dimension=DIMENSION)
+    for description, patient in (("glucose 2345-7 high", "p1"), ("blood pressure normal", "p1"), ("glucose fasting low", "p2")):
+        service.insert({"description": description, "PatientID": patient})
+    return service
+
+@pytest.mark.parametrize("data", [
+    {"query_desc": None},
+    {"query_desc": ["glucose"]},
+    {"query_desc": "glucose", "alpha": None},
+    {"query_desc": "glucose", "alpha": "high"},
+    {"query_desc": "glucose", "alpha": 1.5},
+    {"query_desc": "glucose", "alpha": -0.1},
+    {"query_desc": "glucose", "rows": 0},
+    {"query_desc": "glucose", "mode": "fuzzy"}
+])
+def test_invalid_searches_are_value_errors(service, data):
+    with pytest.raises(ValueError):
+        service.search(data)
+
+def test_code_queries_are_exact_matches(service):
+    response = service.search({"query_desc": "2345-7"})
+    assert response["match"] == "exact"
+    assert [row["ID"] for row in response["results"]] == [1]
+    assert response["results"][0]["Similarity"] is None
+
+def test_hybrid_search_within_a_patient(service):
+    response = service.search({"query_desc": "glucose", "fusion": "weighted", "alpha": 1, "PatientID": "p1"})
+    assert response["match"] == "hybrid"
+    assert {row["ID"] for row in response["results"]} <= {1, 2}
+    assert response["results"][0]["ID"] == 1
+    assert service.search({"query_desc": "glucose", "fusion": "weighted", "alpha": 1, "PatientID": "p1"})["cached"] is True
@@ -0,0 +1,86 @@
+import time
+import pytest
+from flask import Flask, jsonify
+from utils import tracing
+from utils.tracing import init_tracing, inject, parse_traceparent, queue_start_ns, start_span
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+class CollectingExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = CollectingExporter()
+    monkeypatch.setattr(tracing, "exporter", exporter)
+    return exporter
+
+@pytest.mark.parametrize("header, expected", [
+    (f"00-{TRACE_ID}-{PARENT_ID}-01", (TRACE_ID, PARENT_ID)),
+    (f" 00-{TRACE_ID.upper()}-{PARENT_ID}-00 ", (TRACE_ID, PARENT_ID)),
+    (f"ff-{TRACE_ID}-{PARENT_ID}-01", None),
+    (f"00-{'0' * 32}-{PARENT_ID}-01", None),
+    (f"00-{TRACE_ID}-{'0' * 16}-01", None),
+    ("garbage", None),
+    (None, None)
+])
+def test_traceparent_parsing(header, expected):
+    assert parse_traceparent(header) == expected
+
+def test_request_start_header_units():
+    now = time.time()
+    for header in (f"t={now:.6f}", f"{now * 1e3:.0f}", f"t={now * 1e6:.0f}"):
+        assert abs(queue_start_ns(header) - now * 1e9) < 1e6
+    assert queue_start_ns("t=abc") is None and queue_start_ns("12") is None
+
+def test_nested_spans_and_propagation(exporter):
+    with start_span("outer") as outer:
+        with start_span("inner", rows=3) as inner:
+            headers = inject({})
+        with pytest.raises(RuntimeError):
+            with start_span("failing"):
+                raise RuntimeError("boom")
+    assert inner.trace_id == outer.trace_id and inner.parent_id == outer.span_id
+    assert headers["traceparent"] == f"00-{outer.trace_id}-{inner.span_id}-01"
+    assert [span.name for span in exporter.spans] == ["inner", "failing", "outer"]
+    assert exporter.spans[1].error == "RuntimeError: boom"
+    assert inject({}) == {}
+
+def test_requests_continue_the_incoming_trace(exporter):
+    app = Flask(__name__)
+    init_tracing(app)
+
+    @app.route("/work", methods=["POST"])
+    def work():
+        with start_span("encode"):
+            return jsonify({"traceparent": inject({})["traceparent"]})
+
+    response = app.test_client().post("/work", json={"a": 1}, headers={"traceparent": f"00-{TRACE_ID}-{PARENT_ID}-01"})
+    spans = {span.name: span for span in exporter.spans}
+    request_span = spans["POST /work"]
+    assert request_span.trace_id == TRACE_ID and request_span.parent_id == PARENT_ID
+    assert request_span.attributes["http.status_code"] == 200
+    assert spans["parse"].parent_id == spans["encode"].parent_id == request_span.span_id
+    assert response.headers["traceresponse"] == request_span.traceparent()
+    assert response.get_json()["traceparent"].split("-")[2] == spans["encode"].span_id
+    # Finished once, even though the test client may run teardown twice
+    assert sum(span.name == "POST /work" for span in exporter.spans) == 1
+
+def test_otlp_payload_shape():
+    span = tracing.Span("encode", TRACE_ID, PARENT_ID)
+    span.set(rows=3, ratio=0.5, cached=True, model="mini")
+    span.error = "RuntimeError: boom"
+    span.finish()
+    exporter = tracing.OTLPExporter.__new__(tracing.OTLPExporter)
+    payload = exporter.payload([span])
+    otlp_span = payload["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+    assert otlp_span["traceId"] == TRACE_ID and otlp_span["parentSpanId"] == PARENT_ID
+    assert {attribute["key"]: attribute["value"] for attribute in otlp_span["attributes"]} == {
+        "rows": {"intValue": "3"}, "ratio": {"doubleValue": 0.5}, "cached": {"boolValue": True}, "model": {"stringValue": "mini"}
+    }
+    assert otlp_span["status"] == {"code": 2, "message": "RuntimeError: boom"}
@@ -0,0 +1,77 @@
+import re
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+from utils import transformer as transformer_module
+from utils.transformer import Transformer
+
+class FakeTokenizer:
+    """One token per word."""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=True):
+        return {"offset_mapping": [match.span() for match in re.finditer(r"\S+", text)]}
+
+class FakeModel:
+    max_seq_length = 10
+
+    def __init__(self, name):
+        self.tokenizer = FakeTokenizer()
+        self.calls = 0
+
+    def embed(self, text):
+        vector = np.array([len(text), text.count("a") + 1, 1.0], dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode(self, texts, batch_size=None, normalize_embeddings=True):
+        self.calls += 1
+        if isinstance(texts, list):
+            return np.stack([self.embed(text) for text in texts])
+        return self.embed(texts)
+
+@pytest.fixture
+def transformer(monkeypatch):
+    monkeypatch.setattr(transformer_module, "SentenceTransformer", FakeModel)
+    return Transformer(chunk_overlap=2)
+
+SHORT = "blood glucose high"
+LONG = " ".join(f"word{i}" for i in range(20))
+
+@pytest.mark.parametrize("data", [
+    {"description": None},
+    {"description": 42},
+    {"description": ["a", "b"]},
+    {"description": SHORT, "chunking": "median"}
+])
+def test_invalid_requests_are_value_errors(transformer, data):
+    with pytest.raises(ValueError):
+        transformer.create_vector(data)
+
+def test_long_descriptions_are_split_on_overlapping_windows(transformer):
+    spans = transformer.split(LONG)
+    assert len(spans) > 1
+    assert spans[0][0] == 0 and spans[-1][1] == len(LONG)
+    # Each window starts before the previous one ends
+    assert all(next_start < end for (_, end), (next_start, _) in zip(spans, spans[1:]))
+
+@pytest.mark.parametrize("description", [SHORT, LONG])
+def test_response_keys_do_not_depend_on_the_length(transformer, description):
+    chunks = transformer.create_vector({"description": description, "chunking": "chunks"})
+    assert set(chunks) == {"description", "truncated", "chunk_count", "chunks"}
+    assert chunks["chunk_count"] == len(chunks["chunks"])
+    for mode in ("mean", "max"):
+        pooled = transformer.create_vector({"description": description, "chunking": mode})
+        assert set(pooled) == {"description", "truncated", "chunk_count", "vector"}
+        assert np.linalg.norm(pooled["vector"]) == pytest.approx(1.0)
+    plain = transformer.create_vector({"description": description})
+    assert set(plain) == {"description", "vector", "truncated"}
+    assert plain["truncated"] == (description == LONG)
+
+def test_cached_responses_are_not_shared(transformer):
+    first = transformer.create_vector({"description": SHORT})
+    first["model"] = "changed"
+    second = transformer.create_vector({"description": SHORT})
+    assert "model" not in second
+    assert transformer.model.calls == 1
+    with pytest.raises(ValueError):
+        second["vector"][0] = 0
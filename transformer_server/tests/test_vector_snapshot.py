@@ -0,0 +1,102 @@
+import json
+import os
+import numpy as np
+import pytest
+from utils.lexical_index import LexicalIndex
+from utils.vector_snapshot import SnapshotReader, write_snapshot, read_current, snapshot_name
+from utils.vector_store import VectorStore
+
+DIMENSION = 8
+
+def unit_vectors(count, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def fill(store, vectors, start=0):
+    for i, vector in enumerate(vectors, start=start):
+        store.add(vector, f"description {i}", {"PatientID": f"p{i % 3}", "ResourceID": str(i)})
+
+def brute_force(vectors, query, k):
+    scores = vectors @ query
+    top = np.argsort(-scores, kind="stable")[:k]
+    return [(int(i) + 1, pytest.approx(float(scores[i]), abs=1e-5)) for i in top]
+
+def downgrade_to_v1(directory):
+    """Rewrite the live snapshot the way format 1 laid it out: one vector per row, no canonical.i64."""
+    path = os.path.join(directory, snapshot_name(read_current(directory)))
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    assert manifest["vector_count"] == manifest["count"]
+    os.remove(os.path.join(path, "canonical.i64"))
+    manifest.update(format_version=1, graph_degree=0, files=[name for name in manifest["files"] if name != "canonical.i64"])
+    del manifest["vector_count"], manifest["lexical_total"]
+    with open(os.path.join(path, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+def test_append_log_replayed_on_top_of_the_snapshot(tmp_path):
+    vectors = unit_vectors(30, seed=1)
+    store = VectorStore(DIMENSION, directory=str(tmp_path), dedup_threshold=1.1)
+    fill(store, vectors[:20])
+    store.snapshot()
+    fill(store, vectors[20:], start=20)
+    store.log.close()
+
+    reopened = VectorStore(DIMENSION, directory=str(tmp_path), dedup_threshold=1.1)
+    assert len(reopened) == 30
+    assert len(reopened.descriptions) == 10
+    for query in vectors[::7]:
+        assert reopened.search(query, 5) == brute_force(vectors, query, 5)
+
+def test_torn_log_record_is_cut_off(tmp_path):
+    vectors = unit_vectors(5, seed=2)
+    store = VectorStore(DIMENSION, directory=str(tmp_path), dedup_threshold=1.1)
+    fill(store, vectors)
+    store.log.close()
+    with open(store.log.path, "r+b") as f:
+        f.truncate(os.path.getsize(store.log.path) - 3)
+
+    reopened = VectorStore(DIMENSION, directory=str(tmp_path), dedup_threshold=1.1)
+    assert len(reopened) == 4
+    reopened.add(vectors[4], "again", {})
+    reopened.log.close()
+    assert len(VectorStore(DIMENSION, directory=str(tmp_path), dedup_threshold=1.1)) == 5
+
+def test_v1_snapshot_still_opens(tmp_path):
+    vectors = unit_vectors(25, seed=3)
+    rows = ({"Description": f"description {i}", "PatientID": f"p{i % 2}"} for i in range(25))
+    write_snapshot(str(tmp_path), [vectors], DIMENSION, rows)
+    downgrade_to_v1(str(tmp_path))
+
+    store = VectorStore(DIMENSION, directory=str(tmp_path))
+    assert store.base.manifest["format_version"] == 1
+    assert store.base.canonical is None
+    assert store.base.lexical_terms is None
+    assert len(store) == 25
+    assert store.search(vectors[3], 3) == brute_force(vectors, vectors[3], 3)
+
+    # The next snapshot is written in the current format
+    store.add(vectors[4], "appended", {"PatientID": "p9"})
+    store.snapshot()
+    assert store.base.manifest["format_version"] == 2
+    assert len(store) == 26
+    assert store.search(vectors[4], 1)[0][0] in (5, 26)
+
+def test_lexical_index_round_trip(tmp_path):
+    texts = ["glucose 2345-7 high", "hemoglobin a1c 4548-4", "glucose fasting", "blood pressure high", "glucose 2345-7 normal"]
+    vectors = unit_vectors(len(texts), seed=4)
+    reference = LexicalIndex()
+    for id, text in enumerate(texts, start=1):
+        reference.add(id, text)
+    rows = ({"Description": text} for text in texts)
+    write_snapshot(str(tmp_path), [vectors], DIMENSION, rows, lexical=reference.export())
+
+    index = LexicalIndex()
+    index.open(SnapshotReader(str(tmp_path)))
+    index.add(6, "glucose random")
+    reference.add(6, "glucose random")
+
+    assert len(index) == 6
+    assert sorted(index.lookup("2345-7")) == [1, 5]
+    for query in ("glucose high", "2345-7", "blood", "missing"):
+        assert index.search(query, 10) == pytest.approx(reference.search(query, 10))
+    assert index.search("glucose", 10, allowed={3, 6}) == pytest.approx(reference.search("glucose", 10, allowed={3, 6}))
@@ -0,0 +1,71 @@
+import numpy as np
+from utils.vector_store import VectorStore
+
+DIMENSION = 8
+
+def unit_vectors(count, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def fill(store, vectors, start=0):
+    for i, vector in enumerate(vectors, start=start):
+        store.add(vector, f"description {i}", {"PatientID": f"p{i % 3}", "ResourceID": str(i)})
+
+def nudged(vector, amount=0.01, seed=1):
+    noise = np.random.default_rng(seed).standard_normal(DIMENSION).astype(np.float32)
+    vector = vector + amount * noise
+    return vector / np.linalg.norm(vector)
+
+def test_exact_duplicates_share_a_vector_by_default():
+    vectors = unit_vectors(10)
+    store = VectorStore(DIMENSION)
+    fill(store, np.concatenate([vectors, vectors[:3]]))
+    metrics = store.get_metrics()
+    assert (metrics["rows"], metrics["vectors"], metrics["exact_duplicates"]) == (13, 10, 3)
+    assert sorted(id for id, _ in store.search(vectors[1], 2)) == [2, 12]
+
+def test_near_duplicates_kept_apart_unless_opted_in():
+    vectors = unit_vectors(10)
+    close = nudged(vectors[0])
+    assert float(close @ vectors[0]) > 0.98
+
+    store = VectorStore(DIMENSION)
+    fill(store, np.concatenate([vectors, [close]]))
+    assert store.get_metrics()["vectors"] == 11
+    assert store.search(close, 1)[0][0] == 11
+
+    merging = VectorStore(DIMENSION, dedup_threshold=0.98)
+    fill(merging, np.concatenate([vectors, [close]]))
+    assert merging.get_metrics()["vectors"] == 10
+    assert merging.get_metrics()["near_duplicates"] == 1
+    np.testing.assert_array_equal(merging.vector(11), vectors[0])
+
+def test_exact_duplicates_of_snapshot_vectors_found_by_digest(tmp_path):
+    vectors = unit_vectors(20, seed=2)
+    store = VectorStore(DIMENSION, directory=str(tmp_path))
+    fill(store, vectors)
+    store.snapshot()
+    store.add(vectors[7], "again", {"PatientID": "p9"})
+    assert store.get_metrics()["vectors"] == 20
+    assert store.vector_indexes([21])[0] == 7
+
+def test_v2_round_trip_with_shared_vectors(tmp_path):
+    vectors = unit_vectors(40)
+    # Rows 41-50 repeat the vectors of rows 1-10 exactly
+    rows = np.concatenate([vectors, vectors[:10]])
+    store = VectorStore(DIMENSION, directory=str(tmp_path))
+    fill(store, rows)
+    assert store.get_metrics()["vectors"] == 40
+    store.snapshot()
+    store.log.close()
+
+    reopened = VectorStore(DIMENSION, directory=str(tmp_path))
+    assert len(reopened) == 50
+    assert reopened.base.manifest["format_version"] == 2
+    assert reopened.get_metrics()["vectors"] == 40
+    assert reopened.get(45) == {"ID": 45, "Description": "description 44", "BundleID": "", "ResourceID": "44", "ResourceType": "", "PatientID": "p2"}
+    np.testing.assert_array_equal(reopened.vector(45), vectors[4])
+    assert sorted(id for id, _ in reopened.search(vectors[4], 2)) == [5, 45]
+    assert sorted(reopened.partition("p1")) == [i + 1 for i in range(50) if i % 3 == 1]
+    # Patient search scores each shared vector once and still returns every row
+    assert {id for id, _ in reopened.search(vectors[4], 50, "p2")} == set(reopened.partition("p2"))
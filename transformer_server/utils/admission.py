@@ -0,0 +1,194 @@
+import math
+import os
+import threading
+import time
+from flask import request, g, jsonify
+from utils.metrics import ADMISSION_REJECTED, ADMISSION_QUEUE_WAIT, ADMISSION_QUEUED, ADMISSION_OVERLOADED
+from utils.model_router import LATENCY_SLO_MS, MODEL_PARALLELISM
+from utils.tracing import start_span
+
+# Budgets of the routes under admission control, the other routes are never queued.
+# concurrency: requests worked on at once, the others wait in the route's queue
+# target_ms: queueing delay the route tolerates, above it for a whole interval the route is overloaded
+# interval_ms: window over which the smallest queueing delay is tracked, about one slow request
+# max_queue: requests allowed to wait, arrivals beyond it are rejected at once
+# service_ms: expected time to serve a request, until requests were measured
+# Without target_ms / interval_ms both follow the measured service time (see AdmissionController).
+# /flatten runs one generation per Ollama slot (backends x OLLAMA_NUM_PARALLEL, set by main.py) and
+# a generation takes seconds to tens of seconds, so its delays are sized from the service time.
+# /flatten/jobs is not listed: a submission only enqueues, its JobManager queue is bounded (429 when
+# full) and its fixed workers bound the generations it runs at once.
+ADMISSION_BUDGETS = {
+    "/transform": {"concurrency": os.cpu_count() or 4, "target_ms": 50, "interval_ms": 500, "max_queue": 64},
+    "/flatten": {"concurrency": MODEL_PARALLELISM, "service_ms": LATENCY_SLO_MS, "max_queue": 16}
+}
+# Smoothing of the service time used for the Retry-After estimate and the derived delays
+SERVICE_TIME_ALPHA = 0.2
+# Derived interval in service times: every slot turns over at least once per interval
+SERVICE_TIMES_PER_INTERVAL = 2
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """
+    Bounded queue in front of a route, shedding load on queueing delay like CoDel.
+
+    The smallest time a request waited for a slot is tracked over each interval.
+    If even that minimum stays above the target, the queue never drained and the
+    route is overloaded: waiting requests then give up after `target` instead of
+    `interval`, so the backlog is cut back to what the route serves in time and
+    the rest get a fast 429 instead of timing out upstream after the work is done.
+
+    Routes whose requests take seconds cannot use fixed delays: a request
+    arriving behind full slots waits about service time / concurrency for one
+    to free up even without a backlog. Without a fixed target the target is
+    that wait, and without a fixed interval the interval is
+    SERVICE_TIMES_PER_INTERVAL service times, both following the measured
+    service time (seeded with service_ms).
+    """
+
+    def __init__(self, route: str, concurrency: int, max_queue: int, target_ms=None, interval_ms=None, service_ms=None):
+        if concurrency < 1 or max_queue < 0 or (target_ms is not None and target_ms <= 0) or (interval_ms is not None and interval_ms < (target_ms or 0)):
+            raise ValueError(f"Invalid admission budget for {route}")
+        if (target_ms is None or interval_ms is None) and (service_ms is None or service_ms <= 0):
+            raise ValueError(f"Admission budget for {route} needs service_ms without target_ms and interval_ms")
+        self.route = route
+        self.concurrency = concurrency
+        self.fixed_target = target_ms / 1000 if target_ms is not None else None
+        self.fixed_interval = interval_ms / 1000 if interval_ms is not None else None
+        self.max_queue = max_queue
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.overloaded = False
+        self.service_time = service_ms / 1000 if service_ms is not None else self.fixed_target
+        self.interval_end = time.monotonic() + self.interval()
+        self.min_wait = math.inf
+        self.metrics = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_queue_timeout": 0
+        }
+
+    def target(self) -> float:
+        """Queueing delay tolerated, in seconds."""
+        if self.fixed_target is not None:
+            return self.fixed_target
+        return self.service_time / self.concurrency
+
+    def interval(self) -> float:
+        """Window of the smallest queueing delay, in seconds, never shorter than the target."""
+        if self.fixed_interval is not None:
+            return max(self.fixed_interval, self.target())
+        return max(SERVICE_TIMES_PER_INTERVAL * self.service_time, self.target())
+
+    def observe_wait(self, wait: float, now: float):
+        """CoDel state update, with the condition held."""
+        self.min_wait = min(self.min_wait, wait)
+        if now >= self.interval_end:
+            self.overloaded = self.min_wait > self.target()
+            self.min_wait = math.inf
+            self.interval_end = now + self.interval()
+            ADMISSION_OVERLOADED.set(int(self.overloaded), route=self.route)
+        ADMISSION_QUEUE_WAIT.observe(wait, route=self.route)
+
+    def retry_after(self) -> int:
+        """Seconds for the current backlog to drain, at least 1 as Retry-After takes whole seconds."""
+        return max(1, math.ceil((self.waiting + 1) * self.service_time / self.concurrency))
+
+    def acquire(self) -> float:
+        """
+        Wait for a slot of the route.
+
+        :return: The time spent waiting, in seconds
+        :raises Overloaded: If the queue is full or the request waited longer than the route allows
+        """
+        with self.condition:
+            start = time.monotonic()
+            if self.in_flight < self.concurrency and self.waiting == 0:
+                self.in_flight += 1
+                self.metrics["admitted"] += 1
+                self.observe_wait(0.0, start)
+                return 0.0
+            if self.waiting >= self.max_queue:
+                self.metrics["rejected_queue_full"] += 1
+                raise Overloaded("queue_full", self.retry_after())
+
+            self.waiting += 1
+            ADMISSION_QUEUED.set(self.waiting, route=self.route)
+            timeout = self.target() if self.overloaded else self.interval()
+            admitted = self.condition.wait_for(lambda: self.in_flight < self.concurrency, timeout)
+            self.waiting -= 1
+            ADMISSION_QUEUED.set(self.waiting, route=self.route)
+            now = time.monotonic()
+            self.observe_wait(now - start, now)
+            if not admitted:
+                self.metrics["rejected_queue_timeout"] += 1
+                raise Overloaded("queue_timeout", self.retry_after())
+            self.in_flight += 1
+            self.metrics["admitted"] += 1
+            return now - start
+
+    def release(self, service_time: float):
+        with self.condition:
+            self.in_flight -= 1
+            self.service_time += SERVICE_TIME_ALPHA * (service_time - self.service_time)
+            self.condition.notify()
+
+    def get_metrics(self) -> dict:
+        with self.condition:
+            return {
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "overloaded": self.overloaded,
+                "service_time_ms": self.service_time * 1000,
+                "target_ms": self.target() * 1000,
+                "interval_ms": self.interval() * 1000,
+                **self.metrics
+            }
+
+# Controllers by route rule, filled by init_admission
+controllers = {}
+
+def before_request():
+    controller = controllers.get(request.url_rule.rule if request.url_rule is not None else None)
+    if controller is None:
+        return None
+    try:
+        # Child of the request span, tracing is installed first
+        with start_span("queue_wait", queue="admission", route=controller.route):
+            controller.acquire()
+    except Overloaded as e:
+        ADMISSION_REJECTED.inc(route=controller.route, reason=e.reason)
+        response = jsonify({"error": f"{controller.route} is overloaded, retry later", "reason": e.reason})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
+    g.admission = controller
+    g.admission_start = time.monotonic()
+
+def teardown_request(exc):
+    # Runs whatever the route did, a slot is never leaked
+    if "admission" in g:
+        g.pop("admission").release(time.monotonic() - g.admission_start)
+
+def get_metrics() -> dict:
+    return {route: controller.get_metrics() for route, controller in controllers.items()}
+
+def init_admission(app, budgets=ADMISSION_BUDGETS):
+    """
+    Put the routes of `budgets` behind admission control, overloaded routes answer 429 with a Retry-After.
+
+    Install it after init_tracing so the time spent queued is a span of the request.
+
+    :param budgets: Route rule to {concurrency, max_queue, target_ms, interval_ms, service_ms}
+    """
+    for route, budget in budgets.items():
+        controllers[route] = AdmissionController(route, **budget)
+    app.before_request(before_request)
+    app.teardown_request(teardown_request)
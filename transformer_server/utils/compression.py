@@ -0,0 +1,124 @@
+import gzip
+import io
+import json
+import zlib
+from flask import request
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Responses smaller than this are sent as is, compressing them costs more than it saves
+COMPRESSION_THRESHOLD = 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# Limit on the decompressed size of a request body, against decompression bombs
+MAX_DECOMPRESSED_BYTES = 64 * 1024 * 1024
+
+def supported_encodings() -> list:
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+def zstd_complete(data: bytes) -> bool:
+    """Whether every zstd frame of the data is complete."""
+    while data:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        decompressor.decompress(data)
+        if not decompressor.eof:
+            return False
+        data = decompressor.unused_data
+    return True
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    """
+    Decompress a request body.
+
+    :param encoding: Value of the Content-Encoding header
+    :return: The decompressed body
+    :raises ValueError: If the encoding is unsupported, the body is corrupt, truncated or too large
+    """
+    if encoding == "gzip":
+        body = b""
+        try:
+            # A body may hold several gzip members back to back, each must be complete
+            while True:
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                body += decompressor.decompress(data, MAX_DECOMPRESSED_BYTES + 1 - len(body))
+                if len(body) > MAX_DECOMPRESSED_BYTES:
+                    break
+                if not decompressor.eof:
+                    raise ValueError("Truncated or corrupt gzip body: it ends before the end of its stream")
+                data = decompressor.unused_data
+                if not data:
+                    break
+        except zlib.error as e:
+            raise ValueError(f"Invalid gzip body: {e}")
+    elif encoding == "zstd" and zstandard is not None:
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True) as reader:
+                body = reader.read(MAX_DECOMPRESSED_BYTES + 1)
+            # The reader returns what it could decode of a truncated frame without an error,
+            # a bounded body is decoded again frame by frame to find where it stops
+            if len(body) <= MAX_DECOMPRESSED_BYTES and not zstd_complete(data):
+                raise ValueError("Truncated or corrupt zstd body: it ends before the end of its frame")
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Invalid zstd body: {e}")
+    else:
+        raise ValueError(f"Unsupported Content-Encoding '{encoding}', expected one of {supported_encodings()}")
+    if len(body) > MAX_DECOMPRESSED_BYTES:
+        raise ValueError(f"Decompressed body is larger than {MAX_DECOMPRESSED_BYTES} bytes")
+    return body
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+class DecompressingMiddleware:
+    """WSGI middleware replacing compressed request bodies by their decompressed content."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if encoding and encoding != "identity":
+            try:
+                length = int(environ.get("CONTENT_LENGTH") or 0)
+                body = decompress(environ["wsgi.input"].read(length) if length else environ["wsgi.input"].read(), encoding)
+            except ValueError as e:
+                status = "415 Unsupported Media Type" if str(e).startswith("Unsupported") else "400 Bad Request"
+                payload = json.dumps({"error": str(e)}).encode("utf-8")
+                start_response(status, [("Content-Type", "application/json"), ("Content-Length", str(len(payload)))])
+                return [payload]
+            environ["wsgi.input"] = io.BytesIO(body)
+            environ["CONTENT_LENGTH"] = str(len(body))
+            del environ["HTTP_CONTENT_ENCODING"]
+        return self.wsgi_app(environ, start_response)
+
+def compress_response(response, threshold=COMPRESSION_THRESHOLD):
+    """Compress a response with the best encoding the client accepts, when it is large enough."""
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 304)
+            or "Content-Encoding" in response.headers):
+        return response
+    response.vary.add("Accept-Encoding")
+    data = response.get_data()
+    if len(data) < threshold:
+        return response
+    for encoding in supported_encodings():
+        if request.accept_encodings[encoding] > 0:
+            response.set_data(compress(data, encoding))
+            response.headers["Content-Encoding"] = encoding
+            break
+    return response
+
+def init_compression(app, threshold=COMPRESSION_THRESHOLD):
+    """
+    Add transparent Content-Encoding support to a Flask app.
+
+    Request bodies sent with Content-Encoding gzip (or zstd when zstandard is
+    installed) are decompressed before the routes see them; responses of at
+    least `threshold` bytes are compressed when the client accepts it.
+    """
+    app.wsgi_app = DecompressingMiddleware(app.wsgi_app)
+    app.after_request(lambda response: compress_response(response, threshold))
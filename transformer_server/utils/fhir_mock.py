@@ -1,67 +1,171 @@
-import uuid
 import datetime
+import os
+import re
+import uuid
+from utils.json_provider import dumps
+
+# Placeholders of the values that change between acknowledgements
+ACK_PLACEHOLDERS = {"id": "__ID__", "op_id": "__OP_ID__", "mh_id": "__MH_ID__", "timestamp": "__TIMESTAMP__"}
+# The identifier is any JSON value of the request, substituted already encoded
+ACK_IDENTIFIER = "__IDENTIFIER__"
+
+def new_ids() -> tuple:
+    """Three random (version 4) UUIDs out of a single read of the OS random source."""
+    random = os.urandom(48)
+    return tuple(str(uuid.UUID(bytes=random[i:i + 16], version=4)) for i in (0, 16, 32))
+
+def acknowledgement(id: str, op_id: str, mh_id: str, timestamp: str, identifier) -> dict:
+    """Message bundle acknowledging a request, a MessageHeader pointing to a successful OperationOutcome."""
+    operation_outcome = {
+        "resourceType": "OperationOutcome",
+        "id": f"oo-{op_id}",
+        "issue": [
+            {
+                "severity": "information",
+                "code": "informational",
+                "details": {
+                    "text": "Operation completed successfully"
+                }
+            }
+        ]
+    }
+
+    message_header = {
+        "resourceType": "MessageHeader",
+        "id": f"mh-{mh_id}",
+        "eventCoding": {
+            "system": "http://hl7.org/fhir/message-events",
+            "code": "operation-complete",
+            "display": "FHIR Operation Completed"
+        },
+        "source": {
+            "name": "FHIR Mock API",
+            "endpoint": "http://localhost:5000"
+        },
+        "focus": [
+            {
+                "reference": f"OperationOutcome/oo-{op_id}"
+            }
+        ],
+        "response": {
+            "identifier": identifier,
+            "code": "ok"
+        }
+    }
+
+    return {
+        "resourceType": "Bundle",
+        "id": id,
+        "type": "message",
+        "timestamp": timestamp,
+        "entry": [
+            {
+                "fullUrl": f"MessageHeader/mh-{mh_id}",
+                "resource": message_header
+            },
+            {
+                "fullUrl": f"OperationOutcome/oo-{op_id}",
+                "resource": operation_outcome
+            }
+        ]
+    }
+
+def compile_acknowledgement() -> tuple:
+    """
+    Serialize the acknowledgement once with placeholders and cut it around them.
+
+    :return: The constant text pieces, and the name of the value going between each two of them
+    """
+    text = dumps(acknowledgement(identifier=ACK_IDENTIFIER, **ACK_PLACEHOLDERS)).decode("utf-8")
+    names = {placeholder: name for name, placeholder in ACK_PLACEHOLDERS.items()}
+    names[f'"{ACK_IDENTIFIER}"'] = "identifier"
+    parts = re.split("(" + "|".join(re.escape(placeholder) for placeholder in names) + ")", text)
+    return parts[0::2], [names[placeholder] for placeholder in parts[1::2]]
+
+ACK_PIECES, ACK_SLOTS = compile_acknowledgement()
 
 class MockFHIR():
     def __init__(self):
-        self.id = str(uuid.uuid4())
-        self.op_id = str(uuid.uuid4())
-        self.mh_id = str(uuid.uuid4())
+        self.id, self.op_id, self.mh_id = new_ids()
         self.timestamp = datetime.datetime.utcnow().isoformat() + "Z"
     
     def create_response(self, data: dict) -> dict:
-        response_id = data.get("id")
-        
-        operation_outcome = {
-            "resourceType": "OperationOutcome",
-            "id": f"oo-{self.op_id}",
-            "issue": [
-                {
-                    "severity": "information",
-                    "code": "informational",
-                    "details": {
-                        "text": "Operation completed successfully"
-                    }
-                }
-            ]
+        if data.get("type") in ("batch", "transaction"):
+            return self.create_batch_response(data)
+        return acknowledgement(self.id, self.op_id, self.mh_id, self.timestamp, data.get("id"))
+
+    def render_response(self, data: dict) -> bytes:
+        """
+        The JSON of create_response(data).
+
+        Acknowledgements come from the precompiled template with only the ids,
+        timestamp and identifier filled in, batch responses are serialized.
+        """
+        if data.get("type") in ("batch", "transaction"):
+            return dumps(self.create_batch_response(data))
+        values = {
+            "id": self.id,
+            "op_id": self.op_id,
+            "mh_id": self.mh_id,
+            "timestamp": self.timestamp,
+            "identifier": dumps(data.get("id")).decode("utf-8")
         }
+        pieces = [ACK_PIECES[0]]
+        for slot, piece in zip(ACK_SLOTS, ACK_PIECES[1:]):
+            pieces.append(values[slot])
+            pieces.append(piece)
+        return "".join(pieces).encode("utf-8")
 
-        message_header = {
-            "resourceType": "MessageHeader",
-            "id": f"mh-{self.mh_id}",
-            "eventCoding": {
-                "system": "http://hl7.org/fhir/message-events",
-                "code": "operation-complete",
-                "display": "FHIR Operation Completed"
-            },
-            "source": {
-                "name": "FHIR Mock API",
-                "endpoint": "http://localhost:5000"
-            },
-            "focus": [
-                {
-                    "reference": f"OperationOutcome/oo-{self.op_id}"
+    def create_batch_response(self, data: dict) -> dict:
+        """
+        Answer a batch or transaction bundle with one response entry per request entry, in the same order.
+
+        Message bundles posted to $process-message get their message response as the entry resource.
+        A transaction is all or nothing: one invalid entry fails the whole request with a ValueError.
+        """
+        entries = []
+        for index, entry in enumerate(data["entry"]):
+            resource = entry.get("resource") if isinstance(entry, dict) else None
+            if not isinstance(resource, dict) or "resourceType" not in resource or "request" not in entry:
+                if data["type"] == "transaction":
+                    raise ValueError(f"Invalid transaction entry {index}")
+                entries.append({
+                    "response": {
+                        "status": "400 Bad Request",
+                        "outcome": {
+                            "resourceType": "OperationOutcome",
+                            "issue": [
+                                {
+                                    "severity": "error",
+                                    "code": "invalid",
+                                    "details": {
+                                        "text": "Entry needs a 'resource' with a 'resourceType' and a 'request'"
+                                    }
+                                }
+                            ]
+                        }
+                    }
+                })
+                continue
+
+            resource_id = resource.get("id") or str(uuid.uuid4())
+            response = {
+                "response": {
+                    "status": "201 Created",
+                    "location": f"{resource['resourceType']}/{resource_id}/_history/1",
+                    "etag": 'W/"1"',
+                    "lastModified": self.timestamp
                 }
-            ],
-            "response": {
-                "identifier": response_id,
-                "code": "ok"
             }
-        }
+            if resource["resourceType"] == "Bundle" and resource.get("type") == "message":
+                response["response"]["status"] = "200 OK"
+                response["resource"] = MockFHIR().create_response(resource)
+            entries.append(response)
 
         return {
             "resourceType": "Bundle",
             "id": self.id,
-            "type": "message",
+            "type": f"{data['type']}-response",
             "timestamp": self.timestamp,
-            "entry": [
-                {
-                    "fullUrl": f"MessageHeader/mh-{self.mh_id}",
-                    "resource": message_header
-                },
-                {
-                    "fullUrl": f"OperationOutcome/oo-{self.op_id}",
-                    "resource": operation_outcome
-                }
-            ]
+            "entry": entries
         }
-
@@ -0,0 +1,163 @@
+import queue
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+import requests
+from utils.metrics import JOBS_TOTAL, JOBS_QUEUED, JOB_QUEUE_WAIT
+from utils.tracing import Span, current_span, start_span, inject
+
+# Background workers running jobs, each holds one Ollama generation at a time
+JOB_WORKERS = 2
+# Jobs waiting for a worker, submissions beyond it are refused
+MAX_QUEUED_JOBS = 256
+# Finished jobs are kept this long for polling, then forgotten
+JOB_RESULT_TTL = 3600
+CALLBACK_TIMEOUT = 10
+CALLBACK_RETRIES = 3
+JOB_STATES = ("queued", "running", "done", "failed")
+
+class QueueFull(Exception):
+    pass
+
+class JobManager:
+    """
+    Runs submitted work on a pool of background threads.
+
+    The caller gets a job id at once and polls the job, or gives a callback
+    URL the finished job is POSTed to. Finished jobs are kept for `ttl`
+    seconds.
+    """
+
+    def __init__(self, work, workers=JOB_WORKERS, max_queued=MAX_QUEUED_JOBS, ttl=JOB_RESULT_TTL, name="job"):
+        """
+        :param work: Function called with the submitted payload, its return value is the job result
+        """
+        self.work = work
+        self.name = name
+        self.ttl = ttl
+        self.queue = queue.Queue(max_queued)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        # Expiry time of the finished jobs, in finishing (so expiry) order
+        self.expiries = {}
+        self.workers = [threading.Thread(target=self.run, daemon=True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, payload, callback_url=None) -> dict:
+        """
+        Queue a job.
+
+        :param callback_url: http(s) URL the finished job is POSTed to
+        :return: The queued job
+        :raises ValueError: If the callback URL is invalid
+        :raises QueueFull: If too many jobs are waiting
+        """
+        if callback_url is not None and (urlparse(callback_url).scheme not in ("http", "https") or not urlparse(callback_url).netloc):
+            raise ValueError(f"Invalid callback_url '{callback_url}', expected an http(s) URL")
+        span = current_span.get()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None,
+            "callback_url": callback_url,
+            "callback_status": None
+        }
+        with self.lock:
+            self.expire()
+            self.jobs[job["id"]] = job
+        try:
+            # The job continues the trace of the request that submitted it
+            self.queue.put_nowait((job, payload, (span.trace_id, span.span_id) if span is not None else None))
+        except queue.Full:
+            with self.lock:
+                self.jobs.pop(job["id"])
+            JOBS_TOTAL.inc(job=self.name, status="rejected")
+            raise QueueFull(f"{self.queue.maxsize} {self.name} jobs already waiting")
+        JOBS_QUEUED.set(self.queue.qsize(), job=self.name)
+        return self.view(job)
+
+    def get(self, job_id: str):
+        with self.lock:
+            self.expire()
+            job = self.jobs.get(job_id)
+            return self.view(job) if job is not None else None
+
+    def view(self, job: dict) -> dict:
+        """A copy of the job, safe to serialize while a worker updates it."""
+        return dict(job)
+
+    def expire(self):
+        """Forget the finished jobs past their TTL, with the lock held."""
+        now = time.time()
+        for job_id, expires_at in list(self.expiries.items()):
+            if expires_at > now:
+                break
+            del self.expiries[job_id]
+            self.jobs.pop(job_id, None)
+
+    def run(self):
+        while True:
+            job, payload, parent = self.queue.get()
+            JOBS_QUEUED.set(self.queue.qsize(), job=self.name)
+            started = time.time()
+            JOB_QUEUE_WAIT.observe(started - job["created_at"], job=self.name)
+            with self.lock:
+                job.update(status="running", started_at=started)
+
+            span = Span(f"{self.name}_job", *parent) if parent is not None else None
+            token = current_span.set(span) if span is not None else None
+            try:
+                result, error = self.work(payload), None
+            except Exception as e:
+                result, error = None, f"{type(e).__name__}: {e}"
+            finished = time.time()
+            with self.lock:
+                job.update(status="done" if error is None else "failed", result=result, error=error, finished_at=finished)
+                self.expiries[job["id"]] = finished + self.ttl
+            JOBS_TOTAL.inc(job=self.name, status=job["status"])
+
+            if job["callback_url"] is not None:
+                self.deliver(job)
+            if span is not None:
+                current_span.reset(token)
+                span.set(job_id=job["id"], status=job["status"])
+                span.error = error
+                span.finish()
+
+    def deliver(self, job: dict):
+        """POST the finished job to its callback URL, retrying with backoff."""
+        for attempt in range(CALLBACK_RETRIES):
+            try:
+                with start_span("callback", attempt=attempt):
+                    with self.lock:
+                        body = self.view(job)
+                    response = requests.post(job["callback_url"], json=body, headers=inject({}), timeout=CALLBACK_TIMEOUT)
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            with self.lock:
+                job["callback_status"] = status
+            if isinstance(status, int) and status < 500:
+                return
+            if attempt + 1 < CALLBACK_RETRIES:
+                time.sleep(2 ** attempt)
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            self.expire()
+            states = {state: 0 for state in JOB_STATES}
+            for job in self.jobs.values():
+                states[job["status"]] += 1
+        return {
+            "workers": len(self.workers),
+            "queue_depth": self.queue.qsize(),
+            "max_queued": self.queue.maxsize,
+            "result_ttl": self.ttl,
+            "jobs": states
+        }
@@ -0,0 +1,59 @@
+import json
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def default(value):
+    """Types the encoders do not know natively: NumPy values (stdlib only), sets, objects with to_dict()."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+if orjson is not None:
+    # NumPy arrays and scalars are written by orjson itself, float32 vectors without a Python float per value
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(value) -> bytes:
+        return orjson.dumps(value, default=default, option=ORJSON_OPTIONS)
+
+    loads = orjson.loads
+else:
+    def dumps(value) -> bytes:
+        return json.dumps(value, default=default, separators=(",", ":")).encode("utf-8")
+
+    loads = json.loads
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider encoding with orjson when it is installed, the stdlib otherwise.
+
+    jsonify() and request.get_json() of every route go through it, and NumPy
+    arrays can be returned as is instead of being converted with tolist().
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        if kwargs:
+            # Callers asking for stdlib options (indent, sort_keys...) get the stdlib encoder
+            return json.dumps(obj, default=default, **kwargs)
+        return dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return loads(s) if not kwargs else json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+def init_json(app):
+    """Make the Flask app encode and decode JSON with FastJSONProvider."""
+    app.json = FastJSONProvider(app)
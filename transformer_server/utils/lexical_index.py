@@ -0,0 +1,164 @@
+import math
+import re
+import threading
+from collections import defaultdict
+import numpy as np
+
+# Keep codes such as LOINC "1988-5" or "57833.6" as a single token
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-.][a-z0-9]+)*")
+
+def tokenize(text: str) -> list:
+    return TOKEN_PATTERN.findall(text.lower())
+
+def is_code(token: str) -> bool:
+    return any(char.isdigit() for char in token)
+
+class LexicalIndex:
+    """
+    BM25 inverted index over stored descriptions, updated incrementally on insert.
+
+    The documents of the last snapshot are served from its memory-mapped
+    postings (see open()), only the documents added since then are held in
+    memory.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.RLock()
+        self.open(None)
+
+    def open(self, base):
+        """
+        Serve the documents of a snapshot from its postings, dropping the in-memory ones.
+
+        :param base: A SnapshotReader with a lexical index, or None to start empty
+        """
+        with self.lock:
+            self.base = base
+            self.base_count = base.count if base is not None else 0
+            self.base_length = base.lexical_total if base is not None else 0
+            self.postings = defaultdict(dict)
+            self.doc_lengths = {}
+            self.total_length = 0
+
+    def __len__(self):
+        return self.base_count + len(self.doc_lengths)
+
+    def term_count(self) -> int:
+        with self.lock:
+            if self.base is None:
+                return len(self.postings)
+            return len(self.base.lexical_terms) + sum(term not in self.base.lexical_terms for term in self.postings)
+
+    def add(self, id: int, text: str):
+        tokens = tokenize(text)
+        counts = defaultdict(int)
+        for token in tokens:
+            counts[token] += 1
+
+        with self.lock:
+            for token, tf in counts.items():
+                self.postings[token][id] = tf
+            self.doc_lengths[id] = len(tokens)
+            self.total_length += len(tokens)
+
+    def base_posting(self, term: str):
+        """IDs and term frequencies of the snapshot documents containing the term, with the lock held."""
+        bounds = self.base.lexical_terms.get(term) if self.base is not None else None
+        if bounds is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int32)
+        return self.base.lexical_ids[bounds[0]:bounds[1]], self.base.lexical_tfs[bounds[0]:bounds[1]]
+
+    def lookup(self, term: str) -> list:
+        """
+        Return the IDs of every document containing the exact term.
+
+        :param term: A single token, e.g. a LOINC code
+        :return: The matching document IDs
+        """
+        term = term.lower()
+        with self.lock:
+            return self.base_posting(term)[0].tolist() + list(self.postings.get(term, ()))
+
+    def search(self, query: str, k=5, allowed=None) -> list:
+        """
+        Rank documents with BM25.
+
+        :param query: The query text
+        :param k: Number of results to return
+        :param allowed: Optional set of IDs the results are restricted to
+        :return: A list of (ID, score) tuples sorted by score
+        """
+        scores = defaultdict(float)
+        base_ids = []
+        base_scores = []
+        allowed_ids = np.fromiter(allowed, dtype=np.int64) if allowed is not None and self.base is not None else None
+        with self.lock:
+            count = len(self)
+            if count == 0:
+                return []
+            avg_length = (self.base_length + self.total_length) / count
+            for token in set(tokenize(query)):
+                ids, tfs = self.base_posting(token)
+                posting = self.postings.get(token, {})
+                df = len(ids) + len(posting)
+                if not df:
+                    continue
+                idf = math.log(1 + (count - df + 0.5) / (df + 0.5))
+                if len(ids):
+                    if allowed_ids is not None:
+                        keep = np.isin(ids, allowed_ids)
+                        ids, tfs = ids[keep], tfs[keep]
+                    tfs = tfs.astype(np.float64)
+                    norm = self.k1 * (1 - self.b + self.b * self.base.lexical_lengths[ids - 1] / avg_length)
+                    base_ids.append(np.asarray(ids))
+                    base_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+                for id, tf in posting.items():
+                    if allowed is not None and id not in allowed:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[id] / avg_length)
+                    scores[id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        if base_ids:
+            # Snapshot documents are summed over the query terms in bulk, their IDs never overlap the in-memory ones
+            ids, inverse = np.unique(np.concatenate(base_ids), return_inverse=True)
+            sums = np.bincount(inverse, weights=np.concatenate(base_scores))
+            # IDs come out of np.unique sorted, a stable sort keeps the lowest of tied ones
+            top = np.argsort(-sums, kind="stable")[:k]
+            scores.update(zip(ids[top].tolist(), sums[top].tolist()))
+        # Ties go to the lowest ID, the order does not depend on which rows a snapshot holds
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def export(self) -> tuple:
+        """
+        Every document of the index as flat postings, to be written into a snapshot.
+
+        :return: A (terms, ids, tfs, lengths) tuple: term -> [start, end) slice of ids
+            and tfs, IDs sorted within each term, and the token count of each document by ID - 1
+        """
+        with self.lock:
+            terms = {}
+            ids = []
+            tfs = []
+            position = 0
+            vocabulary = set(self.postings)
+            if self.base is not None:
+                vocabulary.update(self.base.lexical_terms)
+            for term in sorted(vocabulary):
+                base_ids, base_tfs = self.base_posting(term)
+                posting = self.postings.get(term, {})
+                tail = sorted(posting)
+                ids.append(np.asarray(base_ids, dtype=np.int64))
+                ids.append(np.asarray(tail, dtype=np.int64))
+                tfs.append(np.asarray(base_tfs, dtype=np.int32))
+                tfs.append(np.asarray([posting[id] for id in tail], dtype=np.int32))
+                terms[term] = [position, position + len(base_ids) + len(tail)]
+                position = terms[term][1]
+            lengths = np.zeros(len(self), dtype=np.int32)
+            if self.base is not None:
+                lengths[:self.base_count] = self.base.lexical_lengths
+            for id, length in self.doc_lengths.items():
+                lengths[id - 1] = length
+            empty = [np.zeros(0, dtype=np.int64)]
+            return terms, np.concatenate(ids or empty), np.concatenate(tfs or empty).astype(np.int32), lengths
@@ -0,0 +1,231 @@
+import bisect
+import threading
+import time
+from flask import request, g
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def format_labels(names, values, extra=()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Metric:
+    """Base of the metric types: one value per combination of label values."""
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, (), value) for key, value in sorted(self.values.items())]
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for name, key, extra, value in self.samples():
+            lines.append(f"{name}{format_labels(self.label_names, key, extra)} {format_value(value)}")
+        return lines
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def set_total(self, total, **labels):
+        """Follow a total counted elsewhere (e.g. by a cache), never going down."""
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = max(self.values.get(key, 0), total)
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=LATENCY_BUCKETS, registry=None):
+        super().__init__(name, documentation, labels, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            # Per-bucket (non-cumulative) counts, then sum and count
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    samples.append((f"{self.name}_bucket", key, (("le", format_value(float(bound))),), cumulative))
+                samples.append((f"{self.name}_sum", key, (), total))
+                samples.append((f"{self.name}_count", key, (), count))
+        return samples
+
+    def time(self, **labels):
+        return Timer(self, labels)
+
+class Timer:
+    """Context manager observing the duration of its block into a histogram."""
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        """All the metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests handled, by route, method and status.", ["route", "method", "status"])
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency, by route.", ["route", "method"])
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being handled, by route.", ["route"])
+ENCODE_BATCH_SIZE = Histogram("encode_batch_size", "Texts per sentence-transformer encode call.", buckets=BATCH_SIZE_BUCKETS)
+ENCODE_DURATION = Histogram("encode_duration_seconds", "Duration of sentence-transformer encode calls.")
+EMBEDDING_MODEL_BYTES = Gauge("embedding_model_memory_bytes", "Weights memory of each loaded embedding model, 0 once unloaded.", ["model"])
+EMBEDDING_MODEL_EVENTS = Counter("embedding_model_events_total", "Embedding model loads and unloads.", ["model", "event"])
+CACHE_HITS = Counter("cache_hits_total", "Cache hits since start, by cache.", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "Cache misses since start, by cache.", ["cache"])
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Cache hit ratio since start, by cache.", ["cache"])
+CACHE_SIZE = Gauge("cache_entries", "Entries held, by cache.", ["cache"])
+VECTOR_ROWS = Gauge("vector_store_rows", "Rows of the vector store, one per ingested resource.")
+VECTOR_UNIQUE = Gauge("vector_store_vectors", "Canonical vectors of the vector store, shared by duplicate rows.")
+VECTOR_DEDUP_RATIO = Gauge("vector_store_dedup_ratio", "Share of the rows sharing the vector of another row.")
+OLLAMA_REQUESTS = Counter("ollama_requests_total", "Ollama generate calls, by model and outcome.", ["model", "status"])
+OLLAMA_LATENCY = Histogram("ollama_request_duration_seconds", "Wall-clock duration of Ollama generate calls.", ["model"])
+OLLAMA_PROMPT_TOKENS = Counter("ollama_prompt_tokens_total", "Prompt tokens evaluated by Ollama (prompt_eval_count).", ["model"])
+OLLAMA_EVAL_TOKENS = Counter("ollama_eval_tokens_total", "Tokens generated by Ollama (eval_count).", ["model"])
+OLLAMA_TOKENS_PER_SECOND = Histogram("ollama_generation_tokens_per_second", "Generation speed, eval_count / eval_duration.", ["model"], buckets=TOKENS_PER_SECOND_BUCKETS)
+OLLAMA_PROMPT_TOKENS_PER_SECOND = Histogram("ollama_prompt_tokens_per_second", "Prompt processing speed, prompt_eval_count / prompt_eval_duration.", ["model"], buckets=TOKENS_PER_SECOND_BUCKETS + (2000, 5000, 10000))
+OLLAMA_TTFT = Histogram("ollama_time_to_first_token_seconds", "Time to first token, load_duration + prompt_eval_duration.", ["model"])
+OLLAMA_BACKEND_UP = Gauge("ollama_backend_up", "1 when the last health check of the Ollama backend succeeded.", ["backend"])
+OLLAMA_BACKEND_OUTSTANDING = Gauge("ollama_backend_outstanding_requests", "Calls in progress on each Ollama backend.", ["backend"])
+OLLAMA_CIRCUIT_OPEN = Gauge("ollama_backend_circuit_open", "1 while the circuit of the Ollama backend is open after repeated failures.", ["backend"])
+ROUTING_DECISIONS = Counter("llm_routing_decisions_total", "Flatten requests by the model routed to (or extractive) and the reason.", ["model", "reason"])
+ADMISSION_REJECTED = Counter("admission_rejected_total", "Requests rejected with 429 by admission control, by route and reason.", ["route", "reason"])
+ADMISSION_QUEUE_WAIT = Histogram("admission_queue_wait_seconds", "Time requests waited for a slot of their route.", ["route"])
+ADMISSION_QUEUED = Gauge("admission_queued_requests", "Requests waiting for a slot, by route.", ["route"])
+ADMISSION_OVERLOADED = Gauge("admission_overloaded", "1 while the route sheds load (queueing delay above target for an interval).", ["route"])
+JOBS_TOTAL = Counter("jobs_total", "Background jobs by kind and final status (done, failed, rejected).", ["job", "status"])
+JOBS_QUEUED = Gauge("jobs_queued", "Background jobs waiting for a worker, by kind.", ["job"])
+JOB_QUEUE_WAIT = Histogram("job_queue_wait_seconds", "Time background jobs waited for a worker, by kind.", ["job"])
+
+def observe_cache(name: str, metrics: dict):
+    """Copy the get_metrics() numbers of an LRUCache into the cache metrics."""
+    CACHE_HITS.set_total(metrics["hits"], cache=name)
+    CACHE_MISSES.set_total(metrics["misses"], cache=name)
+    CACHE_HIT_RATIO.set(metrics["hit_ratio"], cache=name)
+    CACHE_SIZE.set(metrics["size"], cache=name)
+
+def observe_store(metrics: dict):
+    """Copy the get_metrics() numbers of a VectorStore into the vector store gauges."""
+    VECTOR_ROWS.set(metrics["rows"])
+    VECTOR_UNIQUE.set(metrics["vectors"])
+    VECTOR_DEDUP_RATIO.set(metrics["dedup_ratio"])
+
+def observe_ollama(model: str, data: dict):
+    """
+    Record the statistics of an Ollama /api/generate response.
+
+    :param data: The response JSON, durations are in nanoseconds
+    """
+    prompt_tokens = data.get("prompt_eval_count", 0)
+    eval_tokens = data.get("eval_count", 0)
+    OLLAMA_PROMPT_TOKENS.inc(prompt_tokens, model=model)
+    OLLAMA_EVAL_TOKENS.inc(eval_tokens, model=model)
+    if data.get("eval_duration"):
+        OLLAMA_TOKENS_PER_SECOND.observe(eval_tokens / data["eval_duration"] * 1e9, model=model)
+    if data.get("prompt_eval_duration"):
+        OLLAMA_PROMPT_TOKENS_PER_SECOND.observe(prompt_tokens / data["prompt_eval_duration"] * 1e9, model=model)
+    if "prompt_eval_duration" in data:
+        OLLAMA_TTFT.observe((data.get("load_duration", 0) + data["prompt_eval_duration"]) / 1e9, model=model)
+
+def route_label() -> str:
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+def before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_route = route_label()
+    HTTP_IN_FLIGHT.inc(route=g.metrics_route)
+
+def after_request(response):
+    # Also runs for unhandled exceptions, with the 500 response Flask built for them
+    HTTP_REQUESTS.inc(route=g.metrics_route, method=request.method, status=response.status_code)
+    HTTP_LATENCY.observe(time.perf_counter() - g.metrics_start, route=g.metrics_route, method=request.method)
+    return response
+
+def teardown_request(exc):
+    # Runs even when the route raised, so the gauge never drifts; pop, teardown may run twice for one request
+    route = g.pop("metrics_route", None)
+    if route is not None:
+        HTTP_IN_FLIGHT.dec(route=route)
+
+def init_metrics(app):
+    """Count, time and track in-flight requests of every route of a Flask app."""
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
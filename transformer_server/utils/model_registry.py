@@ -0,0 +1,169 @@
+import gc
+import threading
+import time
+from contextlib import contextmanager
+from collections import OrderedDict
+from utils.transformer import Transformer
+from utils.metrics import EMBEDDING_MODEL_BYTES, EMBEDDING_MODEL_EVENTS
+
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# Models /transform?model= may load, overridden by EMBEDDING_MODELS; anything else is refused
+# so a request cannot make the server download arbitrary models
+EMBEDDING_MODELS = (DEFAULT_EMBEDDING_MODEL,)
+# Memory the loaded models may use together, least recently used ones are unloaded above it
+EMBEDDING_MEMORY_MB = 2048
+
+def model_bytes(model) -> int:
+    """Memory held by the weights and buffers of a SentenceTransformer (a torch module)."""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+    except AttributeError:
+        return 0
+    return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+class ModelRegistry:
+    """
+    Embedding models loaded on first use and unloaded least recently used first.
+
+    Each model is a Transformer of its own (embedding cache included). The
+    memory of a model is the size of its weights; when the loaded models
+    together exceed the cap, the least recently used idle ones are unloaded.
+    Pinned models (the default one, which the search service holds) never are.
+    """
+
+    def __init__(self, models=EMBEDDING_MODELS, memory_mb=EMBEDDING_MEMORY_MB, pinned=(DEFAULT_EMBEDDING_MODEL,)):
+        # Pinned models are always allowed
+        self.allowed = tuple(dict.fromkeys((*pinned, *models)))
+        self.cap = int(memory_mb * 1024 * 1024)
+        self.pinned = set(pinned)
+        self.lock = threading.Lock()
+        # Loads run one at a time, they are slow and their memory must not overlap unaccounted
+        self.load_lock = threading.Lock()
+        # Loaded models, least recently used first
+        self.loaded = OrderedDict()
+        # Dimension of every model loaded once, kept after unloading
+        self.dimensions = {}
+        self.metrics = {"loads": 0, "unloads": 0}
+
+    @contextmanager
+    def use(self, name: str):
+        """
+        Give the Transformer of a model, loading it if needed; it is not unloaded while in use.
+
+        :raises ValueError: If the model is not in the allowed list
+        """
+        if name not in self.allowed:
+            raise ValueError(f"Unknown embedding model '{name}', expected one of {self.allowed}")
+        entry = self.acquire(name)
+        try:
+            yield entry["transformer"]
+        finally:
+            with self.lock:
+                entry["in_use"] -= 1
+                # Models in use when the cap was exceeded could not be unloaded then, the last user does it
+                unloaded = self.shrink() if entry["in_use"] == 0 else []
+            self.report_unloads(unloaded)
+
+    def get(self, name: str) -> Transformer:
+        """The Transformer of a pinned model, loading it if needed."""
+        if name not in self.pinned:
+            raise ValueError(f"'{name}' is not pinned, use the registry with use()")
+        with self.use(name) as transformer:
+            return transformer
+
+    def acquire(self, name: str) -> dict:
+        with self.lock:
+            entry = self.loaded.get(name)
+            if entry is not None:
+                self.touch(entry, name)
+                return entry
+        with self.load_lock:
+            # Another request may have loaded it while this one waited
+            with self.lock:
+                entry = self.loaded.get(name)
+                if entry is not None:
+                    self.touch(entry, name)
+                    return entry
+            start = time.perf_counter()
+            transformer = Transformer(model_name=name)
+            entry = {
+                "transformer": transformer,
+                "bytes": model_bytes(transformer.model),
+                "dimension": transformer.model.get_sentence_embedding_dimension(),
+                "load_seconds": time.perf_counter() - start,
+                "loaded_at": time.time(),
+                "last_used": None,
+                "requests": 0,
+                "in_use": 0
+            }
+            with self.lock:
+                self.loaded[name] = entry
+                self.dimensions[name] = entry["dimension"]
+                self.metrics["loads"] += 1
+                self.touch(entry, name)
+                unloaded = self.shrink()
+            EMBEDDING_MODEL_EVENTS.inc(model=name, event="load")
+            EMBEDDING_MODEL_BYTES.set(entry["bytes"], model=name)
+            self.report_unloads(unloaded)
+            return entry
+
+    def report_unloads(self, unloaded: list):
+        for name in unloaded:
+            EMBEDDING_MODEL_EVENTS.inc(model=name, event="unload")
+            EMBEDDING_MODEL_BYTES.set(0, model=name)
+        if unloaded:
+            gc.collect()
+
+    def touch(self, entry: dict, name: str):
+        """Count a use of a loaded model, with the lock held."""
+        entry["in_use"] += 1
+        entry["requests"] += 1
+        entry["last_used"] = time.time()
+        self.loaded.move_to_end(name)
+
+    def shrink(self) -> list:
+        """
+        Unload idle, unpinned models, least recently used first, until the total fits the cap; with the lock held.
+
+        The model just loaded is in use, so a single model larger than the cap still loads.
+        """
+        unloaded = []
+        total = sum(entry["bytes"] for entry in self.loaded.values())
+        for name in list(self.loaded):
+            if total <= self.cap:
+                break
+            entry = self.loaded[name]
+            if name in self.pinned or entry["in_use"]:
+                continue
+            del self.loaded[name]
+            total -= entry["bytes"]
+            self.metrics["unloads"] += 1
+            unloaded.append(name)
+        return unloaded
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            models = {}
+            for name in self.allowed:
+                entry = self.loaded.get(name)
+                models[name] = {
+                    "loaded": entry is not None,
+                    "pinned": name in self.pinned,
+                    # None until the model has been loaded once
+                    "dimension": self.dimensions.get(name)
+                }
+                if entry is not None:
+                    models[name].update(
+                        memory_bytes=entry["bytes"],
+                        load_seconds=entry["load_seconds"],
+                        loaded_at=entry["loaded_at"],
+                        last_used=entry["last_used"],
+                        requests=entry["requests"],
+                        in_use=entry["in_use"]
+                    )
+            return {
+                "models": models,
+                "memory_bytes": sum(entry["bytes"] for entry in self.loaded.values()),
+                "memory_cap_bytes": self.cap,
+                **self.metrics
+            }
@@ -0,0 +1,220 @@
+import json
+import re
+import threading
+import time
+from collections import deque
+import requests
+from utils.metrics import ROUTING_DECISIONS
+from utils.tracing import current_span
+
+# Ollama models from the largest (preferred) to the smallest, overridden by OLLAMA_MODELS
+MODEL_TIERS = ("gemma3:4b", "tinyllama:1.1b")
+# End-to-end latency budget of a flatten request when the caller gives none
+LATENCY_SLO_MS = 15000
+# Resources the small model flattens well enough when their prompt is short
+SIMPLE_RESOURCES = ("Patient", "Practitioner", "Organization", "Location", "Slot")
+SMALL_PROMPT_TOKENS = 512
+# Rough token count of a prompt, Ollama only reports it after the call
+CHARS_PER_TOKEN = 4
+# Latencies kept per model to estimate the next one
+LATENCY_WINDOW = 50
+# A model idle for this long is tried again whatever its old latencies, they may predate a peak
+LATENCY_STALE_SECONDS = 60
+# Requests each model runs at once (OLLAMA_NUM_PARALLEL), the others queue in Ollama
+MODEL_PARALLELISM = 1
+# Routing decisions kept for /flatten/routing
+DECISION_HISTORY = 500
+EXTRACTIVE = "extractive"
+EXTRACTIVE_MAX_CHARS = 600
+# Fields kept by the extractive summary, in this order
+SUMMARY_FIELDS = (
+    "status", "name", "family", "given", "gender", "birthDate", "code", "display", "text", "valueQuantity",
+    "value", "unit", "effectiveDateTime", "onsetDateTime", "authoredOn", "start", "end", "description", "reason"
+)
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+class ModelStats:
+    """Recent latencies and outstanding requests of one model."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.outstanding = 0
+        self.last_call = 0.0
+
+    def record(self, latency: float):
+        self.latencies.append(latency)
+        self.last_call = time.monotonic()
+
+    def estimate(self, parallelism: int) -> float:
+        """
+        Latency a new request should expect, in seconds.
+
+        The p90 of the recent calls, times the rounds of queueing the
+        outstanding requests put ahead of it. A model never called yet, or
+        idle for LATENCY_STALE_SECONDS, is assumed fast, so it gets tried.
+        """
+        if not self.latencies or (self.outstanding == 0 and time.monotonic() - self.last_call > LATENCY_STALE_SECONDS):
+            return 0.0
+        ordered = sorted(self.latencies)
+        p90 = ordered[min(len(ordered) - 1, int(0.9 * len(ordered)))]
+        return p90 * (1 + self.outstanding // parallelism)
+
+def prompt_resource(text: str):
+    """
+    The FHIR resource embedded in a prompt: the JSON object starting at its first brace.
+
+    :return: The resource, or None when the prompt holds no JSON object
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    try:
+        resource, _ = json.JSONDecoder().raw_decode(text[start:])
+    except json.JSONDecodeError:
+        return None
+    return resource if isinstance(resource, dict) else None
+
+def extractive_summary(text: str, max_chars=EXTRACTIVE_MAX_CHARS) -> str:
+    """
+    Rule-based stand-in for the LLM: the main fields of the FHIR resource in the prompt, or its first sentences.
+    """
+    resource = prompt_resource(text)
+    if resource is not None:
+        fields = []
+
+        def walk(key, value):
+            if isinstance(value, dict):
+                for child_key, child in value.items():
+                    walk(child_key, child)
+            elif isinstance(value, list):
+                for child in value:
+                    walk(key, child)
+            elif key in SUMMARY_FIELDS and value not in (None, ""):
+                fields.append((SUMMARY_FIELDS.index(key), f"{key}: {value}"))
+
+        for key, value in resource.items():
+            if key not in ("resourceType", "id", "meta"):
+                walk(key, value)
+        seen = []
+        for _, field in sorted(fields, key=lambda field: field[0]):
+            if field not in seen:
+                seen.append(field)
+        summary = f"{resource.get('resourceType', 'Resource')} Information: " + ", ".join(seen)
+        return summary[:max_chars]
+
+    summary = ""
+    for sentence in SENTENCE_END.split(text.strip()):
+        if summary and len(summary) + len(sentence) + 1 > max_chars:
+            break
+        summary = f"{summary} {sentence}".strip()
+    return summary[:max_chars]
+
+class ModelRouter:
+    """
+    Picks the Ollama model of each flatten request.
+
+    Short prompts of simple resources go to the smallest model, the others to
+    the largest. When the chosen model's expected latency (recent p90 plus
+    its queue) exceeds the request's SLO, the next smaller model is tried, and
+    if none fits, or Ollama fails, a rule-based extractive summary is returned.
+    """
+
+    def __init__(self, requester, models=MODEL_TIERS, slo_ms=LATENCY_SLO_MS, parallelism=MODEL_PARALLELISM):
+        """
+        :param requester: ollama_request instance used for the calls
+        """
+        if not models:
+            raise ValueError("At least one model is needed")
+        self.requester = requester
+        self.models = tuple(models)
+        self.slo_ms = slo_ms
+        self.parallelism = max(1, parallelism)
+        self.lock = threading.Lock()
+        self.stats = {name: ModelStats() for name in self.models}
+        self.decisions = deque(maxlen=DECISION_HISTORY)
+
+    def choose(self, prompt: str, resource_type=None, slo_ms=None) -> dict:
+        """
+        Routing decision of a request, without running it.
+
+        :param resource_type: FHIR resource type of the prompt, read from the resource in the prompt when not given
+        """
+        slo_ms = float(slo_ms if slo_ms is not None else self.slo_ms)
+        if slo_ms <= 0:
+            raise ValueError("slo_ms must be positive")
+        if resource_type is None:
+            resource = prompt_resource(prompt)
+            resource_type = resource.get("resourceType") if resource is not None else None
+        prompt_tokens = len(prompt) // CHARS_PER_TOKEN
+        small = resource_type in SIMPLE_RESOURCES and prompt_tokens <= SMALL_PROMPT_TOKENS
+        preferred = len(self.models) - 1 if small else 0
+
+        with self.lock:
+            estimates = {name: self.stats[name].estimate(self.parallelism) * 1000 for name in self.models}
+        chosen, reason = EXTRACTIVE, "slo_exceeded"
+        for name in self.models[preferred:]:
+            if estimates[name] <= slo_ms:
+                chosen = name
+                reason = ("small_resource" if small else "preferred") if name == self.models[preferred] else "slo_fallback"
+                break
+        return {
+            "time": time.time(),
+            "model": chosen,
+            "reason": reason,
+            "preferred": self.models[preferred],
+            "resource_type": resource_type,
+            "prompt_tokens": prompt_tokens,
+            "slo_ms": slo_ms,
+            "estimates_ms": estimates
+        }
+
+    def flatten(self, prompt: str, resource_type=None, slo_ms=None, fallback=True) -> dict:
+        """
+        Route a flatten request and run it.
+
+        :param fallback: Whether an Ollama failure gives the extractive summary, False raises it
+        :return: The response with the model that produced it and the routing decision
+        :raises ValueError: If slo_ms is not positive
+        :raises requests.RequestException: If Ollama failed and fallback is False
+        """
+        decision = self.choose(prompt, resource_type, slo_ms)
+        span = current_span.get()
+        if span is not None:
+            span.set(**{"route.model": decision["model"], "route.reason": decision["reason"]})
+        failure = None
+        if decision["model"] != EXTRACTIVE:
+            stats = self.stats[decision["model"]]
+            with self.lock:
+                stats.outstanding += 1
+            start = time.perf_counter()
+            try:
+                response = self.requester.get_response(prompt, decision["model"])
+            except requests.RequestException as e:
+                # Failures are not latencies of the model, they would make it look faster than it is
+                response, failure = None, e
+                decision.update(model=EXTRACTIVE, reason="backend_error", error=f"{type(e).__name__}: {e}")
+            latency = time.perf_counter() - start
+            with self.lock:
+                stats.outstanding -= 1
+                if failure is None:
+                    stats.record(latency)
+            decision["latency_ms"] = latency * 1000
+
+        ROUTING_DECISIONS.inc(model=decision["model"], reason=decision["reason"])
+        with self.lock:
+            self.decisions.append(decision)
+        if failure is not None and not fallback:
+            raise failure
+        if decision["model"] == EXTRACTIVE:
+            response = extractive_summary(prompt)
+        return {"response": response, "model": decision["model"], "routing": decision}
+
+    def get_metrics(self, last=50) -> dict:
+        with self.lock:
+            return {
+                "models": self.models,
+                "slo_ms": self.slo_ms,
+                "estimates_ms": {name: stats.estimate(self.parallelism) * 1000 for name, stats in self.stats.items()},
+                "outstanding": {name: stats.outstanding for name, stats in self.stats.items()},
+                "decisions": list(self.decisions)[-last:]
+            }
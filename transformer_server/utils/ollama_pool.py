@@ -0,0 +1,148 @@
+import threading
+import time
+import requests
+from utils.metrics import OLLAMA_BACKEND_OUTSTANDING, OLLAMA_BACKEND_UP, OLLAMA_CIRCUIT_OPEN
+
+# Time between two health checks of every backend
+HEALTH_CHECK_INTERVAL = 10
+HEALTH_CHECK_TIMEOUT = 2
+# Consecutive failed calls opening the circuit of a backend
+CIRCUIT_FAILURES = 3
+# Time an open circuit refuses calls, then one trial call is let through
+CIRCUIT_OPEN_SECONDS = 30
+# A backend with the model warm is kept while it has at most this many more
+# outstanding requests than the least loaded backend
+AFFINITY_SLACK = 2
+
+class NoBackendAvailable(requests.ConnectionError):
+    """Every backend is down or has its circuit open, callers handle it like a refused connection."""
+
+class Backend:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        # Health as seen by the last check, assumed up until the first one
+        self.up = True
+        # Models loaded in memory (/api/ps) or routed here recently
+        self.models = set()
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False
+        self.requests = 0
+
+    def available(self, now: float) -> bool:
+        """Whether the backend takes a call: up, circuit closed, or open but due for its single trial call."""
+        if not self.up:
+            return False
+        if self.failures < CIRCUIT_FAILURES:
+            return True
+        return now >= self.open_until and not self.trial
+
+class OllamaPool:
+    """
+    Ollama backends balanced by least outstanding requests.
+
+    A background thread checks every backend on /api/ps, learning whether it
+    is up and which models it holds in memory. Calls for a model prefer the
+    backends already holding it, so they stay warm, unless those are clearly
+    busier than the others. After CIRCUIT_FAILURES failed calls in a row a
+    backend's circuit opens: it gets no calls for CIRCUIT_OPEN_SECONDS, then
+    a single trial call decides whether it closes again.
+    """
+
+    def __init__(self, urls: list, health_check_interval=HEALTH_CHECK_INTERVAL):
+        if not urls:
+            raise ValueError("At least one Ollama backend is needed")
+        self.backends = [Backend(url) for url in urls]
+        self.lock = threading.Lock()
+        self.health_check_interval = health_check_interval
+        for backend in self.backends:
+            OLLAMA_BACKEND_UP.set(1, backend=backend.url)
+            OLLAMA_CIRCUIT_OPEN.set(0, backend=backend.url)
+            OLLAMA_BACKEND_OUTSTANDING.set(0, backend=backend.url)
+        if health_check_interval:
+            threading.Thread(target=self.run_health_checks, daemon=True).start()
+
+    def acquire(self, model: str, exclude=()) -> tuple:
+        """
+        Pick the backend of a call and count it as outstanding, release() must follow.
+
+        :param exclude: Backends not to pick, the ones a retried call already failed on
+        :return: A (backend, trial) tuple, trial is True for the single trial call of an open circuit
+        :raises NoBackendAvailable: If no backend takes calls
+        """
+        with self.lock:
+            now = time.monotonic()
+            candidates = [backend for backend in self.backends if backend.available(now) and backend not in exclude]
+            if not candidates:
+                raise NoBackendAvailable(f"No Ollama backend available out of {len(self.backends)}")
+            least = min(candidates, key=lambda backend: backend.outstanding)
+            warm = [backend for backend in candidates if model in backend.models]
+            backend = least
+            if warm:
+                best_warm = min(warm, key=lambda backend: backend.outstanding)
+                if best_warm.outstanding - least.outstanding <= AFFINITY_SLACK:
+                    backend = best_warm
+            trial = backend.failures >= CIRCUIT_FAILURES
+            if trial:
+                backend.trial = True
+            backend.outstanding += 1
+            backend.requests += 1
+            backend.models.add(model)
+            OLLAMA_BACKEND_OUTSTANDING.set(backend.outstanding, backend=backend.url)
+            return backend, trial
+
+    def release(self, backend: Backend, trial: bool, ok: bool):
+        """
+        :param trial: The trial flag acquire() returned with the backend
+        :param ok: False when the call failed (connection error, timeout, 5xx)
+        """
+        with self.lock:
+            backend.outstanding -= 1
+            # Calls started before the circuit opened may finish during the trial, only the trial ends it
+            if trial:
+                backend.trial = False
+            if ok:
+                backend.failures = 0
+            else:
+                backend.failures += 1
+                if backend.failures >= CIRCUIT_FAILURES:
+                    backend.open_until = time.monotonic() + CIRCUIT_OPEN_SECONDS
+            OLLAMA_BACKEND_OUTSTANDING.set(backend.outstanding, backend=backend.url)
+            OLLAMA_CIRCUIT_OPEN.set(int(backend.failures >= CIRCUIT_FAILURES), backend=backend.url)
+
+    def check(self, backend: Backend):
+        try:
+            response = requests.get(f"{backend.url}/api/ps", timeout=HEALTH_CHECK_TIMEOUT)
+            up = response.status_code == 200
+            loaded = {model["name"] for model in response.json().get("models", [])} if up else None
+        except (requests.RequestException, ValueError):
+            up, loaded = False, None
+        with self.lock:
+            backend.up = up
+            if loaded is not None:
+                # Models Ollama unloaded are no longer warm there, calls in progress keep theirs
+                backend.models = loaded | (backend.models if backend.outstanding else set())
+        OLLAMA_BACKEND_UP.set(int(up), backend=backend.url)
+
+    def run_health_checks(self):
+        while True:
+            for backend in self.backends:
+                self.check(backend)
+            time.sleep(self.health_check_interval)
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            now = time.monotonic()
+            return {
+                backend.url: {
+                    "up": backend.up,
+                    "available": backend.available(now),
+                    "circuit_open": backend.failures >= CIRCUIT_FAILURES,
+                    "consecutive_failures": backend.failures,
+                    "outstanding": backend.outstanding,
+                    "requests": backend.requests,
+                    "models": sorted(backend.models)
+                }
+                for backend in self.backends
+            }
@@ -1,40 +1,105 @@
 import requests
-import json
 import time
+from utils.metrics import OLLAMA_REQUESTS, OLLAMA_LATENCY, observe_ollama
+from utils.tracing import start_span, inject, Span
+from utils.ollama_pool import OllamaPool, NoBackendAvailable, HEALTH_CHECK_INTERVAL
 
-# Access environment variables
-OLLAMA_API_URL="http://localhost:11434/api/generate"
+# Ollama instance(s) to send generations to, overridden by OLLAMA_HOSTS
+OLLAMA_HOSTS = ["http://localhost:11434"]
 model = "tinyllama:1.1b" #"gemma3:4b"
+# Connect and read timeouts of a generation, a hung backend counts as failed instead of holding its caller
+OLLAMA_TIMEOUT = (5, 300)
+# Backends a generation is tried on, a 5xx or connection failure moves it to the next available one
+OLLAMA_ATTEMPTS = 2
+
+class OllamaError(requests.HTTPError):
+    """Ollama answered with an error status or an unreadable body, callers handle it like any failed request."""
 
 class ollama_request:
-    def __init__(self):
-        pass
+    def __init__(self, hosts=None, health_check_interval=HEALTH_CHECK_INTERVAL):
+        """
+        :param hosts: Base URLs of the Ollama backends, balanced by least outstanding requests
+        """
+        self.pool = OllamaPool(hosts or OLLAMA_HOSTS, health_check_interval)
 
-    def get_response(self, content):
+    def get_response(self, content, model_name=None):
+        # The router picks the model per request, the module default otherwise
+        model_name = model_name or model
         # define payload
         payload = {
-            "model": model,
+            "model": model_name,
             "prompt": content,
             "stream": False
         }
 
-        # Send HTTP request to the ollama API
-        response = requests.post(OLLAMA_API_URL, json=payload)
-
-        # Check if response is ok
-        if response.status_code == 200:
+        # Send HTTP request to the ollama API, the trace continues in Ollama if it supports traceparent
+        tried = []
+        failure = None
+        for attempt in range(OLLAMA_ATTEMPTS):
             try:
-                # Parse the response JSON
-                json_data = response.json()
-                # Print the response content
-                if "response" in json_data:
-                    return json_data["response"]
-            except json.JSONDecodeError as e:
-                return f"Error decoding JSON: {e}. Response: {response.text}"
-        else:
-            return f"Error: {response.status_code} - {response.text}"
-        
-        
+                backend, trial = self.pool.acquire(model_name, exclude=tried)
+            except NoBackendAvailable:
+                if failure is None:
+                    raise
+                # No other backend to retry on, the failure of the last one stands
+                break
+            tried.append(backend)
+            response, ok = None, False
+            try:
+                with start_span("ollama", model=model_name, backend=backend.url, attempt=attempt) as span, OLLAMA_LATENCY.time(model=model_name):
+                    response = requests.post(f"{backend.url}/api/generate", json=payload, headers=inject({}), timeout=OLLAMA_TIMEOUT)
+                    span.set(status_code=response.status_code)
+                ok = response.status_code < 500
+            except (requests.ConnectionError, requests.Timeout) as e:
+                failure = e
+            finally:
+                self.pool.release(backend, trial, ok)
+            if ok:
+                break
+            if response is not None:
+                failure = OllamaError(f"Ollama returned {response.status_code}: {response.text[:200]}", response=response)
+            OLLAMA_REQUESTS.inc(model=model_name, status=str(response.status_code) if response is not None else type(failure).__name__)
+        if not ok:
+            raise failure
+
+        # Errors are raised, not returned as text, so callers fall back instead of passing them on as a generation
+        if response.status_code != 200:
+            OLLAMA_REQUESTS.inc(model=model_name, status=str(response.status_code))
+            raise OllamaError(f"Ollama returned {response.status_code}: {response.text[:200]}", response=response)
+        try:
+            json_data = response.json()
+            text = json_data["response"]
+        except (ValueError, KeyError, TypeError) as e:
+            OLLAMA_REQUESTS.inc(model=model_name, status="invalid_json")
+            raise OllamaError(f"Invalid Ollama response ({type(e).__name__}: {e}): {response.text[:200]}", response=response)
+        OLLAMA_REQUESTS.inc(model=model_name, status="ok")
+        # eval_count, eval_duration, prompt_eval_duration... give tokens/sec and TTFT
+        observe_ollama(model_name, json_data)
+        record_phases(span, json_data)
+        return text
+
+def record_phases(span: Span, data: dict):
+    """
+    Add the load, prompt evaluation and generation phases reported by Ollama as child spans.
+
+    Ollama only reports durations, the phases are laid out back to back ending with the call.
+    """
+    if "total_duration" not in data:
+        return
+    start = span.end_ns - data["total_duration"]
+    phases = (
+        ("ollama.load", "load_duration", None),
+        ("ollama.prompt_eval", "prompt_eval_duration", "prompt_eval_count"),
+        ("ollama.eval", "eval_duration", "eval_count")
+    )
+    for name, duration_field, count_field in phases:
+        duration = data.get(duration_field, 0)
+        phase = Span(name, span.trace_id, span.span_id, start_ns=start)
+        if count_field is not None:
+            phase.set(tokens=data.get(count_field, 0))
+        phase.finish(start + duration)
+        start += duration
+
 if __name__ == "__main__":
     ollama = ollama_request()
     test_prompt = "What is the capital of France?"
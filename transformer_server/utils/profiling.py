@@ -0,0 +1,229 @@
+import cProfile
+import hmac
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter, OrderedDict
+from flask import request, g, jsonify
+
+# Default time between two stack samples of the sampling profiler
+SAMPLE_INTERVAL_MS = 10
+# The sampling profiler stops by itself after this long if nobody stops it
+MAX_PROFILE_SECONDS = 300
+# Per-request cProfile captures kept for download, oldest dropped first
+PROFILE_HISTORY = 20
+# Request header opting a single request into cProfile
+PROFILE_HEADER = "X-Profile"
+ADMIN_TOKEN_HEADER = "X-Admin-Token"
+TRACEMALLOC_FRAMES = 25
+TRACEMALLOC_TOP = 30
+
+def frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+class SamplingProfiler:
+    """
+    Statistical profiler sampling the stacks of every thread from a background thread.
+
+    Only the sampler thread runs extra code, so the overhead on the request
+    threads stays low. Stacks are aggregated in the folded format read by
+    flamegraph.pl, speedscope and inferno.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stacks = Counter()
+        self.samples = 0
+        self.thread = None
+        self.stopping = threading.Event()
+        self.started_at = None
+        self.stopped_at = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval_ms=SAMPLE_INTERVAL_MS, max_seconds=MAX_PROFILE_SECONDS):
+        with self.lock:
+            if self.running:
+                raise ValueError("The sampling profiler is already running")
+            if interval_ms <= 0 or max_seconds <= 0:
+                raise ValueError("interval_ms and max_seconds must be positive")
+            self.stacks = Counter()
+            self.samples = 0
+            self.stopping.clear()
+            self.started_at = time.time()
+            self.stopped_at = None
+            self.thread = threading.Thread(target=self.run, args=(interval_ms / 1000, max_seconds), daemon=True)
+            self.thread.start()
+
+    def stop(self) -> dict:
+        if not self.running:
+            raise ValueError("The sampling profiler is not running")
+        self.stopping.set()
+        self.thread.join()
+        return self.get_status()
+
+    def run(self, interval: float, max_seconds: float):
+        own = threading.get_ident()
+        deadline = time.monotonic() + max_seconds
+        while not self.stopping.wait(interval) and time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                with self.lock:
+                    self.stacks[";".join(reversed(stack))] += 1
+            with self.lock:
+                self.samples += 1
+        self.stopped_at = time.time()
+
+    def folded(self) -> str:
+        """The collected stacks in the folded format, one "frame;frame;frame count" line per stack."""
+        with self.lock:
+            return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def get_status(self) -> dict:
+        with self.lock:
+            return {
+                "running": self.running,
+                "samples": self.samples,
+                "stacks": len(self.stacks),
+                "started_at": self.started_at,
+                "stopped_at": self.stopped_at
+            }
+
+class RequestProfiles:
+    """cProfile captures of the requests that opted in, kept for download."""
+
+    def __init__(self, size=PROFILE_HISTORY):
+        self.size = size
+        self.lock = threading.Lock()
+        self.profiles = OrderedDict()
+
+    def add(self, profile: cProfile.Profile, route: str, duration: float) -> str:
+        profile_id = uuid.uuid4().hex
+        with self.lock:
+            self.profiles[profile_id] = {"stats": profile, "route": route, "duration_ms": duration * 1000}
+            while len(self.profiles) > self.size:
+                self.profiles.popitem(last=False)
+        return profile_id
+
+    def get(self, profile_id: str):
+        with self.lock:
+            return self.profiles.get(profile_id)
+
+    def list(self) -> list:
+        with self.lock:
+            return [{"id": key, "route": value["route"], "duration_ms": value["duration_ms"]} for key, value in self.profiles.items()]
+
+def profile_text(profile: cProfile.Profile, sort="cumulative", limit=50) -> str:
+    output = io.StringIO()
+    pstats.Stats(profile, stream=output).sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+def profile_dump(profile: cProfile.Profile) -> bytes:
+    """The profile in the binary pstats format read by snakeviz, gprof2dot and pstats.Stats."""
+    profile.create_stats()
+    return marshal.dumps(profile.stats)
+
+class AllocationTracker:
+    """tracemalloc snapshots, each compared with the previous one to show what grew."""
+
+    def __init__(self):
+        self.previous = None
+
+    def start(self, frames=TRACEMALLOC_FRAMES):
+        if tracemalloc.is_tracing():
+            raise ValueError("tracemalloc is already tracing")
+        tracemalloc.start(frames)
+        self.previous = None
+
+    def stop(self):
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc is not tracing")
+        tracemalloc.stop()
+        self.previous = None
+
+    def snapshot(self, top=TRACEMALLOC_TOP, group_by="lineno") -> dict:
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc is not tracing, start it first")
+        if group_by not in ("lineno", "filename", "traceback"):
+            raise ValueError(f"Unsupported group_by '{group_by}', expected lineno, filename or traceback")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        response = {
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "top": [
+                {"where": [str(frame) for frame in stat.traceback], "size_bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics(group_by)[:top]
+            ]
+        }
+        if self.previous is not None:
+            response["growth"] = [
+                {"where": [str(frame) for frame in stat.traceback], "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in snapshot.compare_to(self.previous, group_by)[:top]
+            ]
+        self.previous = snapshot
+        return response
+
+sampler = SamplingProfiler()
+request_profiles = RequestProfiles()
+allocations = AllocationTracker()
+# Admin endpoints and the profiling header are refused while this is unset
+admin_token = None
+
+def is_admin() -> bool:
+    supplied = request.headers.get(ADMIN_TOKEN_HEADER, "")
+    return admin_token is not None and hmac.compare_digest(supplied.encode("utf-8"), admin_token.encode("utf-8"))
+
+def before_request():
+    if request.path.startswith("/admin/") and not is_admin():
+        return jsonify({"error": "Admin endpoints need a valid X-Admin-Token (and ADMIN_TOKEN set on the server)"}), 403
+    if request.headers.get(PROFILE_HEADER) and is_admin():
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this interpreter, the request runs unprofiled
+            return None
+        g.profile = profile
+        g.profile_start = time.perf_counter()
+
+def after_request(response):
+    if "profile" in g:
+        g.profile.disable()
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        response.headers["X-Profile-Id"] = request_profiles.add(g.profile, route, time.perf_counter() - g.profile_start)
+        g.pop("profile")
+    return response
+
+def teardown_request(exc):
+    # A route that raised skipped after_request, the profiler must not stay enabled on the thread
+    if "profile" in g:
+        g.pop("profile").disable()
+
+def init_profiling(app, token=None):
+    """
+    Enable the /admin/ profiling endpoints and the X-Profile request header.
+
+    :param token: Secret the admin requests must send in X-Admin-Token, profiling stays disabled without it
+    """
+    global admin_token
+    admin_token = token or None
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
@@ -0,0 +1,128 @@
+import threading
+from collections import OrderedDict, defaultdict
+import numpy as np
+
+EMBEDDING_CACHE_SIZE = 10000
+RESULT_CACHE_SIZE = 2000
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with hit/miss counters."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.evict(next(iter(self.entries)))
+
+    def evict(self, key):
+        self.entries.pop(key, None)
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0
+            }
+
+class ResultCache(LRUCache):
+    """
+    Search result cache invalidated by inserts into the partition it covers.
+
+    Each entry is tagged with the PatientID its search was restricted to (None
+    for a search over every row). Pure vector results also keep the query
+    vector and their lowest score, so an insert only drops them when the new
+    vector would actually enter their top k.
+
+    A search computed while an insert invalidated its partition would cache a
+    stale result: it takes generation() before computing and put() refuses it
+    when the partition's generation moved in the meantime.
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__(max_size)
+        self.partitions = defaultdict(set)
+        # Invalidation count of each partition, None counting every insert
+        self.generations = defaultdict(int)
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def generation(self, partition=None) -> int:
+        """Generation of a partition, taken before computing a result to put() later."""
+        with self.lock:
+            return self.generations[partition]
+
+    def put(self, key, value, partition=None, query_vector=None, k=None, generation=None):
+        """
+        :param generation: generation() of the partition when the result was computed, the result
+            is not cached if an insert invalidated the partition since
+        """
+        threshold = None
+        if query_vector is not None and k is not None and len(value["results"]) >= k:
+            threshold = min(result["Similarity"] for result in value["results"])
+        query_vector = np.asarray(query_vector, dtype=np.float32) if threshold is not None else None
+        with self.lock:
+            if generation is not None and generation != self.generations[partition]:
+                self.stale_puts += 1
+                return
+            self.evict(key)
+            self.entries[key] = (value, partition, query_vector, threshold)
+            self.partitions[partition].add(key)
+            while len(self.entries) > self.max_size:
+                self.evict(next(iter(self.entries)))
+
+    def get(self, key):
+        entry = super().get(key)
+        return entry[0] if entry is not None else None
+
+    def evict(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.partitions[entry[1]].discard(key)
+
+    def invalidate(self, patient_id, vector=None):
+        """
+        Drop cached results that an insert for the given patient may change.
+
+        :param patient_id: PatientID of the inserted row
+        :param vector: The inserted vector, used to keep vector results it cannot reach
+        """
+        vector = np.asarray(vector, dtype=np.float32) if vector is not None else None
+        with self.lock:
+            for partition in {patient_id, None}:
+                self.generations[partition] += 1
+                for key in list(self.partitions.get(partition, ())):
+                    _, _, query_vector, threshold = self.entries[key]
+                    if vector is not None and query_vector is not None and float(query_vector @ vector) < threshold:
+                        continue
+                    self.evict(key)
+                    self.invalidations += 1
+
+    def get_metrics(self) -> dict:
+        metrics = super().get_metrics()
+        metrics["invalidations"] = self.invalidations
+        metrics["stale_puts"] = self.stale_puts
+        return metrics
@@ -0,0 +1,93 @@
+import threading
+import time
+from sentence_transformers import CrossEncoder
+
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Default latency budget for one re-rank call, in milliseconds
+RERANK_BUDGET_MS = 200
+# Smoothing factor of the per-pair latency estimate
+EWMA_ALPHA = 0.2
+# Candidates scored first when no latency estimate exists yet, the estimate then sizes the rest
+PROBE_PAIRS = 4
+# Floor of the per-pair latency estimate, a pair timed at 0 ms would size an unbounded batch
+MIN_PAIR_MS = 0.001
+
+class Reranker:
+    """Second-stage re-scoring of search candidates with a small cross-encoder."""
+
+    def __init__(self, model_name=RERANK_MODEL):
+        self.model_name = model_name
+        self.model = None
+        self.lock = threading.Lock()
+        # Observed cost of scoring one (query, candidate) pair, in milliseconds
+        self.pair_ms = None
+
+    def load(self):
+        with self.lock:
+            if self.model is None:
+                self.model = CrossEncoder(self.model_name)
+        return self.model
+
+    def rerank(self, query: str, candidates: list, budget_ms=RERANK_BUDGET_MS) -> dict:
+        """
+        Re-score candidates against the query in a single forward pass.
+
+        Only as many top candidates as the latency budget allows are scored;
+        the rest keep their first-stage order after the re-ranked ones. The
+        first call scores PROBE_PAIRS candidates to measure the cost of a pair,
+        and sizes the rest from what the probe, model load included, left of
+        the budget.
+
+        :param query: The query text
+        :param candidates: Result dicts with at least a 'Description' key, in first-stage order
+        :param budget_ms: Latency budget for the cross-encoder call
+        :return: A dict with the re-ordered 'results' and the number of 'reranked' candidates
+        :raises ValueError: If the candidates are not a list of dicts with a text 'Description', or the budget is not positive
+        """
+        if not isinstance(query, str):
+            raise ValueError("'query_desc' must be a string")
+        if not isinstance(candidates, list) or not all(isinstance(candidate, dict) and isinstance(candidate.get("Description"), str) for candidate in candidates):
+            raise ValueError("'results' must be a list of objects with a 'Description' string")
+        if budget_ms is not None:
+            try:
+                budget_ms = float(budget_ms)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid rerank_budget_ms '{budget_ms}'")
+            if budget_ms <= 0:
+                raise ValueError("rerank_budget_ms must be positive")
+        if not candidates:
+            return {"results": [], "reranked": 0}
+
+        scores = []
+        count = len(candidates)
+        if budget_ms is not None:
+            if self.pair_ms is None:
+                # First call: a small probe batch gives the estimate instead of scoring every candidate blind
+                start = time.perf_counter()
+                scores = self.score(query, candidates[:PROBE_PAIRS])
+                budget_ms -= (time.perf_counter() - start) * 1000
+            count = min(count, max(1, len(scores) + int(max(budget_ms, 0.0) / self.pair_ms)))
+        scores += self.score(query, candidates[len(scores):count])
+
+        scored = [dict(candidate, RerankScore=score) for candidate, score in zip(candidates, scores)]
+        scored.sort(key=lambda candidate: candidate["RerankScore"], reverse=True)
+        return {"results": scored + candidates[count:], "reranked": count}
+
+    def score(self, query: str, candidates: list) -> list:
+        """Cross-encoder scores of the candidates in one forward pass, feeding the latency estimate."""
+        if not candidates:
+            return []
+        model = self.load()
+        pairs = [(query, candidate["Description"]) for candidate in candidates]
+        start = time.perf_counter()
+        scores = model.predict(pairs, batch_size=len(pairs))
+        self.observe((time.perf_counter() - start) * 1000 / len(pairs))
+        return [float(score) for score in scores]
+
+    def observe(self, pair_ms: float):
+        pair_ms = max(pair_ms, MIN_PAIR_MS)
+        with self.lock:
+            if self.pair_ms is None:
+                self.pair_ms = pair_ms
+            else:
+                self.pair_ms = EWMA_ALPHA * pair_ms + (1 - EWMA_ALPHA) * self.pair_ms
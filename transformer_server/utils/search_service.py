@@ -0,0 +1,230 @@
+import json
+import threading
+from utils.vector_store import VectorStore, METADATA_FIELDS, DEDUP_THRESHOLD
+from utils.lexical_index import LexicalIndex, tokenize, is_code
+from utils.reranker import RERANK_BUDGET_MS
+from utils.query_cache import ResultCache, RESULT_CACHE_SIZE
+from utils.tracing import start_span
+
+# Constant used by reciprocal-rank fusion to damp the weight of top ranks
+RRF_K = 60
+# Minimum number of candidates pulled from each retriever before fusion
+MIN_CANDIDATES = 50
+# Candidates handed to the re-ranker per requested row when re-ranking is enabled
+RERANK_FANOUT = 3
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+FUSION_METHODS = ("rrf", "weighted")
+# Seconds a lexical search is asked to retry after while the BM25 index is rebuilt
+REBUILD_RETRY_AFTER = 5
+
+def positive_int(data: dict, name: str, default: int) -> int:
+    """An integer request field of at least 1, ValueError otherwise."""
+    value = data.get(name, default)
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be an integer, got {value!r}")
+    if number < 1:
+        raise ValueError(f"'{name}' must be a positive integer, got {value!r}")
+    return number
+
+def unit_float(data: dict, name: str, default: float) -> float:
+    """A number request field between 0 and 1, ValueError otherwise."""
+    value = data.get(name, default)
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{name}' must be a number, got {value!r}")
+    if not 0 <= number <= 1:
+        raise ValueError(f"'{name}' must be between 0 and 1, got {value!r}")
+    return number
+
+class IndexNotReady(Exception):
+    """The BM25 index is still being rebuilt from the rows, lexical and hybrid searches must wait."""
+
+    def __init__(self, message, retry_after=REBUILD_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class SearchService:
+    """
+    Hybrid retrieval over a vector index and a BM25 inverted index kept side by side.
+
+    Snapshots hold both indexes. A snapshot written without its BM25 index
+    (format 1, or before the index was persisted) has it rebuilt from the rows
+    in the background, then a new snapshot is written so the index is served
+    from disk afterwards. Lexical and hybrid searches are refused until then,
+    rather than answered (and cached) from a partial index.
+    """
+
+    def __init__(self, transformer, dimension=384, reranker=None, directory=None, dedup_threshold=DEDUP_THRESHOLD):
+        self.transformer = transformer
+        self.reranker = reranker
+        self.store = VectorStore(dimension=dimension, directory=directory, dedup_threshold=dedup_threshold)
+        self.lexical = LexicalIndex()
+        self.results = ResultCache(RESULT_CACHE_SIZE)
+        # Held while a row goes into both indexes and while they are written, so snapshots see them agree
+        self.lock = threading.Lock()
+        self.lexical_ready = threading.Event()
+        base = self.store.base
+        if base is not None and base.lexical_terms is not None:
+            self.lexical.open(base)
+            # Rows replayed from the append log are the only ones indexed in memory
+            self.index_rows(base.count + 1, len(self.store))
+            self.lexical_ready.set()
+        elif len(self.store):
+            threading.Thread(target=self.rebuild_lexical, args=(len(self.store),), daemon=True).start()
+        else:
+            self.lexical_ready.set()
+
+    def index_rows(self, first: int, last: int):
+        for id in range(first, last + 1):
+            self.lexical.add(id, self.store.get(id)["Description"])
+
+    def rebuild_lexical(self, count: int):
+        self.index_rows(1, count)
+        self.lexical_ready.set()
+        # Persisting the rebuilt index frees its memory, the snapshot serves it memory-mapped
+        self.snapshot()
+
+    def insert(self, data: dict) -> dict:
+        desc = data["description"]
+        vector = data.get("vector")
+        if vector is None:
+            vector = self.transformer.create_vector({"description": desc})["vector"]
+        metadata = {field: data.get(field, "") for field in METADATA_FIELDS}
+
+        with self.lock:
+            id = self.store.add(vector, desc, metadata)
+            self.lexical.add(id, desc)
+        # A deduplicated row ranks with the canonical vector it shares, not its own
+        self.results.invalidate(metadata["PatientID"], self.store.vector(id))
+        return {"ID": id}
+
+    def search(self, data: dict) -> dict:
+        query = data["query_desc"]
+        if not isinstance(query, str):
+            raise ValueError(f"'query_desc' must be a string, got {type(query).__name__}")
+        rows = positive_int(data, "rows", 5)
+        mode = data.get("mode", "hybrid")
+        fusion = data.get("fusion", "rrf")
+        alpha = unit_float(data, "alpha", 0.5)
+        patient_id = data.get("PatientID")
+        rerank = bool(data.get("rerank")) and self.reranker is not None
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unsupported search mode '{mode}', expected one of {SEARCH_MODES}")
+        if fusion not in FUSION_METHODS:
+            raise ValueError(f"Unsupported fusion method '{fusion}', expected one of {FUSION_METHODS}")
+
+        if mode != "vector" and not self.lexical_ready.is_set():
+            raise IndexNotReady(f"The BM25 index is being rebuilt ({len(self.lexical)} of {len(self.store)} rows), retry or use mode 'vector'")
+
+        key = json.dumps(data, sort_keys=True)
+        with start_span("cache", cache="search_result") as span:
+            cached = self.results.get(key)
+            span.set(hit=cached is not None)
+        if cached is not None:
+            return dict(cached, cached=True)
+
+        # Taken before reading the indexes, an insert landing while this search runs keeps its result out of the cache
+        generation = self.results.generation(patient_id)
+        allowed = set(self.store.partition(patient_id)) if patient_id is not None else None
+
+        # Exact code lookups are answered straight from the posting lists
+        if mode != "vector":
+            exact = self.exact_match(query, allowed)
+            if exact:
+                # These rows were never compared with the query vector, they have no similarity or score to report
+                response = {"results": [dict(self.result(id, None, None), Match="exact") for id in exact[:rows]], "match": "exact"}
+                self.results.put(key, response, patient_id, generation=generation)
+                return response
+
+        depth = positive_int(data, "candidates", rows * RERANK_FANOUT) if rerank else rows
+        candidates = max(depth, MIN_CANDIDATES) if mode == "hybrid" else depth
+        vector_hits = []
+        lexical_hits = []
+        if mode != "lexical":
+            vector = data.get("vector")
+            if vector is None:
+                vector = self.transformer.create_vector({"description": query})["vector"]
+            vector_hits = self.store.search(vector, candidates, patient_id)
+        if mode != "vector":
+            lexical_hits = self.lexical.search(query, candidates, allowed)
+
+        similarities = dict(vector_hits)
+        if mode == "vector":
+            ranked = vector_hits
+        elif mode == "lexical":
+            ranked = lexical_hits
+        elif fusion == "rrf":
+            ranked = self.reciprocal_rank_fusion(vector_hits, lexical_hits)
+        else:
+            ranked = self.weighted_fusion(vector_hits, lexical_hits, alpha)
+
+        results = [self.result(id, similarities.get(id), score) for id, score in ranked[:depth]]
+        if not rerank:
+            response = {"results": results, "match": mode}
+            if mode == "vector":
+                self.results.put(key, response, patient_id, query_vector=vector, k=rows, generation=generation)
+            else:
+                self.results.put(key, response, patient_id, generation=generation)
+            return response
+
+        reranked = self.reranker.rerank(query, results, data.get("rerank_budget_ms", RERANK_BUDGET_MS))
+        response = {"results": reranked["results"][:rows], "match": mode, "reranked": reranked["reranked"]}
+        self.results.put(key, response, patient_id, generation=generation)
+        return response
+
+    def snapshot(self) -> dict:
+        if self.store.directory is None:
+            raise ValueError("The vector store was not opened on a snapshot directory")
+        # A partial BM25 index must not be persisted as the complete one
+        self.lexical_ready.wait()
+        with self.lock:
+            generation = self.store.snapshot(self.lexical.export())
+            self.lexical.open(self.store.base)
+        return {"generation": generation, "vectors": len(self.store)}
+
+    def get_metrics(self) -> dict:
+        return {
+            "vectors": len(self.store),
+            "store": self.store.get_metrics(),
+            "terms": self.lexical.term_count(),
+            "lexical_ready": self.lexical_ready.is_set(),
+            "result_cache": self.results.get_metrics()
+        }
+
+    def exact_match(self, query: str, allowed=None) -> list:
+        tokens = tokenize(query)
+        if not tokens or not all(is_code(token) for token in tokens):
+            return []
+        ids = set(self.lexical.lookup(tokens[0]))
+        for token in tokens[1:]:
+            ids &= set(self.lexical.lookup(token))
+        if allowed is not None:
+            ids &= allowed
+        return sorted(ids)
+
+    def reciprocal_rank_fusion(self, *rankings) -> list:
+        scores = {}
+        for ranking in rankings:
+            for rank, (id, _) in enumerate(ranking, start=1):
+                scores[id] = scores.get(id, 0.0) + 1.0 / (RRF_K + rank)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def weighted_fusion(self, vector_hits: list, lexical_hits: list, alpha: float) -> list:
+        # BM25 scores are unbounded, scale them to [0, 1] before mixing with cosine similarity
+        top_lexical = lexical_hits[0][1] if lexical_hits else 1.0
+        scores = {id: alpha * similarity for id, similarity in vector_hits}
+        for id, score in lexical_hits:
+            scores[id] = scores.get(id, 0.0) + (1 - alpha) * score / top_lexical
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def result(self, id: int, similarity, score: float) -> dict:
+        row = self.store.get(id)
+        return {
+            "ID": id,
+            "Description": row["Description"],
+            "Similarity": similarity,
+            "Score": score
+        }
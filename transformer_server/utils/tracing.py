@@ -0,0 +1,242 @@
+import contextvars
+import json
+import queue
+import re
+import secrets
+import threading
+import time
+import requests
+from flask import request, g
+
+TRACEPARENT_PATTERN = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+# Spans handed to the OTLP exporter per POST
+OTLP_BATCH_SIZE = 256
+OTLP_FLUSH_SECONDS = 2.0
+SERVICE_NAME = "transformer_server"
+
+# Span of the code running in the current thread / context
+current_span = contextvars.ContextVar("current_span", default=None)
+# Where finished spans go, None disables recording (traceparent is still propagated)
+exporter = None
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id=None, start_ns=None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns = None
+        self.attributes = {}
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def finish(self, end_ns=None):
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if exporter is not None:
+            exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+def parse_traceparent(header):
+    """
+    Parse a W3C traceparent header.
+
+    :return: A (trace id, parent span id) tuple, or None when the header is missing or invalid
+    """
+    match = TRACEPARENT_PATTERN.match((header or "").strip().lower())
+    if not match or match.group(1) == "ff" or set(match.group(2)) == {"0"} or set(match.group(3)) == {"0"}:
+        return None
+    return match.group(2), match.group(3)
+
+class start_span:
+    """
+    Context manager running its block in a new child span of the current span.
+
+    Without a current span a new trace is started.
+    """
+
+    def __init__(self, name: str, **attributes):
+        parent = current_span.get()
+        if parent is not None:
+            self.span = Span(name, parent.trace_id, parent.span_id)
+        else:
+            self.span = Span(name, secrets.token_hex(16))
+        self.span.set(**attributes)
+
+    def __enter__(self) -> Span:
+        self.token = current_span.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        current_span.reset(self.token)
+        if exc is not None:
+            self.span.error = f"{exc_type.__name__}: {exc}"
+        self.span.finish()
+
+def inject(headers: dict) -> dict:
+    """Add the traceparent of the current span to outgoing request headers."""
+    span = current_span.get()
+    if span is not None:
+        headers["traceparent"] = span.traceparent()
+    return headers
+
+class FileExporter:
+    """Appends finished spans to a file, one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict()) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+class OTLPExporter:
+    """Posts finished spans in batches to an OTLP/HTTP collector (JSON encoding) from a background thread."""
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint.rstrip("/") + "/v1/traces" if not endpoint.endswith("/v1/traces") else endpoint
+        self.queue = queue.Queue()
+        self.dropped = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def export(self, span: Span):
+        self.queue.put(span)
+
+    def run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + OTLP_FLUSH_SECONDS
+            while len(batch) < OTLP_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                requests.post(self.endpoint, json=self.payload(batch), timeout=5)
+            except requests.RequestException:
+                # Tracing must never take the server down, spans of an unreachable collector are lost
+                self.dropped += len(batch)
+
+    def payload(self, spans: list) -> dict:
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": str(value)}}
+
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": SERVICE_NAME},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent_id or "",
+                            "name": span.name,
+                            "startTimeUnixNano": str(span.start_ns),
+                            "endTimeUnixNano": str(span.end_ns),
+                            "attributes": [attribute(key, value) for key, value in span.attributes.items()],
+                            "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+                        }
+                        for span in spans
+                    ]
+                }]
+            }]
+        }
+
+def queue_start_ns(header):
+    """
+    Parse an X-Request-Start header set by a proxy ("t=<epoch>" in s, ms or us).
+
+    :return: The time the request reached the proxy in ns, or None
+    """
+    value = (header or "").strip()
+    if value.startswith("t="):
+        value = value[2:]
+    try:
+        start = float(value)
+    except ValueError:
+        return None
+    # Pick the unit that gives a plausible epoch
+    for scale in (1e9, 1e6, 1e3):
+        if 1e9 < start * scale / 1e9 < 1e10:
+            return int(start * scale)
+    return None
+
+def before_request():
+    parent = parse_traceparent(request.headers.get("traceparent"))
+    trace_id, parent_id = parent if parent is not None else (secrets.token_hex(16), None)
+    span = Span(f"{request.method} {request.url_rule.rule if request.url_rule is not None else request.path}", trace_id, parent_id)
+    span.set(**{"http.method": request.method, "http.target": request.path})
+    g.trace_token = current_span.set(span)
+
+    # Time spent behind a proxy or in the accept queue before Flask saw the request,
+    # the request span then starts when the proxy received it
+    queued = queue_start_ns(request.headers.get("X-Request-Start"))
+    if queued is not None and queued < span.start_ns:
+        Span("queue_wait", trace_id, span.span_id, start_ns=queued).finish(span.start_ns)
+        span.start_ns = queued
+
+    if request.is_json:
+        with start_span("parse", bytes=request.content_length or 0):
+            # get_json caches the parsed body for the route
+            request.get_json(silent=True)
+
+def after_request(response):
+    span = current_span.get()
+    if span is not None:
+        span.set(**{"http.status_code": response.status_code})
+        response.headers["traceresponse"] = span.traceparent()
+    return response
+
+def teardown_request(exc):
+    if "trace_token" not in g:
+        return
+    span = current_span.get()
+    # pop: with a preserved context (test client) teardown can run twice for one request
+    current_span.reset(g.pop("trace_token"))
+    if exc is not None:
+        span.error = f"{type(exc).__name__}: {exc}"
+    span.finish()
+
+def init_tracing(app, trace_file=None, otlp_endpoint=None):
+    """
+    Trace every request of a Flask app, continuing the trace of an incoming W3C traceparent header.
+
+    :param trace_file: File to append finished spans to as JSON lines
+    :param otlp_endpoint: OTLP/HTTP collector to post finished spans to, used when trace_file is not set
+    """
+    global exporter
+    if trace_file:
+        exporter = FileExporter(trace_file)
+    elif otlp_endpoint:
+        exporter = OTLPExporter(otlp_endpoint)
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.teardown_request(teardown_request)
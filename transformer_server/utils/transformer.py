@@ -1,14 +1,136 @@
+import threading
+import numpy as np
 from sentence_transformers import SentenceTransformer
+from utils.query_cache import LRUCache, EMBEDDING_CACHE_SIZE
+from utils.metrics import ENCODE_BATCH_SIZE, ENCODE_DURATION
+from utils.tracing import start_span
+
+# Number of tokens shared by two consecutive chunks of a long description
+CHUNK_OVERLAP = 32
+# Supported chunking modes: pooled vector (mean/max) or one vector per chunk
+CHUNKING_MODES = ("mean", "max", "chunks")
 
 class Transformer:
-    def __init__(self):
-        self.model = SentenceTransformer("all-MiniLM-L6-v2")
+    def __init__(self, model_name="all-MiniLM-L6-v2", chunk_overlap=CHUNK_OVERLAP, cache_size=EMBEDDING_CACHE_SIZE):
+        self.model = SentenceTransformer(model_name)
+        # Repeated texts (e.g. dashboard queries) skip the model entirely
+        self.cache = LRUCache(cache_size)
+        self.tokenizer = self.model.tokenizer
+        # Room left for the [CLS] and [SEP] special tokens
+        self.window = self.model.max_seq_length - 2
+        self.chunk_overlap = min(chunk_overlap, self.window // 2)
+        self.lock = threading.Lock()
+        self.metrics = {
+            "requests": 0,
+            "chunked_requests": 0,
+            "chunks": 0,
+            "truncated": 0
+        }
 
     def create_vector(self, data: dict) -> dict:
+        """
+        Embed a description.
+
+        Without chunking the response has the vector of the (possibly truncated)
+        description. In the mean and max modes it has the vector pooled over its
+        chunks and chunk_count, in the chunks mode the chunks with their vectors
+        and chunk_count, whether the description needed splitting or not.
+
+        :raises ValueError: If the description is not a string or the chunking mode is unknown
+        """
         desc = data["description"]
-        vector = self.model.encode(desc, normalize_embeddings=True).tolist()
+        mode = data.get("chunking")
+        if not isinstance(desc, str):
+            raise ValueError(f"'description' must be a string, got {type(desc).__name__}")
+        if mode is not None and mode not in CHUNKING_MODES:
+            raise ValueError(f"Unsupported chunking mode '{mode}', expected one of {CHUNKING_MODES}")
+
+        if mode is None:
+            with start_span("cache", cache="embedding") as span:
+                cached = self.cache.get(desc)
+                span.set(hit=cached is not None)
+            if cached is not None:
+                self.count(requests=1, truncated=int(cached["truncated"]))
+                # Callers get their own dict, the cached vector is read-only
+                return dict(cached)
+
+        spans = self.split(desc)
+        too_long = len(spans) > 1
+        self.count(requests=1, truncated=int(too_long and mode is None))
+
+        if mode is None:
+            vector = self.encode(desc)
+            vector.setflags(write=False)
+            response = {
+                "description": desc,
+                "vector": vector,
+                "truncated": too_long
+            }
+            self.cache.put(desc, response)
+            return dict(response)
+
+        # Encode every chunk of the description in a single batch
+        texts = [desc[start:end] for start, end in spans]
+        vectors = self.encode(texts)
+        if too_long:
+            self.count(chunked_requests=1, chunks=len(texts))
 
-        return {
+        response = {
             "description": desc,
-            "vector": vector
+            "truncated": False,
+            "chunk_count": len(texts)
         }
+        if mode == "chunks":
+            response["chunks"] = [
+                {"start": start, "end": end, "vector": vector}
+                for (start, end), vector in zip(spans, vectors)
+            ]
+        else:
+            response["vector"] = self.pool(vectors, mode)
+        return response
+
+    def encode(self, texts):
+        """Encode a text, or a list of texts in a single batch, into normalized vectors."""
+        batch_size = len(texts) if isinstance(texts, list) else 1
+        ENCODE_BATCH_SIZE.observe(batch_size)
+        with start_span("encode", batch_size=batch_size), ENCODE_DURATION.time():
+            if isinstance(texts, list):
+                return self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+            return self.model.encode(texts, normalize_embeddings=True)
+
+    def split(self, desc: str) -> list:
+        """
+        Split a description into overlapping windows on token boundaries.
+
+        :param desc: The text to split
+        :return: A list of (start, end) character offsets, one per chunk
+        """
+        encoding = self.tokenizer(desc, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = encoding["offset_mapping"]
+        if len(offsets) <= self.window:
+            return [(0, len(desc))]
+
+        spans = []
+        stride = self.window - self.chunk_overlap
+        for first in range(0, len(offsets), stride):
+            last = min(first + self.window, len(offsets)) - 1
+            spans.append((offsets[first][0], offsets[last][1]))
+            if last == len(offsets) - 1:
+                break
+        return spans
+
+    def pool(self, vectors: np.ndarray, mode: str) -> np.ndarray:
+        pooled = vectors.max(axis=0) if mode == "max" else vectors.mean(axis=0)
+        norm = np.linalg.norm(pooled)
+        return pooled / norm if norm > 0 else pooled
+
+    def count(self, **increments):
+        with self.lock:
+            for name, value in increments.items():
+                self.metrics[name] += value
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            metrics = dict(self.metrics)
+        metrics["embedding_cache"] = self.cache.get_metrics()
+        return metrics
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+import numpy as np
+
+# On-disk layout of a snapshot directory:
+#   CURRENT                      name of the live snapshot, swapped atomically
+#   snapshot-<generation>/       one immutable snapshot
+#       manifest.json            format version, dimension, row and vector counts and file list
+#       vectors.f32              row-major float32 matrix of the canonical vectors (vector_count x dimension)
+#       canonical.i64            canonical vector index of each row (format 2, rows own vectors in format 1)
+#       digests.u64 / digests.i64    vector_digest() of every canonical vector, sorted, and the vector index of each
+#       rows.bin / rows.idx      one JSON object per row (Description + metadata) and uint64 offsets
+#       partitions.json          PatientID -> [start, end) slice of partitions.i64
+#       partitions.i64           row IDs grouped by PatientID
+#       lexical.json             optional BM25 index: term -> [start, end) slice of lexical.ids/lexical.tfs
+#       lexical.ids / lexical.tfs    int64 row IDs and int32 term frequencies of every posting, grouped by term
+#       lexical.lengths          int32 token count of each row
+#   snapshot-<generation>.log    vectors appended since that snapshot was written
+FORMAT_VERSION = 2
+# Versions SnapshotReader opens, format 1 has no canonical.i64
+READABLE_VERSIONS = (1, 2)
+CURRENT_FILE = "CURRENT"
+LOG_HEADER = struct.Struct("<II")
+
+def snapshot_name(generation: int) -> str:
+    return f"snapshot-{generation:06d}"
+
+def read_current(directory: str) -> int:
+    """Return the generation of the live snapshot, 0 if none was written yet."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "r") as f:
+            return int(f.read().strip().rsplit("-", 1)[1])
+    except FileNotFoundError:
+        return 0
+
+def vector_digest(vector: np.ndarray) -> int:
+    """64-bit hash of the bytes of a float32 vector, equal vectors have equal digests."""
+    return int.from_bytes(hashlib.blake2b(np.ascontiguousarray(vector, dtype=np.float32).tobytes(), digest_size=8).digest(), "little")
+
+def fsync_write(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def write_snapshot(directory: str, blocks, dimension: int, rows, lexical=None, canonical=None) -> int:
+    """
+    Atomically write a new snapshot and make it the live one.
+
+    The snapshot is fully written and fsynced under a new generation before
+    CURRENT is replaced, so a crash leaves either the old or the new snapshot.
+
+    :param directory: The snapshot directory
+    :param blocks: A list of (n x dimension) vector arrays, written one after the other
+    :param dimension: Number of dimensions of each vector
+    :param rows: An iterable of dicts (Description + metadata), in row ID order
+    :param lexical: Optional BM25 index, a (terms, ids, tfs, lengths) tuple from LexicalIndex.export()
+    :param canonical: Index of the vector of each row, rows and vectors match one to one when None
+    :return: The generation of the new snapshot
+    """
+    os.makedirs(directory, exist_ok=True)
+    previous = read_current(directory)
+    generation = previous + 1
+    target = os.path.join(directory, snapshot_name(generation))
+    shutil.rmtree(target, ignore_errors=True)
+    os.makedirs(target)
+
+    vector_count = 0
+    digests = []
+    with open(os.path.join(target, "vectors.f32"), "wb") as f:
+        for block in blocks:
+            block = np.ascontiguousarray(block, dtype=np.float32)
+            block.tofile(f)
+            digests.extend(vector_digest(vector) for vector in block)
+            vector_count += len(block)
+    # Sorted digests let exact duplicates of snapshot vectors be found by binary search
+    digests = np.asarray(digests, dtype=np.uint64)
+    order = np.argsort(digests, kind="stable")
+    digests[order].tofile(os.path.join(target, "digests.u64"))
+    order.astype(np.int64).tofile(os.path.join(target, "digests.i64"))
+    if canonical is None:
+        canonical = np.arange(vector_count, dtype=np.int64)
+    canonical = np.asarray(canonical, dtype=np.int64)
+    count = len(canonical)
+    canonical.tofile(os.path.join(target, "canonical.i64"))
+
+    offsets = np.zeros(count + 1, dtype=np.uint64)
+    partitions = {}
+    with open(os.path.join(target, "rows.bin"), "wb") as f:
+        for i, row in enumerate(rows):
+            encoded = json.dumps(row, separators=(",", ":")).encode("utf-8")
+            f.write(encoded)
+            offsets[i + 1] = offsets[i] + len(encoded)
+            partitions.setdefault(row.get("PatientID", ""), []).append(i + 1)
+    offsets.tofile(os.path.join(target, "rows.idx"))
+
+    slices = {}
+    grouped = []
+    for patient_id, ids in partitions.items():
+        slices[patient_id] = [len(grouped), len(grouped) + len(ids)]
+        grouped.extend(ids)
+    np.asarray(grouped, dtype=np.int64).tofile(os.path.join(target, "partitions.i64"))
+    with open(os.path.join(target, "partitions.json"), "w") as f:
+        json.dump(slices, f)
+
+    files = ["vectors.f32", "canonical.i64", "digests.u64", "digests.i64", "rows.bin", "rows.idx", "partitions.json", "partitions.i64"]
+    lexical_total = 0
+    if lexical is not None:
+        terms, ids, tfs, lengths = lexical
+        with open(os.path.join(target, "lexical.json"), "w") as f:
+            json.dump(terms, f)
+        np.asarray(ids, dtype=np.int64).tofile(os.path.join(target, "lexical.ids"))
+        np.asarray(tfs, dtype=np.int32).tofile(os.path.join(target, "lexical.tfs"))
+        np.asarray(lengths, dtype=np.int32).tofile(os.path.join(target, "lexical.lengths"))
+        lexical_total = int(np.asarray(lengths, dtype=np.int64).sum())
+        files.extend(["lexical.json", "lexical.ids", "lexical.tfs", "lexical.lengths"])
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "generation": generation,
+        "dimension": dimension,
+        "count": count,
+        "vector_count": vector_count,
+        "lexical_total": lexical_total,
+        "files": files,
+        "created": time.time()
+    }
+    fsync_write(os.path.join(target, "manifest.json"), json.dumps(manifest, indent=4).encode("utf-8"))
+    for name in files:
+        with open(os.path.join(target, name), "rb") as f:
+            os.fsync(f.fileno())
+
+    # Start an empty append log for the new generation, then flip CURRENT
+    fsync_write(os.path.join(directory, snapshot_name(generation) + ".log"), b"")
+    current_tmp = os.path.join(directory, CURRENT_FILE + ".tmp")
+    fsync_write(current_tmp, snapshot_name(generation).encode("utf-8"))
+    os.replace(current_tmp, os.path.join(directory, CURRENT_FILE))
+
+    # The previous generation is now unreachable
+    if previous:
+        shutil.rmtree(os.path.join(directory, snapshot_name(previous)), ignore_errors=True)
+    try:
+        os.remove(os.path.join(directory, snapshot_name(previous) + ".log"))
+    except FileNotFoundError:
+        pass
+    return generation
+
+class SnapshotReader:
+    """Read-only, memory-mapped view of the live snapshot; pages are faulted in on demand."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.generation = read_current(directory)
+        self.path = os.path.join(directory, snapshot_name(self.generation))
+        with open(os.path.join(self.path, "manifest.json"), "r") as f:
+            self.manifest = json.load(f)
+        if self.manifest["format_version"] not in READABLE_VERSIONS:
+            raise ValueError(f"Unsupported snapshot format version {self.manifest['format_version']}")
+
+        self.count = self.manifest["count"]
+        self.dimension = self.manifest["dimension"]
+        vector_count = self.manifest.get("vector_count", self.count)
+        self.vectors = self.map("vectors.f32", np.float32, (vector_count, self.dimension))
+        # None when every row has its own vector (format 1, or nothing deduplicated)
+        self.canonical = self.map("canonical.i64", np.int64, (self.count,)) if vector_count != self.count else None
+        self.offsets = self.map("rows.idx", np.uint64, (self.count + 1,))
+        self.rows = self.map("rows.bin", np.uint8, None)
+        self.partition_ids = self.map("partitions.i64", np.int64, None)
+        with open(os.path.join(self.path, "partitions.json"), "r") as f:
+            self.partitions = json.load(f)
+        # Snapshots written before digests were stored only find exact duplicates among later vectors
+        self.digests = self.digest_vectors = None
+        if "digests.u64" in self.manifest["files"]:
+            self.digests = self.map("digests.u64", np.uint64, (vector_count,))
+            self.digest_vectors = self.map("digests.i64", np.int64, (vector_count,))
+        # Snapshots written without their BM25 index have it rebuilt from the rows
+        self.lexical_terms = None
+        if "lexical.json" in self.manifest["files"]:
+            with open(os.path.join(self.path, "lexical.json"), "r") as f:
+                self.lexical_terms = json.load(f)
+            self.lexical_ids = self.map("lexical.ids", np.int64, None)
+            self.lexical_tfs = self.map("lexical.tfs", np.int32, None)
+            self.lexical_lengths = self.map("lexical.lengths", np.int32, (self.count,))
+            self.lexical_total = self.manifest["lexical_total"]
+
+    def map(self, name: str, dtype, shape):
+        path = os.path.join(self.path, name)
+        # np.memmap refuses empty files
+        if os.path.getsize(path) == 0:
+            return np.zeros(shape or (0,), dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+    def __len__(self):
+        return self.count
+
+    def row(self, index: int) -> dict:
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return json.loads(self.rows[start:end].tobytes().decode("utf-8"))
+
+    def find(self, vector: np.ndarray, digest: int):
+        """Index of the snapshot vector equal to the given one, None if there is none or digests were not stored."""
+        if self.digests is None:
+            return None
+        position = int(np.searchsorted(self.digests, np.uint64(digest)))
+        while position < len(self.digests) and int(self.digests[position]) == digest:
+            index = int(self.digest_vectors[position])
+            if np.array_equal(self.vectors[index], vector):
+                return index
+            position += 1
+        return None
+
+    def partition(self, patient_id) -> np.ndarray:
+        bounds = self.partitions.get(patient_id)
+        if bounds is None:
+            return np.zeros(0, dtype=np.int64)
+        return np.asarray(self.partition_ids[bounds[0]:bounds[1]])
+
+class AppendLog:
+    """Append-only record of vectors added since the live snapshot was written."""
+
+    def __init__(self, directory: str, generation: int, dimension: int):
+        self.path = os.path.join(directory, snapshot_name(generation) + ".log")
+        self.dimension = dimension
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, "ab")
+
+    def append(self, vector, row: dict):
+        encoded = json.dumps(row, separators=(",", ":")).encode("utf-8")
+        vector = np.asarray(vector, dtype=np.float32).tobytes()
+        with self.lock:
+            self.file.write(LOG_HEADER.pack(len(encoded), self.dimension) + encoded + vector)
+            self.file.flush()
+
+    def replay(self):
+        """
+        Yield (vector, row) for each complete record in the log.
+
+        A torn record left by a crash is cut off so later appends stay readable.
+        """
+        with open(self.path, "rb") as f:
+            data = f.read()
+        position = 0
+        while position + LOG_HEADER.size <= len(data):
+            length, dimension = LOG_HEADER.unpack_from(data, position)
+            end = position + LOG_HEADER.size + length + dimension * 4
+            if end > len(data):
+                break
+            start = position + LOG_HEADER.size
+            row = json.loads(data[start:start + length].decode("utf-8"))
+            vector = np.frombuffer(data, dtype=np.float32, count=dimension, offset=start + length)
+            yield vector, row
+            position = end
+        if position < len(data):
+            with self.lock:
+                self.file.truncate(position)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,274 @@
+import threading
+from collections import defaultdict
+import numpy as np
+from utils.vector_snapshot import SnapshotReader, AppendLog, write_snapshot, read_current, vector_digest
+
+# Metadata stored next to each vector, mirroring FHIROLLAMA.Table.VectorRepository
+METADATA_FIELDS = ("BundleID", "ResourceID", "ResourceType", "PatientID")
+# Similarity from which a new vector shares a stored one instead of adding its own. None (the default)
+# shares exact duplicates (same bytes) only; merging near duplicates is lossy, they then rank with
+# the stored vector, and it costs a scan of every stored vector per insert, so it is opt-in
+DEDUP_THRESHOLD = None
+
+class VectorStore:
+    """
+    In-memory vector index with the same columns as the IRIS VectorRepository table.
+
+    Rows and vectors are kept apart: every row (one per resource, with its
+    description and metadata) points to a canonical vector, and rows whose
+    vector is an exact duplicate of a stored one share it; with a
+    dedup_threshold, near duplicates do too. Searches
+    score each canonical vector once and expand the hits to their rows.
+
+    When a snapshot directory is given, rows written by the last snapshot are
+    served from memory-mapped files and only the rows added since then (the
+    append log) are held in memory.
+    """
+
+    def __init__(self, dimension=384, capacity=1024, directory=None, dedup_threshold=DEDUP_THRESHOLD):
+        self.dimension = dimension
+        self.capacity = capacity
+        self.directory = directory
+        self.dedup_threshold = dedup_threshold
+        self.lock = threading.RLock()
+        self.base = None
+        self.log = None
+        self.reset()
+        if directory is not None:
+            self.open(directory)
+
+    def reset(self, base=None):
+        self.base = base
+        self.base_count = len(base) if base is not None else 0
+        self.base_vector_count = len(base.vectors) if base is not None else 0
+        # Canonical vectors added since the snapshot, their indexes follow the base ones
+        self.vectors = np.zeros((self.capacity, self.dimension), dtype=np.float32)
+        self.vector_count = 0
+        # Canonical vector index of each row added since the snapshot
+        self.row_vectors = np.zeros(self.capacity, dtype=np.int64)
+        # Rows added since the snapshot, by canonical vector index
+        self.vector_rows = defaultdict(list)
+        # vector_digest() -> index of the vectors added since the snapshot, the snapshot has its own sorted digests
+        self.hashes = {}
+        self.descriptions = []
+        self.metadata = []
+        self.partitions = defaultdict(list)
+        self.duplicates = {"exact": 0, "near": 0}
+        # Base rows grouped by canonical vector, None when every base row has its own vector
+        self.base_order = None
+        self.base_starts = None
+        if base is not None and base.canonical is not None:
+            self.base_order = np.argsort(base.canonical, kind="stable")
+            self.base_starts = np.searchsorted(base.canonical[self.base_order], np.arange(self.base_vector_count + 1))
+
+    def open(self, directory: str):
+        generation = read_current(directory)
+        base = SnapshotReader(directory) if generation else None
+        if base is not None and base.dimension != self.dimension:
+            raise ValueError(f"Snapshot has {base.dimension} dimensions, expected {self.dimension}")
+        self.reset(base)
+        self.log = AppendLog(directory, generation, self.dimension)
+        for vector, row in self.log.replay():
+            self.append(vector, row.pop("Description"), row)
+
+    def __len__(self):
+        return self.base_count + len(self.descriptions)
+
+    def add(self, vector, description: str, metadata: dict = None) -> int:
+        """
+        Append a row to the index, sharing the vector of a duplicate when there is one.
+
+        :param vector: The normalized embedding (list or NumPy array)
+        :param description: The text the vector was computed from
+        :param metadata: Optional BundleID/ResourceID/ResourceType/PatientID values
+        :return: The ID of the new row (IDs start at 1 like IRIS row IDs)
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.shape != (self.dimension,):
+            raise ValueError(f"Expected a vector of {self.dimension} dimensions, got {vector.shape}")
+        metadata = {field: (metadata or {}).get(field, "") for field in METADATA_FIELDS}
+
+        with self.lock:
+            # The log keeps the row's own vector, replaying it repeats the same dedup decisions
+            if self.log is not None:
+                self.log.append(vector, {"Description": description, **metadata})
+            return self.append(vector, description, metadata)
+
+    def canonical(self, vector: np.ndarray) -> int:
+        """
+        Index of the stored vector a new one duplicates, or of the new vector once stored.
+
+        Exact duplicates are found by digest. With a dedup_threshold, near
+        duplicates are found by the best dot product over every canonical
+        vector, at least the threshold.
+        """
+        digest = vector_digest(vector)
+        index = self.hashes.get(digest)
+        if index is not None and np.array_equal(self.vectors[index - self.base_vector_count], vector):
+            self.duplicates["exact"] += 1
+            return index
+        index = self.base.find(vector, digest) if self.base is not None else None
+        if index is not None:
+            self.duplicates["exact"] += 1
+            return index
+        if self.dedup_threshold is not None and self.base_vector_count + self.vector_count:
+            scores = self.scores(vector)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.dedup_threshold:
+                self.duplicates["near"] += 1
+                return best
+
+        if self.vector_count == len(self.vectors):
+            self.vectors = np.concatenate([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[self.vector_count] = vector
+        index = self.base_vector_count + self.vector_count
+        self.vector_count += 1
+        self.hashes[digest] = index
+        return index
+
+    def append(self, vector, description: str, metadata: dict) -> int:
+        with self.lock:
+            row = len(self.descriptions)
+            id = self.base_count + row + 1
+            index = self.canonical(np.asarray(vector, dtype=np.float32))
+            if row == len(self.row_vectors):
+                self.row_vectors = np.concatenate([self.row_vectors, np.zeros_like(self.row_vectors)])
+            self.row_vectors[row] = index
+            self.vector_rows[index].append(id)
+            self.descriptions.append(description)
+            self.metadata.append({field: metadata.get(field, "") for field in METADATA_FIELDS})
+            self.partitions[self.metadata[row]["PatientID"]].append(id)
+            return id
+
+    def partition(self, patient_id) -> list:
+        """Return the IDs of every row belonging to the given patient."""
+        with self.lock:
+            ids = list(self.partitions.get(patient_id, ()))
+            if self.base is not None:
+                ids = self.base.partition(patient_id).tolist() + ids
+            return ids
+
+    def get(self, id: int) -> dict:
+        with self.lock:
+            if id <= self.base_count:
+                row = self.base.row(id - 1)
+                return {"ID": id, "Description": row.pop("Description"), **row}
+            row = id - self.base_count - 1
+            return {"ID": id, "Description": self.descriptions[row], **self.metadata[row]}
+
+    def vector_indexes(self, ids: np.ndarray) -> np.ndarray:
+        """Canonical vector index of each row ID, with the lock held."""
+        ids = np.asarray(ids, dtype=np.int64)
+        indexes = np.empty(len(ids), dtype=np.int64)
+        in_base = ids <= self.base_count
+        base_rows = ids[in_base] - 1
+        indexes[in_base] = self.base.canonical[base_rows] if self.base is not None and self.base.canonical is not None else base_rows
+        indexes[~in_base] = self.row_vectors[ids[~in_base] - self.base_count - 1]
+        return indexes
+
+    def gather(self, indexes: np.ndarray) -> np.ndarray:
+        """The canonical vectors at the given indexes, with the lock held."""
+        vectors = np.empty((len(indexes), self.dimension), dtype=np.float32)
+        in_base = indexes < self.base_vector_count
+        if in_base.any():
+            vectors[in_base] = self.base.vectors[indexes[in_base]]
+        vectors[~in_base] = self.vectors[indexes[~in_base] - self.base_vector_count]
+        return vectors
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Dot product of the query with every canonical vector, with the lock held."""
+        scores = self.vectors[:self.vector_count] @ query
+        if self.base is not None:
+            scores = np.concatenate([self.base.vectors @ query, scores])
+        return scores
+
+    def rows_of(self, index: int) -> list:
+        """IDs of the rows sharing a canonical vector, with the lock held."""
+        ids = []
+        if index < self.base_vector_count:
+            if self.base_order is None:
+                ids.append(index + 1)
+            else:
+                ids.extend((self.base_order[self.base_starts[index]:self.base_starts[index + 1]] + 1).tolist())
+        ids.extend(self.vector_rows.get(index, ()))
+        return ids
+
+    def vector(self, id: int) -> np.ndarray:
+        with self.lock:
+            return self.gather(self.vector_indexes([id]))[0]
+
+    def search(self, vector, k=5, patient_id=None) -> list:
+        """
+        Rank stored rows by dot product of their vector with the query vector.
+
+        :param vector: The normalized query embedding
+        :param k: Number of results to return
+        :param patient_id: Optional PatientID to restrict the search to
+        :return: A list of (ID, similarity) tuples sorted by similarity
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        with self.lock:
+            if patient_id is None:
+                # Every canonical vector has at least one row, the k best vectors cover the k best rows
+                scores = self.scores(query)
+                top_vectors = min(k, len(scores))
+                if top_vectors <= 0:
+                    return []
+                top = np.argpartition(-scores, top_vectors - 1)[:top_vectors]
+                top = top[np.argsort(-scores[top])]
+                results = []
+                for index in top:
+                    for id in self.rows_of(int(index)):
+                        results.append((id, float(scores[index])))
+                    if len(results) >= k:
+                        break
+                return results[:k]
+
+            ids = np.array(self.partition(patient_id), dtype=np.int64)
+            if not len(ids):
+                return []
+            unique, inverse = np.unique(self.vector_indexes(ids), return_inverse=True)
+            scores = (self.gather(unique) @ query)[inverse]
+
+        k = min(k, len(ids))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def get_metrics(self) -> dict:
+        with self.lock:
+            rows = len(self)
+            vectors = self.base_vector_count + self.vector_count
+            return {
+                "rows": rows,
+                "vectors": vectors,
+                # Share of the rows that did not need a vector of their own
+                "dedup_ratio": 1 - vectors / rows if rows else 0.0,
+                "exact_duplicates": self.duplicates["exact"],
+                "near_duplicates": self.duplicates["near"],
+                "dedup_threshold": self.dedup_threshold
+            }
+
+    def snapshot(self, lexical=None) -> int:
+        """
+        Write every row into a new snapshot, then reopen from it with an empty append log.
+
+        :param lexical: Optional BM25 index of the rows to store with the snapshot, see LexicalIndex.export()
+        :return: The generation of the new snapshot
+        """
+        if self.directory is None:
+            raise ValueError("The vector store was not opened on a snapshot directory")
+        with self.lock:
+            tail = len(self.descriptions)
+            blocks = [self.vectors[:self.vector_count]]
+            if self.base is not None:
+                blocks.insert(0, self.base.vectors)
+            canonical = np.concatenate([self.vector_indexes(np.arange(1, self.base_count + 1)), self.row_vectors[:tail]])
+            rows = (self.get(id) for id in range(1, self.base_count + tail + 1))
+            rows = ({key: value for key, value in row.items() if key != "ID"} for row in rows)
+            generation = write_snapshot(self.directory, blocks, self.dimension, rows, lexical, canonical)
+            self.log.close()
+            self.open(self.directory)
+            return generation